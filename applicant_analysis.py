@@ -1,21 +1,37 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# Load the modeling view
-model = pd.read_csv('modeling_view_with_risk.csv')
+import storage
+
+profile_cols = ['Applicant_ID','Application_ID','Full_Name','Age','Gender','Education_Level','Employment_Status',
+                'Net_Monthly_Income','Total_Monthly_Obligations','DTI','LTV','Utilization_Bucket','Late_Pay_Bucket',
+                'Income_Stability','Tenure_Bucket','Avg_Balance_Bucket','PD_hat','Grade','Risk_Profile']
+points_cols = ['Points_DTI','Points_Utilization','Points_LatePay','Points_Inquiry','Points_IncomeStability','Points_LTV','Points_Tenure']
+
+# The modeling view (only the columns the profile shows), read on first use so importing the column
+# lists stays cheap; a feature store is queried per applicant instead
+source = storage.view_path()
+model = None
+
+def applicant_rows(applicant_id):
+    global model
+    if source.endswith('.sqlite'):
+        from feature_store import FeatureStore
+        with FeatureStore(source) as store:
+            return store.get(applicant_ids=[applicant_id], columns=profile_cols + points_cols)
+    if model is None:
+        model = storage.read_view(columns=profile_cols + points_cols)
+    return model[model['Applicant_ID'] == applicant_id]
 
 # Function to show applicant profile and visualize
 def show_applicant_profile(applicant_id):
-    row = model[model['Applicant_ID'] == applicant_id]
+    row = applicant_rows(applicant_id)
     if row.empty:
         print(f"Applicant_ID {applicant_id} not found.")
         return
     # Print profile summary
     print("\n--- Applicant Profile ---")
-    print(row[['Applicant_ID','Application_ID','Full_Name','Age','Gender','Education_Level','Employment_Status',
-              'Net_Monthly_Income','Total_Monthly_Obligations','DTI','LTV','Utilization_Bucket','Late_Pay_Bucket',
-              'Income_Stability','Tenure_Bucket','Avg_Balance_Bucket','PD_hat','Grade','Risk_Profile']].to_string(index=False))
+    print(row[profile_cols].to_string(index=False))
     # Visualize risk score and grade
     fig, ax = plt.subplots(1,2, figsize=(10,4))
     # Risk score bar
@@ -29,7 +45,6 @@ def show_applicant_profile(applicant_id):
     plt.tight_layout()
     plt.show()
     # Feature importance (points breakdown)
-    points_cols = ['Points_DTI','Points_Utilization','Points_LatePay','Points_Inquiry','Points_IncomeStability','Points_LTV','Points_Tenure']
     points = row[points_cols].iloc[0]
     plt.figure(figsize=(8,4))
     sns.barplot(x=points.index, y=points.values, palette='viridis')
@@ -0,0 +1,76 @@
+"""
+Payload size and build time of the dashboard charts, row-level against reduced rendering (chart_data.py).
+
+For each portfolio size, each chart builder in interactive_dashboard_guide.py is run twice:
+    rows      every customer as a mark (max_points above the portfolio size)
+    reduced   density grid / binned histogram plus a stratified sample that keeps the high-risk tail
+and the serialized chart is measured: Plotly figure JSON, the Altair spec plus any data files the
+json data transformer writes, and the Bokeh document JSON. Time covers building and serializing,
+the server-side part of rendering. Row-level rendering is skipped above --rows-limit.
+
+Usage:
+    python benchmark_chart_payload.py [--sizes 1000 100000 1000000] [--rows-limit 100000]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import chart_data
+import interactive_dashboard_guide as guide
+
+
+def serialized_size(chart):
+    """Bytes sent for a built chart; Altair's json transformer writes the rows to files in the working directory."""
+    if hasattr(chart, 'to_plotly_json'):
+        return len(chart.to_json())
+    if hasattr(chart, 'to_dict'):
+        size = len(chart.to_json())
+        return size + sum(os.path.getsize(f) for f in os.listdir('.') if f.startswith('altair-data-'))
+    from bokeh.embed import json_item
+    return len(json.dumps(json_item(chart)))
+
+
+def measure(builder, df, max_points):
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            start = time.perf_counter()
+            size = serialized_size(builder(df, max_points=max_points))
+            return size, time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+
+def tail_kept(df):
+    """Share of the highest-risk customers (half the point budget) the Plotly sample keeps as individual points."""
+    sample = chart_data.sample_points(df, tail_column='risk_score', strata='risk_category')
+    top = df.nlargest(chart_data.MAX_POINTS // 2, 'risk_score')
+    return top.index.isin(sample.index).mean()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--rows-limit', type=int, default=100_000, help='largest size rendered row by row')
+    args = parser.parse_args()
+
+    builders = {
+        'plotly scatter': guide.create_risk_distribution_chart,
+        'altair stats': guide.create_statistical_analysis_chart,
+        'bokeh monitor': guide.realtime_risk_monitor,
+    }
+    print(f"{'customers':>10}  {'chart':<16}{'rows KB':>10}{'rows s':>8}{'reduced KB':>12}{'reduced s':>10}")
+    for n in args.sizes:
+        df = guide.create_sample_credit_data(n)
+        for name, builder in builders.items():
+            rows = measure(builder, df, n) if n <= args.rows_limit else (np.nan, np.nan)
+            reduced = measure(builder, df, chart_data.MAX_POINTS) if n > chart_data.MAX_POINTS else rows
+            print(f"{n:>10,}  {name:<16}{rows[0] / 1024:>10,.0f}{rows[1]:>8.2f}{reduced[0] / 1024:>12,.0f}{reduced[1]:>10.2f}")
+        if n > chart_data.MAX_POINTS:
+            print(f"{'':>12}top {chart_data.MAX_POINTS // 2:,} risk scores kept as points: {tail_kept(df):.0%}")
@@ -0,0 +1,84 @@
+"""
+Benchmark the indexed single-pass join (build_modeling_view.merge_sources) against the original
+nine chained pandas merges.
+
+Source sheets come from --source-dir, or are generated for --applicants applicants with
+make_synthetic_data.py in a temporary directory. Each approach runs in a fresh process that loads the
+sheets, then joins them. The process reports join time, peak RSS before and after the join, and a
+hash of the joined frame's rows in order, with its columns and dtypes, so the outputs are checked identical without
+holding both in one process.
+
+Usage:
+    python benchmark_merge.py --applicants 1000000
+    python benchmark_merge.py --source-dir excel_sheets_csv
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import build_modeling_view as bmv
+
+RUNNER = r'''
+import hashlib, json, resource, sys, time
+sys.path.insert(0, {repo!r})
+import pandas as pd
+import build_modeling_view as bmv
+import benchmark_merge
+df = bmv.load_sources({base!r})
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+join = benchmark_merge.merge_sources_chained if {approach!r} == 'chained' else bmv.merge_sources
+start = time.perf_counter()
+model = join(df)
+secs = time.perf_counter() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({{
+    'secs': secs, 'rss_before_mb': before, 'peak_rss_mb': after, 'rows': len(model),
+    # the per-row hashes in row order, so a reordered join does not hash the same
+    'hash': hashlib.sha256(pd.util.hash_pandas_object(model, index=False).to_numpy().tobytes()).hexdigest(),
+    'columns': list(model.columns), 'dtypes': [str(d) for d in model.dtypes],
+}}))
+'''
+
+
+def merge_sources_chained(df):
+    # Original join: nine sequential left merges, each copying the growing frame
+    model = df['loan']
+    for name, keys in bmv.joins:
+        model = model.merge(df[name], on=keys, how='left')
+    return model
+
+
+def measure(base, approach):
+    code = RUNNER.format(repo=os.path.dirname(os.path.abspath(__file__)), base=base, approach=approach)
+    out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source-dir', help='directory with the ten source sheets')
+    parser.add_argument('--applicants', type=int, default=1_000_000, help='synthetic size when no --source-dir')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        base = args.source_dir
+        if base is None:
+            from make_synthetic_data import generate
+            base = os.path.join(workdir, 'sheets')
+            generate(args.applicants, base)
+        results = {approach: measure(base, approach) for approach in ['chained', 'indexed']}
+
+    chained, indexed = results['chained'], results['indexed']
+    print(f"{chained['rows']:,} loan rows, {len(chained['columns'])} columns")
+    for approach, r in results.items():
+        print(f"{approach:<8} join {r['secs']:7.2f}s | peak RSS {r['peak_rss_mb']:8.1f} MB "
+              f"(+{r['peak_rss_mb'] - r['rss_before_mb']:.1f} MB over the loaded sheets)")
+    print(f"speedup {chained['secs'] / indexed['secs']:.1f}x")
+    same = all(chained[k] == indexed[k] for k in ('rows', 'hash', 'columns', 'dtypes'))
+    print('outputs identical' if same else 'OUTPUTS DIFFER')
+    if not same:
+        sys.exit(1)
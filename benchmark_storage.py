@@ -0,0 +1,93 @@
+"""
+Benchmark load time and peak RSS of the modeling view stored as CSV vs Parquet (storage.py).
+
+The committed modeling view is replicated to --rows rows in a temporary directory and written in
+both formats. Generation and every read run in fresh subprocesses (Linux carries peak RSS across
+fork/exec, so the parent must stay small); the 'baseline' row is the RSS of a subprocess that only
+imports pandas and pyarrow.
+
+Usage:
+    python benchmark_storage.py --rows 1000000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+import storage
+from train_credit_risk_model import features
+
+READER = r'''
+import json, resource, sys, time
+sys.path.insert(0, {repo!r})
+import pandas, pyarrow
+import storage
+from train_credit_risk_model import features
+columns = {columns!r}
+start = time.perf_counter()
+if {read!r}:
+    frame = storage.read_table({path!r}, columns=columns, memory_map={memory_map!r})
+    rows = len(frame)
+else:
+    rows = 0
+secs = time.perf_counter() - start
+print(json.dumps({{'secs': secs, 'rows': rows, 'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+'''
+
+
+def measure(path, columns=None, memory_map=False, read=True):
+    code = READER.format(repo=os.path.dirname(os.path.abspath(__file__)), path=path, columns=columns,
+                         memory_map=memory_map, read=read)
+    out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def view_paths(workdir):
+    name = os.path.basename(storage.VIEW_PATH)
+    return os.path.join(workdir, 'csv', name), os.path.join(workdir, 'parquet', name)
+
+
+def make_view(rows, workdir):
+    view = pd.read_csv(storage.VIEW_PATH + '.csv')
+    reps = -(-rows // len(view))
+    big = pd.concat([view] * reps, ignore_index=True).iloc[:rows]
+    big['Application_ID'] = big.index + 1
+    big['Applicant_ID'] = big.index + 1
+    csv_path, parquet_path = view_paths(workdir)
+    os.makedirs(os.path.dirname(csv_path))
+    os.makedirs(os.path.dirname(parquet_path))
+    big.to_csv(csv_path + '.csv', index=False)
+    storage.write_table(big, parquet_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--make', metavar='WORKDIR', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.make:
+        make_view(args.rows, args.make)
+        sys.exit()
+
+    trainer_cols = features + ['Default_12m']
+    with tempfile.TemporaryDirectory() as workdir:
+        subprocess.run([sys.executable, __file__, '--rows', str(args.rows), '--make', workdir], check=True)
+        csv_path, parquet_path = view_paths(workdir)
+        sizes = {fmt: os.path.getsize(p + '.' + fmt) / 2**20 for fmt, p in [('csv', csv_path), ('parquet', parquet_path)]}
+        print(f"{args.rows:,} rows | csv {sizes['csv']:.1f} MB | parquet {sizes['parquet']:.1f} MB")
+        cases = [
+            ('baseline (imports only)', csv_path, None, False, False),
+            ('csv, all columns', csv_path, None, False, True),
+            ('parquet, all columns', parquet_path, None, False, True),
+            ('parquet, all columns, memory-mapped', parquet_path, None, True, True),
+            ('csv, trainer columns', csv_path, trainer_cols, False, True),
+            ('parquet, trainer columns', parquet_path, trainer_cols, False, True),
+        ]
+        for label, path, columns, memory_map, read in cases:
+            result = measure(path, columns, memory_map, read)
+            print(f"{label:<38} load {result['secs']:7.2f}s | peak RSS {result['max_rss_mb']:8.1f} MB")
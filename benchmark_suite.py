@@ -0,0 +1,169 @@
+"""
+End-to-end benchmark suite on synthetic data (make_synthetic_data.py).
+
+Generates the ten source sheets for --applicants applicants in a work directory, then runs each
+pipeline step there as its own process with instrumentation on (see instrumentation.py), so every
+step gets a clean peak RSS:
+    generate    synthetic source sheets
+    build       build_modeling_view.py: sheet reads (ingestion), merges, features, fill, scorecard, write
+    stream      build_modeling_view.py --chunksize: the out-of-core build
+    train       train_credit_risk_model.py: load, split, fit, predict, dump
+    score       score_credit_risk_model.py: batch prediction over the whole view
+    dashboard   dashboard_data: view load and index, then 1,000 applicant lookups
+
+Results (wall, CPU, peak RSS and rows per stage) are written as JSON with --save. --compare BASELINE
+prints each stage against a saved run, and exits 1 when a stage's wall time or a step's peak RSS grew
+by more than --threshold (stages under --min-secs in the baseline are too noisy to judge).
+
+Usage:
+    python benchmark_suite.py --applicants 1000000 --save bench_1m.json
+    python benchmark_suite.py --applicants 1000000 --compare bench_1m.json [--skip train]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+STEPS = ['generate', 'build', 'stream', 'train', 'score', 'dashboard']
+
+
+def step_commands(args):
+    script = lambda name: os.path.join(REPO, name)
+    return {
+        'generate': [script('make_synthetic_data.py'), '--applicants', str(args.applicants),
+                     '--output-dir', 'excel_sheets_csv', '--format', args.source_format, '--seed', str(args.seed)],
+        'build': [script('build_modeling_view.py'), '--format', args.view_format],
+        'stream': [script('build_modeling_view.py'), '--format', args.view_format, '--chunksize', str(args.chunksize)],
+        'train': [script('train_credit_risk_model.py')],
+        'score': [script('score_credit_risk_model.py'), '--output', 'benchmark_predictions']
+                 + ([] if args.workers is None else ['--workers', str(args.workers)]),
+        'dashboard': [os.path.abspath(__file__), '--dashboard-probe'],
+    }
+
+
+def run_step(name, command, workdir):
+    report = os.path.join(workdir, f'profile_{name}.json')
+    env = dict(os.environ, PIPELINE_PROFILE=report)
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + command, cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+    wall = time.perf_counter() - start
+    if os.path.exists(report):
+        with open(report) as f:
+            profile = json.load(f)
+    else:
+        # steps without instrumented stages still get their process wall time
+        profile = {'total_wall_s': wall, 'peak_rss_mb': None, 'stages': []}
+    return {
+        'wall_s': round(wall, 6), 'peak_rss_mb': profile['peak_rss_mb'],
+        'stages': {s['stage']: {k: s[k] for k in ('wall_s', 'cpu_s', 'peak_rss_mb', 'rows')} for s in profile['stages']},
+    }
+
+
+def dashboard_probe():
+    """Runs inside the work directory: time the dashboard data layer's load and lookups."""
+    import numpy as np
+    import instrumentation
+    from dashboard_data import ViewCache
+    instrumentation.enable()
+    cache = ViewCache()
+    with instrumentation.stage('load') as st:
+        view = cache.get()
+        st.rows = len(view.frame)
+    ids = np.random.default_rng(0).choice(view.ids, 1000)
+    with instrumentation.stage('lookups', rows=len(ids)):
+        for applicant_id in ids:
+            cache.get()
+            view.row(applicant_id)
+            view.search(str(applicant_id)[:3], 500)
+
+
+def compare(current, baseline, threshold, min_secs):
+    """Print stage-by-stage ratios; returns the list of regressions."""
+    if current['meta']['applicants'] != baseline['meta']['applicants']:
+        print(f"Warning: baseline has {baseline['meta']['applicants']:,} applicants, "
+              f"this run {current['meta']['applicants']:,}")
+    regressions = []
+    print(f"{'step/stage':<48}{'baseline s':>12}{'current s':>12}{'ratio':>8}")
+    for step, result in current['results'].items():
+        base = baseline['results'].get(step)
+        if base is None:
+            continue
+        rows = [(step, base['wall_s'], result['wall_s'])]
+        rows += [(f'{step}:{stage}', base['stages'][stage]['wall_s'], values['wall_s'])
+                 for stage, values in result['stages'].items() if stage in base['stages']]
+        for label, before, after in rows:
+            ratio = after / before if before else float('nan')
+            flag = ''
+            if before >= min_secs and ratio > 1 + threshold:
+                flag = '  REGRESSION'
+                regressions.append(label)
+            print(f'{label:<48}{before:>12.3f}{after:>12.3f}{ratio:>8.2f}{flag}')
+        if base['peak_rss_mb'] and result['peak_rss_mb']:
+            ratio = result['peak_rss_mb'] / base['peak_rss_mb']
+            flag = '  REGRESSION' if ratio > 1 + threshold else ''
+            if flag:
+                regressions.append(f'{step} peak RSS')
+            print(f"{step + ' peak RSS (MB)':<48}{base['peak_rss_mb']:>12.1f}{result['peak_rss_mb']:>12.1f}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--applicants', type=int, default=10_000)
+    parser.add_argument('--source-format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--view-format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--chunksize', type=int, default=100_000, help='chunk size of the streaming build')
+    parser.add_argument('--workers', type=int, default=None, help='batch scoring processes')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip', nargs='*', default=[], choices=STEPS)
+    parser.add_argument('--workdir', help='keep data and outputs here instead of a temporary directory')
+    parser.add_argument('--save', metavar='RESULTS', help='write this run\'s results as JSON')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare against saved results')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative slowdown (0.2 = 20%%)')
+    parser.add_argument('--min-secs', type=float, default=0.25, help='ignore stages faster than this in the baseline')
+    parser.add_argument('--dashboard-probe', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.dashboard_probe:
+        dashboard_probe()
+        sys.exit()
+
+    current = {
+        'meta': {
+            'applicants': args.applicants, 'source_format': args.source_format, 'view_format': args.view_format,
+            'started': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'host': platform.node(), 'cpus': os.cpu_count(),
+        },
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        for name, command in step_commands(args).items():
+            if name in args.skip:
+                continue
+            result = run_step(name, command, workdir)
+            current['results'][name] = result
+            peak = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] else 'n/a'
+            print(f"{name:<10} {result['wall_s']:9.2f}s  peak RSS {peak}")
+            for stage, values in result['stages'].items():
+                if '/' not in stage:
+                    print(f"    {stage:<28} {values['wall_s']:9.3f}s")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f'Results saved to {args.save}')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold, args.min_secs)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,110 @@
+"""
+Memory report for the compact in-memory modeling view (storage.compact_view).
+
+Loads a modeling view as stored (pandas' default dtypes), compacts it, and prints the deep memory
+before and after by column kind, the columns that shrank most, and the time the compaction took.
+Every compacted column is checked to map back to the stored values exactly (storage.stored_frame).
+
+The view is --view, or is built with build_modeling_view.py from --source-dir, or from synthetic sheets
+for --applicants applicants (make_synthetic_data.py) in a temporary directory.
+
+Usage:
+    python benchmark_view_memory.py --applicants 1000000
+    python benchmark_view_memory.py --view modeling_view_with_risk.csv
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+
+def build(source_dir, workdir):
+    os.symlink(os.path.abspath(source_dir), os.path.join(workdir, 'excel_sheets_csv'))
+    subprocess.run([sys.executable, os.path.join(REPO, 'build_modeling_view.py')], cwd=workdir, check=True,
+                   stdout=subprocess.DEVNULL)
+    return os.path.join(workdir, storage.VIEW_PATH + '.csv')
+
+
+def column_kind(dtype):
+    if isinstance(dtype, pd.CategoricalDtype):
+        return 'category'
+    return str(dtype)
+
+
+def same_values(stored, original):
+    if pd.api.types.is_numeric_dtype(stored) and pd.api.types.is_numeric_dtype(original) \
+            and not pd.api.types.is_bool_dtype(original):
+        return np.array_equal(stored.to_numpy(dtype='float64'), original.to_numpy(dtype='float64'), equal_nan=True)
+    return stored.astype(str).equals(original.astype(str))
+
+
+def report(path):
+    schema = storage.view_schema()
+    start = time.perf_counter()
+    raw = storage.read_view(path=path, compact=False).drop(columns='Risk_Profile')
+    read_secs = time.perf_counter() - start
+    before = raw.memory_usage(deep=True, index=False)
+    start = time.perf_counter()
+    compact = storage.compact_view(raw, schema)
+    compact_secs = time.perf_counter() - start
+    after = compact.memory_usage(deep=True, index=False)
+
+    stored = storage.stored_frame(compact, schema)
+    lossy = [col for col in raw.columns if not same_values(stored[col], raw[col])]
+
+    table = pd.DataFrame({
+        'before': raw.dtypes.map(column_kind), 'after': compact.dtypes.map(column_kind),
+        'before_mb': before / 2**20, 'after_mb': after / 2**20,
+    })
+    rows = len(raw)
+    print(f'{rows:,} rows, {len(raw.columns)} stored columns (read {read_secs:.1f}s, compact {compact_secs:.1f}s)')
+    print(f"\n{'dtype change':<32}{'columns':>8}{'before MB':>12}{'after MB':>12}")
+    groups = table.groupby(['before', 'after'])[['before_mb', 'after_mb']].agg(['count', 'sum'])
+    for (old, new), values in groups.sort_values(('before_mb', 'sum'), ascending=False).iterrows():
+        print(f"{old + ' -> ' + new:<32}{values[('before_mb', 'count')]:>8.0f}"
+              f"{values[('before_mb', 'sum')]:>12.1f}{values[('after_mb', 'sum')]:>12.1f}")
+    print(f"\n{'largest savings':<32}{'':>8}{'before MB':>12}{'after MB':>12}")
+    saved = (table['before_mb'] - table['after_mb']).sort_values(ascending=False)
+    for col in saved.index[:10]:
+        print(f"{col:<32}{'':>8}{table.at[col, 'before_mb']:>12.1f}{table.at[col, 'after_mb']:>12.1f}")
+    total_before, total_after = before.sum(), after.sum()
+    print(f"\n{'total':<40}{total_before / 2**20:>12.1f}{total_after / 2**20:>12.1f}"
+          f"  ({total_before / total_after:.1f}x smaller, {total_before / rows:.0f} -> {total_after / rows:.0f} bytes/row)")
+    # Risk_Profile is no longer stored: a string per row before, a small Categorical derived on read now
+    profile_text = raw['Grade'].astype(str) + ' | PD_hat: ' + raw['PD_hat'].round(3).astype(str)
+    profile = storage.scorecard.risk_profile(raw['Grade'], raw['PD_hat'])
+    print(f"Risk_Profile: {profile_text.memory_usage(deep=True, index=False) / 2**20:.1f} MB as text, "
+          f"{pd.Series(profile).memory_usage(deep=True, index=False) / 2**20:.1f} MB derived as a Categorical")
+    print('all columns map back to the stored values exactly' if not lossy else f"LOSSY COLUMNS: {', '.join(lossy)}")
+    return not lossy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--view', help='modeling view file to report on')
+    parser.add_argument('--source-dir', help='build the view from the ten source sheets in this directory')
+    parser.add_argument('--applicants', type=int, default=1_000_000, help='synthetic size when no --view or --source-dir')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = args.view
+        if path is None:
+            source_dir = args.source_dir
+            if source_dir is None:
+                from make_synthetic_data import generate
+                source_dir = os.path.join(workdir, 'sheets')
+                generate(args.applicants, source_dir)
+            path = build(source_dir, workdir)
+        ok = report(path)
+    if not ok:
+        sys.exit(1)
@@ -1,7 +1,13 @@
+import argparse
+import json
 import pandas as pd
 import numpy as np
 import os
 
+import instrumentation
+import scorecard
+import storage
+
 # Load all CSVs
 base = 'excel_sheets_csv'
 files = {
@@ -16,169 +22,261 @@ files = {
     'regulatory': 'Regulatory_Compliance.csv',
     'risk': 'Risk_Assessment_Scores.csv',
 }
+output_path = 'modeling_view_with_risk.csv'
+# Medians used to fill missing numerics, saved so the scoring service fills single applications the same way
+fill_values_path = 'modeling_view_fill_values.json'
 
-df = {}
-for k, v in files.items():
-    df[k] = pd.read_csv(os.path.join(base, v))
-
-# Merge all sheets into one modeling view
-model = df['loan']
-model = model.merge(df['demographics'], on='Applicant_ID', how='left')
-model = model.merge(df['employment'], on='Applicant_ID', how='left')
-model = model.merge(df['obligations'], on='Applicant_ID', how='left')
-model = model.merge(df['bureau'], on='Applicant_ID', how='left')
-model = model.merge(df['collateral'], on='Application_ID', how='left')
-model = model.merge(df['banking'], on='Applicant_ID', how='left')
-model = model.merge(df['external'], on='Applicant_ID', how='left')
-model = model.merge(df['regulatory'], on='Application_ID', how='left')
-model = model.merge(df['risk'], on=['Application_ID','Applicant_ID'], how='left')
-
-# PHASE 1: Create Default_12m (synthetic, using Probability_of_Default)
-np.random.seed(42)
-model['Default_12m'] = (np.random.rand(len(model)) < model['Probability_of_Default']).astype(int)
-
-# PHASE 1: Time-based split
-model['Period'] = np.where(
-    pd.to_datetime(model['Application_Date']) <= pd.Timestamp('2023-06-30'), 'Train',
-    np.where(pd.to_datetime(model['Application_Date']) <= pd.Timestamp('2023-12-31'), 'Validation', 'OOT')
-)
-
-# PHASE 2: Remove leakage columns
 leakage_cols = [
     'Final_Decision','Internal_Risk_Score','Probability_of_Default','Loss_Given_Default',
     'Exposure_at_Default','Expected_Loss','Manual_Override_Flag','Decision_Date'
 ]
-model = model.drop(columns=[c for c in leakage_cols if c in model.columns])
-
-# PHASE 3: Feature engineering
-# DTI
-model['DTI'] = model['Total_Monthly_Obligations'] / model['Net_Monthly_Income']
-model['DTI'] = model['DTI'].clip(upper=1.5)
-# LTV
-model['LTV'] = np.where(model['Collateral_Value']>0, model['Requested_Loan_Amount']/model['Collateral_Value'], 0)
-model['LTV'] = model['LTV'].clip(upper=1.2)
-# Utilization buckets
-def util_bucket(u):
-    if u < 0.1: return '0-10%'
-    elif u < 0.3: return '10-30%'
-    elif u < 0.5: return '30-50%'
-    elif u < 0.8: return '50-80%'
-    else: return '>80%'
-model['Utilization_Bucket'] = model['Credit_Utilization_Ratio'].apply(util_bucket)
-# Late pay bucket
-def late_bucket(x):
-    if x == 0: return '0'
-    elif x == 1: return '1'
-    elif x <= 3: return '2-3'
-    else: return '>3'
-model['Late_Pay_Bucket'] = model['Number_of_Late_Payments'].apply(late_bucket)
-# Inquiry bucket
-def inq_bucket(x):
-    if x <= 1: return '0-1'
-    elif x <= 3: return '2-3'
-    elif x <= 6: return '4-6'
-    else: return '>6'
-model['Inq_Bucket'] = model['Credit_Inquiries_Last_12_Months'].apply(inq_bucket)
-# Income stability
-model['Income_Stability'] = np.where(model['Years_in_Current_Job']>=3, 'High',
-    np.where(model['Years_in_Current_Job']>=1, 'Medium', 'Low'))
-# Geolocation risk bucket
-model['Geolocation_Risk_Bucket'] = pd.cut(model['Geolocation_Risk_Score'],
-    bins=[-np.inf,0.2,0.4,0.6,0.8,np.inf],
-    labels=['Very Low','Low','Medium','High','Very High'])
-# Tenure with bank
-model['Tenure_Months'] = ((pd.to_datetime(model['Application_Date']) - pd.to_datetime(model['Customer_Since'])).dt.days/30).clip(lower=0)
-def tenure_bucket(x):
-    if x < 6: return '<6'
-    elif x < 12: return '6-12'
-    elif x < 24: return '12-24'
-    else: return '>24'
-model['Tenure_Bucket'] = model['Tenure_Months'].apply(tenure_bucket)
-# Average balance bucket
-model['Avg_Balance_Bucket'] = pd.cut(model['Average_Monthly_Balance'],
-    bins=[-np.inf,25000,75000,np.inf],
-    labels=['Low','Medium','High'])
-
-# Fill missing values
-for col in model.select_dtypes(include='number').columns:
-    model[col] = model[col].fillna(model[col].median())
-for col in model.select_dtypes(include='object').columns:
-    model[col] = model[col].fillna('Unknown')
-
-# Save modeling view
-
-# PHASE 4: Scorecard points assignment
-base_score = 600
-def points_dti(dti):
-    if dti <= 0.25: return 0
-    elif dti <= 0.35: return 10
-    elif dti <= 0.5: return 25
-    else: return 45
-def points_util(u):
-    if u == '0-10%': return 0
-    elif u == '10-30%': return 10
-    elif u == '30-50%': return 20
-    elif u == '50-80%': return 35
-    else: return 55
-def points_late(x):
-    if x == '0': return 0
-    elif x == '1': return 15
-    elif x == '2-3': return 35
-    else: return 60
-def points_inq(x):
-    if x == '0-1': return 0
-    elif x == '2-3': return 10
-    elif x == '4-6': return 25
-    else: return 45
-def points_income(x):
-    if x == 'High': return 0
-    elif x == 'Medium': return 10
-    else: return 25
-def points_ltv(ltv):
-    if ltv <= 0.6: return 0
-    elif ltv <= 0.8: return 15
-    elif ltv <= 1.0: return 35
-    else: return 60
-def points_tenure(x):
-    if x == '>24': return 0
-    elif x == '12-24': return 10
-    elif x == '6-12': return 20
-    else: return 35
-
-model['Points_DTI'] = model['DTI'].apply(points_dti)
-model['Points_Utilization'] = model['Utilization_Bucket'].apply(points_util)
-model['Points_LatePay'] = model['Late_Pay_Bucket'].apply(points_late)
-model['Points_Inquiry'] = model['Inq_Bucket'].apply(points_inq)
-model['Points_IncomeStability'] = model['Income_Stability'].apply(points_income)
-model['Points_LTV'] = model['LTV'].apply(points_ltv)
-model['Points_Tenure'] = model['Tenure_Bucket'].apply(points_tenure)
-
-model['Total_Points'] = (
-    model['Points_DTI'] + model['Points_Utilization'] + model['Points_LatePay'] +
-    model['Points_Inquiry'] + model['Points_IncomeStability'] + model['Points_LTV'] + model['Points_Tenure']
-)
-model['Total_Score'] = base_score - model['Total_Points']
-
-# PHASE 6: Grade mapping
-def grade_map(pd):
-    if pd < 0.01: return 'Prime'
-    elif pd < 0.03: return 'Near-prime'
-    elif pd < 0.07: return 'Sub-prime'
-    else: return 'High-risk'
-# Simple calibration: map Total_Points to PD_hat
-def calibrate_pd(points):
-    # Example mapping, can be replaced with empirical calibration
-    if points <= 50: return 0.005
-    elif points <= 100: return 0.02
-    elif points <= 150: return 0.045
-    elif points <= 200: return 0.09
-    else: return 0.15
-model['PD_hat'] = model['Total_Points'].apply(calibrate_pd)
-model['Grade'] = model['PD_hat'].apply(grade_map)
-
-# Risk profile summary
-model['Risk_Profile'] = model['Grade'] + ' | PD_hat: ' + model['PD_hat'].round(3).astype(str)
-
-# Save final output
-model.to_csv('modeling_view_with_risk.csv', index=False)
-print('Final modeling view with risk profile created: modeling_view_with_risk.csv')
+
+
+def load_sources(base=base, ingestion=None):
+    # Each sheet is read from its Parquet copy when one is current, else from the CSV; with an
+    # ingestion (external_sources.py) the provider sheets are fetched for the loan book's keys instead
+    df = {}
+    for k, v in files.items():
+        if ingestion is not None and k in ingestion.providers:
+            continue
+        with instrumentation.stage(f'read:{k}') as st:
+            df[k] = storage.read_table(os.path.join(base, v))
+            st.rows = len(df[k])
+    if ingestion is not None:
+        with instrumentation.stage('ingest') as st:
+            df.update(ingestion.sources(df['loan']))
+            st.rows = ingestion.stats['requests']
+        print(f'Providers: {ingestion.summary()}')
+    return df
+
+
+# Satellite sheets joined onto the loan applications, in merge order, with their join keys
+joins = [
+    ('demographics', ['Applicant_ID']),
+    ('employment', ['Applicant_ID']),
+    ('obligations', ['Applicant_ID']),
+    ('bureau', ['Applicant_ID']),
+    ('collateral', ['Application_ID']),
+    ('banking', ['Applicant_ID']),
+    ('external', ['Applicant_ID']),
+    ('regulatory', ['Application_ID']),
+    ('risk', ['Application_ID','Applicant_ID']),
+]
+
+
+def index_satellite(frame, keys, name):
+    """Index a satellite sheet by its join keys; duplicate keys would multiply loan rows in a left join."""
+    table = frame.set_index(keys)
+    if not table.index.is_unique:
+        dupes = table.index[table.index.duplicated()].unique()
+        raise ValueError(f'{name} has {len(dupes)} duplicate {"/".join(keys)} values (e.g. {dupes[0]}); '
+                         'a left join would duplicate loan rows')
+    return table.reset_index(drop=True), table.index
+
+
+def gather(body, positions):
+    """Rows of body at positions; -1 gives an all-missing row, widening dtypes as a left merge does."""
+    if (positions >= 0).all():
+        return body.take(positions).reset_index(drop=True)
+    return body.reindex(positions).reset_index(drop=True)
+
+
+def merge_sources(df):
+    # Merge all sheets into one modeling view: each satellite is indexed once by its keys and its
+    # columns are gathered in loan order, then everything is assembled with a single concat
+    loan = df['loan'].reset_index(drop=True)
+    parts = [loan]
+    columns = list(loan.columns)
+    for name, keys in joins:
+        with instrumentation.stage(f'merge:{name}') as st:
+            body, index = index_satellite(df[name], keys, name)
+            wanted = loan[keys[0]] if len(keys) == 1 else pd.MultiIndex.from_frame(loan[keys])
+            part = gather(body, index.get_indexer(wanted))
+            # same-named columns get pandas' merge suffixes
+            for col in part.columns.intersection(columns):
+                columns[columns.index(col)] = f'{col}_x'
+                part = part.rename(columns={col: f'{col}_y'})
+            columns += list(part.columns)
+            parts.append(part)
+            st.rows = len(part)
+    model = pd.concat(parts, axis=1)
+    model.columns = columns
+    return model
+
+
+def add_target_and_period(model, rng=None, draws=None):
+    # PHASE 1: Create Default_12m (synthetic, using Probability_of_Default)
+    # A chunked build passes one generator through every chunk so the draws match a single seed(42) run;
+    # an incremental build passes the draws belonging to the rows it recomputes
+    if draws is None:
+        if rng is None:
+            rng = np.random.RandomState(42)
+        draws = rng.rand(len(model))
+    model['Default_12m'] = (draws < model['Probability_of_Default']).astype(int)
+
+    # PHASE 1: Time-based split
+    model['Period'] = np.where(
+        pd.to_datetime(model['Application_Date']) <= pd.Timestamp('2023-06-30'), 'Train',
+        np.where(pd.to_datetime(model['Application_Date']) <= pd.Timestamp('2023-12-31'), 'Validation', 'OOT')
+    )
+
+    # PHASE 2: Remove leakage columns
+    return model.drop(columns=[c for c in leakage_cols if c in model.columns])
+
+
+def engineer_features(model):
+    # PHASE 3: Feature engineering
+    # DTI
+    model['DTI'] = model['Total_Monthly_Obligations'] / model['Net_Monthly_Income']
+    model['DTI'] = model['DTI'].clip(upper=1.5)
+    # LTV
+    model['LTV'] = np.where(model['Collateral_Value']>0, model['Requested_Loan_Amount']/model['Collateral_Value'], 0)
+    model['LTV'] = model['LTV'].clip(upper=1.2)
+    # Utilization, late pay and inquiry buckets
+    model['Utilization_Bucket'] = scorecard.apply_bins(model['Credit_Utilization_Ratio'], scorecard.UTILIZATION_BINS)
+    model['Late_Pay_Bucket'] = scorecard.apply_bins(model['Number_of_Late_Payments'], scorecard.LATE_PAY_BINS)
+    model['Inq_Bucket'] = scorecard.apply_bins(model['Credit_Inquiries_Last_12_Months'], scorecard.INQUIRY_BINS)
+    # Income stability
+    model['Income_Stability'] = np.where(model['Years_in_Current_Job']>=3, 'High',
+        np.where(model['Years_in_Current_Job']>=1, 'Medium', 'Low'))
+    # Geolocation risk bucket
+    model['Geolocation_Risk_Bucket'] = pd.cut(model['Geolocation_Risk_Score'],
+        bins=[-np.inf,0.2,0.4,0.6,0.8,np.inf],
+        labels=['Very Low','Low','Medium','High','Very High'])
+    # Tenure with bank
+    model['Tenure_Months'] = ((pd.to_datetime(model['Application_Date']) - pd.to_datetime(model['Customer_Since'])).dt.days/30).clip(lower=0)
+    model['Tenure_Bucket'] = scorecard.apply_bins(model['Tenure_Months'], scorecard.TENURE_BINS)
+    # Average balance bucket
+    model['Avg_Balance_Bucket'] = pd.cut(model['Average_Monthly_Balance'],
+        bins=[-np.inf,25000,75000,np.inf],
+        labels=['Low','Medium','High'])
+    return model
+
+
+def numeric_medians(model):
+    return {col: model[col].median() for col in model.select_dtypes(include='number').columns}
+
+
+def fill_missing(model, medians=None):
+    # Fill missing values; medians can be supplied when the frame is only part of the book
+    if medians is None:
+        medians = numeric_medians(model)
+    for col in model.select_dtypes(include='number').columns:
+        model[col] = model[col].fillna(medians[col])
+    for col in model.select_dtypes(include='object').columns:
+        model[col] = model[col].fillna('Unknown')
+    return model
+
+
+def apply_scorecard(model, calibration=None):
+    # PHASE 4-6: Scorecard points, PD calibration and grade mapping (see scorecard.py)
+    return pd.concat([model, scorecard.score(model, calibration)], axis=1)
+
+
+def build_view(df, return_medians=False, calibration=None):
+    with instrumentation.stage('merge'):
+        model = merge_sources(df)
+    with instrumentation.stage('target_and_period', rows=len(model)):
+        model = add_target_and_period(model)
+    with instrumentation.stage('features', rows=len(model)):
+        model = engineer_features(model)
+    with instrumentation.stage('fill', rows=len(model)):
+        medians = numeric_medians(model)
+        model = fill_missing(model, medians)
+    with instrumentation.stage('scorecard', rows=len(model)):
+        model = apply_scorecard(model, calibration)
+    return (model, medians) if return_medians else model
+
+
+def save_fill_values(medians, path=fill_values_path):
+    # JSON has no NaN; a column with no values at all is saved as null
+    with open(path, 'w') as f:
+        json.dump({c: None if pd.isna(m) else float(m) for c, m in medians.items()}, f, indent=2)
+
+
+def load_fill_values(path=fill_values_path):
+    with open(path) as f:
+        return {c: np.nan if m is None else m for c, m in json.load(f).items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the modeling view with scorecard risk profile.')
+    parser.add_argument('--base', default=base, help='directory of the source sheets (default: %(default)s)')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='stream the loan book in chunks of this many rows (see stream_modeling_view.py)')
+    parser.add_argument('--index', choices=['memory', 'sqlite'], default='memory',
+                        help='satellite lookup index used by the streaming build')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='output format of the modeling view (see storage.py)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='recompute only applications whose source rows changed (see incremental_view.py)')
+    parser.add_argument('--verify', action='store_true',
+                        help='with --incremental, also run a full rebuild and check the results are identical')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='record per-stage time and memory to REPORT (.json or .csv, see instrumentation.py)')
+    parser.add_argument('--feature-store', metavar='PATH',
+                        help='also sync the view into this SQLite feature store (see feature_store.py)')
+    parser.add_argument('--calibration', metavar='PATH',
+                        help='PD_hat from a fitted Total_Points calibration instead of the ladder (see pd_calibration.py)')
+    parser.add_argument('--providers', metavar='URL',
+                        help='fetch the bureau, external and regulatory sheets from this provider gateway '
+                             '(see external_sources.py)')
+    args = parser.parse_args()
+    instrumentation.enable(args.profile)
+    output_file = storage.stem(output_path) + '.' + args.format
+    calibration = None
+    if args.calibration:
+        if args.incremental:
+            parser.error('--calibration is not supported with --incremental (its saved rows were scored with the ladder)')
+        from pd_calibration import PDCalibration
+        calibration = PDCalibration.load(args.calibration)
+        if calibration.score != 'Total_Points':
+            parser.error(f'{args.calibration} calibrates {calibration.score}; PD_hat needs a Total_Points calibration')
+
+    ingestion = None
+    if args.providers:
+        if args.chunksize:
+            parser.error('--providers is not supported with --chunksize (write a source directory with '
+                         'external_sources.py fetch --output-dir DIR, then build with --base DIR)')
+        from external_sources import Ingestion, TTLCache
+        ingestion = Ingestion(args.providers, cache=TTLCache())
+
+    if args.chunksize:
+        from stream_modeling_view import build_view_streaming
+        medians, exact = build_view_streaming(base=args.base, output_path=output_file, chunksize=args.chunksize,
+                                              index=args.index, fmt=args.format, calibration=calibration)
+        if not exact:
+            print('Note: some columns exceeded the exact median sketch size; median fills are approximate.')
+    elif args.incremental:
+        from incremental_view import build_view_incremental
+        with instrumentation.stage('read'):
+            df = load_sources(args.base, ingestion=ingestion)
+        with instrumentation.stage('incremental') as st:
+            model, recomputed, medians = build_view_incremental(df, verify=args.verify)
+            st.rows = recomputed
+        print(f'Recomputed {recomputed} of {len(model)} applications'
+              + (' (verified against a full rebuild)' if args.verify else ''))
+        with instrumentation.stage('compact', rows=len(model)):
+            model = storage.compact_view(model)
+        with instrumentation.stage('write', rows=len(model)):
+            storage.write_dataset(model, output_file, args.format)
+    else:
+        with instrumentation.stage('read'):
+            df = load_sources(args.base, ingestion=ingestion)
+        model, medians = build_view(df, return_medians=True, calibration=calibration)
+        del df
+        # Schema-aware dtypes: what the view's readers get from storage.read_view
+        with instrumentation.stage('compact', rows=len(model)):
+            model = storage.compact_view(model)
+        # Save final output
+        with instrumentation.stage('write', rows=len(model)):
+            storage.write_dataset(model, output_file, args.format)
+    save_fill_values(medians)
+    print(f'Final modeling view with risk profile created: {output_file}')
+    if args.feature_store:
+        from feature_store import FeatureStore
+        with instrumentation.stage('feature_store') as st, FeatureStore(args.feature_store) as store:
+            # the streaming build never holds the whole view, so its output is read back
+            written, removed = store.sync(storage.read_table(output_file) if args.chunksize else model)
+            st.rows = written
+        print(f'Feature store {args.feature_store}: {written} applications written, {removed} removed')
@@ -0,0 +1,141 @@
+"""
+Server-side reduction of large frames for the dashboard charts.
+
+Above MAX_POINTS rows the chart builders in interactive_dashboard_guide.py stop sending one mark per
+row. They send:
+    density_grid   a 2D grid of counts (and the mean of a value, e.g. risk score) per cell, drawn as a
+                   heatmap; at most bins x bins cells whatever the number of rows
+    histogram      counts per bin (and group), so distribution charts ship bin edges, not rows
+    sample_points  a stratified sample drawn over the grid, with the whole high-risk tail kept first
+                   (up to half the budget), so the rows that matter stay individually visible and hoverable
+Rows under a selected region are fetched on demand (rows_in_box) instead of being embedded for hover.
+
+Payload size and render time are bounded by MAX_POINTS and the grid size, not by the portfolio size;
+benchmark_chart_payload.py measures both.
+"""
+
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = 5000
+GRID_BINS = 80
+
+
+def bin_edges(values, bins, log=False):
+    """bins + 1 edges over the finite (and, for log, positive) values; log edges are evenly spaced in log."""
+    x = np.asarray(values, dtype='float64')
+    x = x[np.isfinite(x) & (x > 0)] if log else x[np.isfinite(x)]
+    if not len(x):
+        return np.linspace(0, 1, bins + 1)
+    lo, hi = x.min(), x.max()
+    if lo == hi:
+        lo, hi = (lo / 2, lo * 2) if log else (lo - 0.5, hi + 0.5)
+    return np.geomspace(lo, hi, bins + 1) if log else np.linspace(lo, hi, bins + 1)
+
+
+def bin_index(values, edges):
+    """0-based bin of each value (the last bin includes its right edge); -1 outside the edges or missing."""
+    x = np.asarray(values, dtype='float64')
+    index = np.searchsorted(edges, x, side='right') - 1
+    index[x == edges[-1]] = len(edges) - 2
+    index[~((x >= edges[0]) & (x <= edges[-1]))] = -1
+    return index
+
+
+class DensityGrid:
+    """Counts and the mean of an optional value per (x bin, y bin) cell; arrays are indexed [y bin, x bin]."""
+
+    def __init__(self, frame, x, y, bins=GRID_BINS, value=None, log_x=False, log_y=False):
+        self.x, self.y, self.value = x, y, value
+        self.x_edges = bin_edges(frame[x], bins, log_x)
+        self.y_edges = bin_edges(frame[y], bins, log_y)
+        ix, iy = bin_index(frame[x], self.x_edges), bin_index(frame[y], self.y_edges)
+        inside = (ix >= 0) & (iy >= 0)
+        cell = iy[inside] * bins + ix[inside]
+        self.counts = np.bincount(cell, minlength=bins * bins).reshape(bins, bins)
+        self.means = None
+        if value is not None:
+            values = np.asarray(frame[value], dtype='float64')[inside]
+            known = np.isfinite(values)
+            sums = np.bincount(cell[known], weights=values[known], minlength=bins * bins).reshape(bins, bins)
+            n = np.bincount(cell[known], minlength=bins * bins).reshape(bins, bins)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self.means = np.where(n > 0, sums / n, np.nan)
+
+    @staticmethod
+    def centers(edges, log):
+        return np.sqrt(edges[:-1] * edges[1:]) if log else (edges[:-1] + edges[1:]) / 2
+
+    def x_centers(self, log=False):
+        return self.centers(self.x_edges, log)
+
+    def y_centers(self, log=False):
+        return self.centers(self.y_edges, log)
+
+    def cells(self):
+        """Non-empty cells as rows (x_start, x_end, y_start, y_end, count[, mean]) for charts that take tidy data."""
+        iy, ix = np.nonzero(self.counts)
+        frame = pd.DataFrame({
+            'x_start': self.x_edges[ix], 'x_end': self.x_edges[ix + 1],
+            'y_start': self.y_edges[iy], 'y_end': self.y_edges[iy + 1],
+            'count': self.counts[iy, ix],
+        })
+        if self.means is not None:
+            frame['mean'] = self.means[iy, ix]
+        return frame
+
+
+def histogram(frame, column, bins=30, by=None, log=False):
+    """Counts per bin of column (per group of `by`): columns bin_start, bin_end[, by], count."""
+    edges = bin_edges(frame[column], bins, log)
+    index = bin_index(frame[column], edges)
+    inside = index >= 0
+    keys = {'bin': index[inside]}
+    if by is not None:
+        keys[by] = frame[by].to_numpy()[inside]
+    counts = pd.DataFrame(keys).groupby(list(keys), observed=True).size().rename('count').reset_index()
+    counts.insert(0, 'bin_start', edges[counts['bin']])
+    counts.insert(1, 'bin_end', edges[counts['bin'] + 1])
+    return counts.drop(columns='bin')
+
+
+def sample_points(frame, limit=MAX_POINTS, tail_column=None, tail_quantile=0.9, strata=None, seed=0):
+    """
+    At most `limit` rows of frame. Rows with tail_column at or above its tail_quantile are kept first
+    (the highest ones when the tail alone exceeds half the budget); the rest of the budget is sampled
+    from the remaining rows in proportion to each `strata` group (a column or list of columns), so every
+    group keeps its share. Returned in frame order.
+    """
+    if len(frame) <= limit:
+        return frame
+    rng = np.random.default_rng(seed)
+    tail = np.zeros(len(frame), dtype=bool)
+    if tail_column is not None:
+        values = frame[tail_column].to_numpy(dtype='float64')
+        tail = values >= np.nanquantile(values, tail_quantile)
+        if tail.sum() > limit // 2:
+            keep = np.flatnonzero(tail)[np.argsort(-values[tail], kind='stable')[:limit // 2]]
+            tail = np.zeros(len(frame), dtype=bool)
+            tail[keep] = True
+    rest = np.flatnonzero(~tail)
+    budget = limit - int(tail.sum())
+    if strata is None:
+        chosen = rng.choice(rest, size=min(budget, len(rest)), replace=False)
+    else:
+        groups = frame.iloc[rest].groupby(strata, observed=True, sort=False).indices
+        chosen = []
+        for members in groups.values():
+            share = min(len(members), int(round(budget * len(members) / len(rest))))
+            chosen.append(rest[rng.choice(members, size=share, replace=False)])
+        chosen = np.concatenate(chosen) if chosen else np.array([], dtype=int)
+    positions = np.sort(np.concatenate([np.flatnonzero(tail), chosen[:budget]]))
+    return frame.iloc[positions]
+
+
+def rows_in_box(frame, x, y, x_range, y_range, limit=100, sort_by=None):
+    """On-demand detail for a selected region: up to `limit` rows inside the box, highest sort_by first."""
+    inside = frame[x].between(*sorted(x_range)) & frame[y].between(*sorted(y_range))
+    rows = frame[inside]
+    if sort_by is not None:
+        return rows.nlargest(limit, sort_by)
+    return rows.head(limit)
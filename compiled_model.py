@@ -0,0 +1,465 @@
+"""
+Compiled inference artifact: scorecard tables, PD calibration, fill values and the trained tree
+ensemble in one versioned .npz file, plus a NumPy-only predictor for it.
+
+Export flattens every tree of the model (RandomForestClassifier or HistGradientBoostingClassifier)
+into shared node arrays (feature, threshold, children, leaf flag, missing-goes-left, leaf value) with
+one root per tree. The scorecard is stored as bin tables that map each raw input straight to its bucket and
+points, so the predictor needs neither pandas nor the feature code in build_modeling_view.py. The
+.npz is written uncompressed and load() memory-maps its arrays, so a cold start costs milliseconds
+whatever the ensemble's size.
+
+CompiledModel.score() takes raw application columns (the scoring service's input fields) and returns
+the service's output columns. predict_proba() traverses all trees for a batch together, level by
+level, keeping only the rows that have not reached a leaf.
+
+The artifact is for serving small batches, where it avoids pandas and the pickle's load time. On
+large batches the level-wise traversal is 3-5x slower than sklearn's compiled trees (a 100-tree forest
+scores about 11-20k rows/s against 57-90k, gradient boosting about 37-110k against 125-375k), so batch
+scoring (score_credit_risk_model.py) keeps using the pickle. test_compiled_model.py checks parity
+with clf.predict_proba to 1e-12 for a forest and a boosting model.
+
+PD_hat and Grade come from meta['calibration'], a table of levels indexed by a bin of Total_Points: the
+PD_CALIBRATION ladder's five bins, or, for a view built with build_modeling_view.py --calibration, one
+level per reachable Total_Points holding the fitted calibration's PD there (export --calibration), so
+the artifact scores the same PD_hat and Grade as the view. whatif.py reads the same table.
+
+Usage:
+    python compiled_model.py export [--model credit_risk_model.pkl] [--fill-values modeling_view_fill_values.json]
+                                    [--calibration pd_calibration.json] [--output credit_risk_model.npz]
+    python compiled_model.py check [--artifact credit_risk_model.npz]   # parity with the pickle, load and batch timings
+"""
+
+import argparse
+import datetime
+import json
+import struct
+import time
+import zipfile
+
+import numpy as np
+
+FORMAT_VERSION = 1
+artifact_path = 'credit_risk_model.npz'
+
+# Scorecard inputs the predictor reads, as numbers or as ISO dates
+NUMERIC_INPUTS = [
+    'Total_Monthly_Obligations', 'Net_Monthly_Income', 'Collateral_Value', 'Requested_Loan_Amount',
+    'Credit_Utilization_Ratio', 'Number_of_Late_Payments', 'Credit_Inquiries_Last_12_Months', 'Years_in_Current_Job',
+]
+DATE_INPUTS = ['Application_Date', 'Customer_Since']
+
+
+class ArtifactError(Exception):
+    pass
+
+
+def scorecard_tables():
+    """The scorecard as bin tables from a raw input to bucket label and points, one per Points_* column."""
+    import scorecard
+    # bucket column -> (raw input, bin table), as engineer_features derives them
+    buckets = {
+        'Utilization_Bucket': ('Credit_Utilization_Ratio', scorecard.UTILIZATION_BINS),
+        'Late_Pay_Bucket': ('Number_of_Late_Payments', scorecard.LATE_PAY_BINS),
+        'Inq_Bucket': ('Credit_Inquiries_Last_12_Months', scorecard.INQUIRY_BINS),
+        'Tenure_Bucket': ('Tenure_Months', scorecard.TENURE_BINS),
+        # engineer_features' >= 3 / >= 1 ladder; missing years fail both tests and are 'Low'
+        'Income_Stability': ('Years_in_Current_Job',
+                             {'edges': [1, 3], 'side': 'right', 'labels': ['Low', 'Medium', 'High'], 'nan_bin': 0}),
+    }
+    tables = []
+    for points_col, (source, table) in scorecard.POINTS_COLUMNS.items():
+        if 'edges' in table:
+            # scored from the value itself (DTI, LTV)
+            bucket, bins, labels, points = None, table, None, list(table['labels'])
+        else:
+            bucket = source
+            source, bins = buckets[bucket]
+            labels = list(bins['labels'])
+            points = [table['points'].get(label, table['default']) for label in labels]
+        exact = bins.get('exact', [])
+        tables.append({
+            'points_column': points_col, 'input': source, 'bucket': bucket, 'labels': labels, 'points': points,
+            'edges': list(bins['edges']), 'side': bins['side'], 'exact': list(exact),
+            # NaN sorts past the last edge in scorecard.bin_index
+            'nan_bin': bins.get('nan_bin', len(bins['edges']) + len(exact)),
+        })
+    return tables
+
+
+def max_total_points():
+    return int(sum(max(t['points']) for t in scorecard_tables()))
+
+
+def calibration(fitted=None):
+    """
+    PD_hat, Grade and Risk_Profile per level of Total_Points: the PD_CALIBRATION ladder, or a fitted
+    Total_Points calibration (pd_calibration.PDCalibration) tabulated at every reachable Total_Points.
+    """
+    import scorecard
+    if fitted is None:
+        pd_levels = scorecard.bin_outputs(scorecard.PD_CALIBRATION).astype('float64')
+        table = {'method': 'ladder', 'edges': list(scorecard.PD_CALIBRATION['edges']),
+                 'side': scorecard.PD_CALIBRATION['side']}
+    else:
+        if fitted.score != 'Total_Points':
+            raise ArtifactError(f'a {fitted.score} calibration cannot give PD_hat; it needs a Total_Points calibration')
+        points = np.arange(max_total_points() + 1, dtype='float64')
+        pd_levels = fitted.apply(points)
+        # level i is Total_Points i (totals past the maximum cannot occur and would take the last level)
+        table = {'method': fitted.method, 'edges': points[1:].tolist(), 'side': 'right',
+                 'knots': [fitted.knot_x.tolist(), fitted.knot_pd.tolist()]}
+    grade_levels = scorecard.grade_map(pd_levels)
+    table.update({
+        'pd': pd_levels.tolist(), 'grade': list(grade_levels),
+        'profile': [str(p) for p in np.asarray(scorecard.risk_profile(grade_levels, pd_levels))],
+        'base_score': scorecard.BASE_SCORE,
+    })
+    return table
+
+
+def flatten_forest(clf):
+    trees = [est.tree_ for est in clf.estimators_]
+    value = []
+    for tree in trees:
+        counts = tree.value[:, 0, :]
+        # predict_proba normalizes each leaf's class weights; class 1 is the default
+        value.append(counts[:, 1] / counts.sum(axis=1))
+    return trees, {
+        'feature': [t.feature for t in trees], 'threshold': [t.threshold for t in trees],
+        'left': [t.children_left for t in trees], 'right': [t.children_right for t in trees],
+        'missing_left': [getattr(t, 'missing_go_to_left', np.zeros(t.node_count, dtype=np.uint8)) for t in trees],
+        'value': value,
+    }
+
+
+def flatten_hist_gradient_boosting(clf):
+    nodes = [predictors[0].nodes for predictors in clf._predictors]
+    if any(n['is_categorical'].any() for n in nodes):
+        raise ArtifactError('categorical splits are not supported')
+    leaf = [n['is_leaf'].astype(bool) for n in nodes]
+    return nodes, {
+        'feature': [n['feature_idx'] for n in nodes], 'threshold': [n['num_threshold'] for n in nodes],
+        'left': [np.where(is_leaf, -1, n['left'].astype(np.int64)) for n, is_leaf in zip(nodes, leaf)],
+        'right': [np.where(is_leaf, -1, n['right'].astype(np.int64)) for n, is_leaf in zip(nodes, leaf)],
+        'missing_left': [n['missing_go_to_left'] for n in nodes], 'value': [n['value'] for n in nodes],
+    }
+
+
+def export(clf, fill_values, features, path=artifact_path, fitted=None):
+    """Write clf with the scorecard, calibration (`fitted`, or the ladder) and fill values to path; returns the metadata."""
+    import sklearn
+    from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+    if isinstance(clf, RandomForestClassifier):
+        kind, (trees, parts), base = 'forest', flatten_forest(clf), 0.0
+        input_dtype = 'float32'  # sklearn trees compare float32 inputs
+    elif isinstance(clf, HistGradientBoostingClassifier):
+        if clf.n_trees_per_iteration_ != 1:
+            raise ArtifactError('only binary classifiers are supported')
+        kind, (trees, parts), base = 'boosting', flatten_hist_gradient_boosting(clf), float(clf._baseline_prediction[0, 0])
+        input_dtype = 'float64'
+    else:
+        raise ArtifactError(f'cannot compile a {type(clf).__name__}')
+    if list(clf.classes_) != [0, 1]:
+        raise ArtifactError(f'expected classes [0, 1], got {list(clf.classes_)}')
+
+    sizes = np.array([len(f) for f in parts['feature']])
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    # child indices become global, and a leaf is its own child so finished rows stay put
+    left = np.concatenate([np.asarray(c, dtype=np.int64) + o for c, o in zip(parts['left'], offsets)])
+    right = np.concatenate([np.asarray(c, dtype=np.int64) + o for c, o in zip(parts['right'], offsets)])
+    is_leaf = np.concatenate([np.asarray(c) < 0 for c in parts['left']])
+    node_ids = np.arange(len(is_leaf))
+    children = np.column_stack([np.where(is_leaf, node_ids, left), np.where(is_leaf, node_ids, right)])
+    meta = {
+        'format_version': FORMAT_VERSION, 'kind': kind, 'model_class': type(clf).__name__,
+        'sklearn_version': sklearn.__version__, 'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'features': list(features), 'input_dtype': input_dtype, 'base_value': base, 'trees': len(sizes),
+        'nodes': int(sizes.sum()), 'scorecard': scorecard_tables(), 'calibration': calibration(fitted),
+        'fill_values': {c: fill_values.get(c) for c in ['DTI', 'LTV', 'Tenure_Months']},
+    }
+    # JSON has no NaN: a fill value of a column with no data is saved as null
+    meta['fill_values'] = {c: None if v is None or np.isnan(v) else float(v) for c, v in meta['fill_values'].items()}
+    np.savez(
+        path,
+        meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+        roots=offsets.astype(np.int32),
+        feature=np.where(is_leaf, 0, np.concatenate(parts['feature'])).astype(np.int32),
+        threshold=np.concatenate(parts['threshold']).astype(np.float64),
+        children=children.astype(np.int32),
+        is_leaf=is_leaf,
+        missing_left=np.concatenate(parts['missing_left']).astype(bool),
+        value=np.concatenate(parts['value']).astype(np.float64),
+    )
+    return meta
+
+
+def mmap_npz(path):
+    """Memory-map every array of an uncompressed .npz."""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ArtifactError(f'{path}: {info.filename} is compressed and cannot be memory-mapped')
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack('<HH', f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran, dtype = read_header(f)
+            arrays[info.filename[:-4]] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                                   order='F' if fortran else 'C')
+    return arrays
+
+
+def to_float(values):
+    try:
+        return np.asarray(values, dtype='float64')
+    except (TypeError, ValueError):
+        # unparseable entries are missing, as pd.to_numeric(errors='coerce') makes them
+        out = np.empty(len(values))
+        for i, v in enumerate(values):
+            try:
+                out[i] = float(v) if v is not None else np.nan
+            except (TypeError, ValueError):
+                out[i] = np.nan
+        return out
+
+
+def to_days(values):
+    try:
+        return np.asarray(values, dtype='datetime64[D]')
+    except (TypeError, ValueError):
+        out = np.empty(len(values), dtype='datetime64[D]')
+        for i, v in enumerate(values):
+            try:
+                out[i] = np.datetime64(str(v)[:10], 'D') if v is not None else np.datetime64('NaT')
+            except ValueError:
+                out[i] = np.datetime64('NaT')
+        return out
+
+
+def bin_index(x, table):
+    idx = np.searchsorted(np.asarray(table['edges'], dtype='float64'), x, side=table['side']) + len(table['exact'])
+    for bin_no, value in enumerate(table['exact']):
+        idx[x == value] = bin_no
+    idx[np.isnan(x)] = table['nan_bin']
+    return idx
+
+
+class CompiledModel:
+    def __init__(self, arrays):
+        self.meta = json.loads(bytes(arrays['meta']))
+        if self.meta['format_version'] != FORMAT_VERSION:
+            raise ArtifactError(f"artifact format {self.meta['format_version']}, this predictor reads {FORMAT_VERSION}")
+        self.roots = arrays['roots']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.children = arrays['children']
+        self.is_leaf = arrays['is_leaf']
+        self.missing_left = arrays['missing_left']
+        self.value = arrays['value']
+        self.features = self.meta['features']
+        self.tables = self.meta['scorecard']
+        cal = self.meta['calibration']
+        self.calibration = {'edges': cal['edges'], 'side': cal['side'], 'exact': [], 'nan_bin': len(cal['edges'])}
+        self.pd_levels = np.asarray(cal['pd'])
+        self.grade_levels = np.asarray(cal['grade'], dtype=object)
+        self.profile_levels = np.asarray(cal['profile'], dtype=object)
+        self.fill_values = {c: np.nan if v is None else v for c, v in self.meta['fill_values'].items()}
+
+    @classmethod
+    def load(cls, path=artifact_path, mmap=True):
+        if mmap:
+            return cls(mmap_npz(path))
+        with np.load(path) as archive:
+            return cls({name: archive[name] for name in archive.files})
+
+    def leaf_values(self, X, chunksize=8192):
+        """Leaf value of every (tree, row): shape (trees, rows). Rows are traversed chunksize at a time."""
+        X = np.asarray(X, dtype=self.meta['input_dtype'])
+        trees, width = len(self.roots), X.shape[1]
+        out = np.empty((trees, len(X)))
+        for start in range(0, len(X), chunksize):
+            chunk = np.ascontiguousarray(X[start:start + chunksize])
+            n = len(chunk)
+            flat = chunk.ravel()
+            has_missing = np.isnan(flat).any()
+            # one (tree, row) pair per entry, tree-major; offset is the row's start in flat
+            node = np.repeat(np.asarray(self.roots), n)
+            offset = np.tile(np.arange(n, dtype=np.intp) * width, trees)
+            active = np.flatnonzero(~self.is_leaf[node])
+            while active.size:
+                at = node[active]
+                x = flat[offset[active] + self.feature[at]]
+                go_right = x > self.threshold[at]
+                if has_missing:
+                    missing = np.isnan(x)
+                    go_right[missing] = ~self.missing_left[at[missing]]
+                node[active] = self.children[at, go_right.view(np.uint8)]
+                active = active[~self.is_leaf[node[active]]]
+            out[:, start:start + n] = np.asarray(self.value)[node].reshape(trees, n)
+        return out
+
+    def predict_proba(self, X):
+        """Class probabilities [P(0), P(1)] for a feature matrix in self.features order."""
+        leaves = self.leaf_values(X)
+        # summed tree by tree, in the order sklearn adds them
+        total = np.full(leaves.shape[1], self.meta['base_value'])
+        for row in leaves:
+            total += row
+        if self.meta['kind'] == 'forest':
+            p1 = total / len(leaves)
+        else:
+            p1 = 1 / (1 + np.exp(-total))
+        return np.column_stack([1 - p1, p1])
+
+    def features_frame(self, columns):
+        """Model inputs and scorecard outputs from raw input columns (a mapping of name -> sequence)."""
+        n = len(next(iter(columns.values())))
+        missing = np.full(n, np.nan)
+        raw = {c: to_float(columns[c]) if c in columns else missing for c in NUMERIC_INPUTS}
+        dates = {c: to_days(columns[c]) if c in columns else np.full(n, np.datetime64('NaT'), dtype='datetime64[D]')
+                 for c in DATE_INPUTS}
+        out = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out['DTI'] = np.minimum(raw['Total_Monthly_Obligations'] / raw['Net_Monthly_Income'], 1.5)
+            collateral = raw['Collateral_Value']
+            out['LTV'] = np.minimum(np.where(collateral > 0, raw['Requested_Loan_Amount'] / collateral, 0), 1.2)
+        days = (dates['Application_Date'] - dates['Customer_Since']).astype('float64')
+        days[np.isnat(dates['Application_Date']) | np.isnat(dates['Customer_Since'])] = np.nan
+        tenure = days / 30
+        raw['Tenure_Months'] = np.where(tenure < 0, 0, tenure)
+        # buckets use the raw values; DTI, LTV and tenure are then filled for points and the model
+        filled = {c: np.where(np.isnan(out[c] if c in out else raw[c]), self.fill_values[c], out[c] if c in out else raw[c])
+                  for c in ['DTI', 'LTV', 'Tenure_Months']}
+        raw.update(DTI=filled['DTI'], LTV=filled['LTV'])
+        out.update(filled)
+        total = np.zeros(n, dtype='int64')
+        for table in self.tables:
+            source = raw[table['input']]
+            idx = bin_index(source, table)
+            if table['bucket'] is not None:
+                out[table['bucket']] = np.asarray(table['labels'], dtype=object)[idx]
+            points = np.asarray(table['points'], dtype='int64')[idx]
+            out[table['points_column']] = points
+            total += points
+        out['Total_Points'] = total
+        out['Total_Score'] = self.meta['calibration']['base_score'] - total
+        level = bin_index(total.astype('float64'), self.calibration)
+        out['PD_hat'] = self.pd_levels[level]
+        out['Grade'] = self.grade_levels[level]
+        out['Risk_Profile'] = self.profile_levels[level]
+        return out
+
+    def score(self, columns):
+        """Scorecard outputs and Model_Pred_Prob for raw input columns."""
+        out = self.features_frame(columns)
+        X = np.column_stack([out[f] for f in self.features])
+        out['Model_Pred_Prob'] = self.predict_proba(X)[:, 1]
+        return out
+
+    def score_records(self, records):
+        """score() for a list of application dicts."""
+        names = NUMERIC_INPUTS + DATE_INPUTS
+        return self.score({c: [r.get(c) for r in records] for c in names})
+
+
+def check(artifact, model, fill_values, rows):
+    """Compare the artifact with the pickled model and the service's pandas path; exits 1 on a mismatch."""
+    import joblib
+    import pandas as pd
+    import build_modeling_view as bmv
+    import scoring_service
+    import storage
+
+    start = time.perf_counter()
+    clf = joblib.load(model)
+    pickle_secs = time.perf_counter() - start
+    start = time.perf_counter()
+    compiled = CompiledModel.load(artifact)
+    load_secs = time.perf_counter() - start
+    print(f"{artifact}: {compiled.meta['model_class']}, {compiled.meta['trees']} trees, {compiled.meta['nodes']:,} nodes")
+    print(f'cold load: joblib {pickle_secs * 1000:.1f} ms, compiled {load_secs * 1000:.1f} ms')
+
+    cal = compiled.meta['calibration']
+    print(f"calibration: {cal.get('method', 'ladder')}")
+    # the service reference uses the calibration the artifact was exported with
+    fitted = None
+    if cal.get('method', 'ladder') != 'ladder':
+        from pd_calibration import PDCalibration
+        fitted = PDCalibration('Total_Points', cal['method'], None, knots=cal['knots'])
+
+    view = storage.read_view(columns=compiled.features)
+    if rows:
+        view = view.iloc[:rows]
+    X = view.to_numpy(dtype='float64')
+    start = time.perf_counter()
+    expected = clf.predict_proba(view)[:, 1]
+    sklearn_secs = time.perf_counter() - start
+    start = time.perf_counter()
+    got = compiled.predict_proba(X)[:, 1]
+    compiled_secs = time.perf_counter() - start
+    diff = np.abs(got - expected).max()
+    print(f'predict_proba on {len(X):,} view rows: max abs diff {diff:.2e} '
+          f'(sklearn {len(X) / sklearn_secs:,.0f} rows/s, compiled {len(X) / compiled_secs:,.0f} rows/s)')
+    ok = diff <= 1e-9
+
+    merged = bmv.merge_sources(bmv.load_sources())
+    records = json.loads(merged.iloc[:rows or None].to_json(orient='records'))
+    reference = scoring_service.score_applications(records, clf, bmv.load_fill_values(fill_values), fitted)
+    scored = compiled.score_records(records)
+    for col in scoring_service.OUTPUT_COLUMNS:
+        want, have = reference[col].to_numpy(), scored[col]
+        if col in ('DTI', 'LTV', 'PD_hat', 'Model_Pred_Prob'):
+            same = np.allclose(have.astype('float64'), want.astype('float64'), rtol=0, atol=1e-9, equal_nan=True)
+        else:
+            same = (pd.Series(have).astype(str).to_numpy() == pd.Series(want).astype(str).to_numpy()).all()
+        if not same:
+            print(f'MISMATCH in {col}')
+            ok = False
+    print(f'scoring service outputs on {len(records):,} raw applications: ' + ('identical' if ok else 'DIFFER'))
+
+    # per-request cost at serving batch sizes: the service's pandas + pickle path vs the artifact
+    medians = bmv.load_fill_values(fill_values)
+    for size in [1, 64]:
+        batch = records[:size]
+        timings = []
+        for fn in (lambda: scoring_service.score_applications(batch, clf, medians, fitted),
+                   lambda: compiled.score_records(batch)):
+            fn()
+            start = time.perf_counter()
+            for _ in range(20):
+                fn()
+            timings.append((time.perf_counter() - start) / 20 * 1000)
+        print(f'batch of {size:>2}: service path {timings[0]:.2f} ms, compiled {timings[1]:.2f} ms')
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('--model', default='credit_risk_model.pkl')
+    parser.add_argument('--fill-values', default='modeling_view_fill_values.json')
+    parser.add_argument('--calibration', metavar='PATH',
+                        help='with export, PD_hat from this fitted Total_Points calibration (the one the view was built with)')
+    parser.add_argument('--output', '--artifact', dest='artifact', default=artifact_path)
+    parser.add_argument('--rows', type=int, default=None, help='with check, compare only the first ROWS rows')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        import joblib
+        import build_modeling_view as bmv
+        from train_credit_risk_model import features
+        fitted = None
+        if args.calibration:
+            from pd_calibration import PDCalibration
+            fitted = PDCalibration.load(args.calibration)
+        try:
+            meta = export(joblib.load(args.model), bmv.load_fill_values(args.fill_values), features, args.artifact, fitted)
+        except ArtifactError as e:
+            parser.error(str(e))
+        print(f"{args.model} -> {args.artifact}: {meta['model_class']}, {meta['trees']} trees, {meta['nodes']:,} nodes, "
+              f"calibration {meta['calibration']['method']}")
+    elif not check(args.artifact, args.model, args.fill_values, args.rows):
+        raise SystemExit(1)
@@ -0,0 +1,75 @@
+"""
+Data layer for the applicant dashboard.
+
+The modeling view is loaded once per process. Each rerun only stats the backing file; when its
+mtime or size changes the file is re-hashed, and the view is reloaded only if the content differs
+(so a touched but unchanged file keeps the cache). The loaded view is indexed by Applicant_ID
+(first application per applicant, as the dashboard shows), so a row fetch is a hash lookup plus
+one positional take. Sorted ID lists for paging and a sorted text form for prefix search are built
+at load time, so neither sorts per interaction.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+
+class IndexedView:
+    """The modeling view plus an Applicant_ID index, sorted IDs for paging and sorted ID text for search."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        ids = frame['Applicant_ID']
+        first = ~ids.duplicated().to_numpy()
+        self.positions = pd.Series(np.flatnonzero(first), index=ids.to_numpy()[first])
+        self.ids = np.sort(self.positions.index.to_numpy())
+        text = self.ids.astype(str)
+        order = np.argsort(text, kind='stable')
+        self.id_text = text[order]
+        self.ids_by_text = self.ids[order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, applicant_id):
+        """One-row frame for the applicant's first application (empty if unknown)."""
+        pos = self.positions.get(applicant_id)
+        return self.frame.iloc[0:0] if pos is None else self.frame.iloc[[pos]]
+
+    def page(self, number, size):
+        """IDs on 0-based page `number` of the sorted ID list."""
+        return self.ids[number * size:(number + 1) * size]
+
+    def search(self, prefix, limit):
+        """Up to `limit` IDs whose text starts with prefix, in text order."""
+        lo = np.searchsorted(self.id_text, prefix, side='left')
+        hi = np.searchsorted(self.id_text, prefix + '\uffff', side='left')
+        return self.ids_by_text[lo:min(hi, lo + limit)]
+
+
+class ViewCache:
+    """Process-wide cache of the indexed view, invalidated when the file's content changes."""
+
+    def __init__(self, path=None, memory_map=True):
+        self.path = path or storage.view_path()
+        self.memory_map = memory_map
+        self.lock = threading.Lock()
+        self.signature = None
+        self.digest = None
+        self.view = None
+
+    def get(self):
+        with self.lock:
+            source = storage.stored_path(self.path)
+            stat = os.stat(source)
+            signature = (source, stat.st_mtime_ns, stat.st_size)
+            if signature != self.signature:
+                digest = storage.file_digest(source)
+                if self.view is None or (source, digest) != (self.signature[0], self.digest):
+                    self.view = IndexedView(storage.read_view(memory_map=self.memory_map, path=self.path))
+                self.signature, self.digest = signature, digest
+            return self.view
@@ -1,17 +1,186 @@
-import pandas as pd
+"""
+Convert every sheet of the credit risk workbook to CSV (or Parquet, see storage.py).
+
+The workbook zip is opened once to list the sheets and hash their raw XML. Sheets whose hash
+matches the manifest from the previous run (and whose output still exists) are skipped.
+The remaining sheets are converted in a process pool. Each worker streams its sheet with
+openpyxl's read-only (iterparse) reader and writes batches straight to the target file,
+so no sheet is ever fully materialized.
+
+Sheets with a schema in storage.SOURCE_SCHEMAS are typed by that schema; any other sheet
+is read whole with pandas as before.
+
+Usage:
+    python excel_to_csv.py [workbook.xlsx] [--output-dir excel_sheets_csv] [--format csv|parquet]
+                           [--workers N] [--force]
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
 import os
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import storage
 
 excel_path = 'Credit_Risk_Analytics_Database_Clean.xlsx'
 output_dir = 'excel_sheets_csv'
-os.makedirs(output_dir, exist_ok=True)
+manifest_name = '.ingest_manifest.json'
+batch_rows = 50_000
+
+NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'rel': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'pkg': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+# Parts that change how every sheet's cells decode (shared string table, number/date formats)
+SHARED_PARTS = ['xl/sharedStrings.xml', 'xl/styles.xml']
+
+
+def sheet_hashes(path):
+    """Open the workbook zip once and return {sheet name: content hash}, in workbook order."""
+    with zipfile.ZipFile(path) as book:
+        workbook = ET.fromstring(book.read('xl/workbook.xml'))
+        rels = ET.fromstring(book.read('xl/_rels/workbook.xml.rels'))
+        targets = {r.get('Id'): r.get('Target') for r in rels.findall('pkg:Relationship', NS)}
+        names = set(book.namelist())
+        shared = hashlib.sha256()
+        for part in SHARED_PARTS:
+            if part in names:
+                shared.update(book.read(part))
+        hashes = {}
+        for sheet in workbook.find('main:sheets', NS):
+            target = targets[sheet.get(f'{{{NS["rel"]}}}id')]
+            part = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+            digest = shared.copy()
+            with book.open(part) as xml:
+                for block in iter(lambda: xml.read(1 << 20), b''):
+                    digest.update(block)
+            hashes[sheet.get('name')] = digest.hexdigest()
+    return hashes
+
+
+def cell_text(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d') if value.time() == datetime.time() else value.isoformat(sep=' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+def typed_batch(rows, header, schema):
+    """Build a DataFrame from raw cell tuples using the sheet's schema types."""
+    frame = pd.DataFrame(rows, columns=header)
+    for col in header:
+        kind = schema.get(col, 'str')
+        values = frame[col]
+        if kind == 'int':
+            frame[col] = pd.array(values, dtype='Int64')
+        elif kind == 'float':
+            frame[col] = pd.to_numeric(values).astype('float64')
+        elif kind == 'bool':
+            frame[col] = values.astype(object)
+        else:
+            frame[col] = values.map(cell_text, na_action='ignore').astype(object)
+    return frame
+
+
+def convert_sheet(xlsx_path, sheet_name, out_path, fmt):
+    """Stream one sheet to out_path; runs in a worker process. Returns the row count."""
+    schema = storage.SOURCE_SCHEMAS.get(sheet_name)
+    # write next to the target and rename, so an interrupted run never leaves a partial sheet behind
+    tmp_path = os.path.join(os.path.dirname(out_path), f'.{sheet_name}.tmp.{fmt}')
+    if schema is None:
+        frame = pd.read_excel(xlsx_path, sheet_name=sheet_name)
+        if fmt == 'parquet':
+            frame.to_parquet(tmp_path, index=False)
+        else:
+            frame.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, out_path)
+        return len(frame)
+
+    from openpyxl import load_workbook
+    book = load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        rows = book[sheet_name].iter_rows(values_only=True)
+        header = [str(h) for h in next(rows)]
+        n = 0
+        with storage.TableWriter(tmp_path, fmt, schema=schema) as writer:
+            batch = []
+            for row in rows:
+                if all(v is None for v in row):
+                    continue
+                batch.append(row[:len(header)])
+                if len(batch) == batch_rows:
+                    writer.write(typed_batch(batch, header, schema))
+                    n += len(batch)
+                    batch = []
+            if batch or n == 0:
+                writer.write(typed_batch(batch, header, schema))
+                n += len(batch)
+    finally:
+        book.close()
+    os.replace(tmp_path, out_path)
+    return n
+
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def ingest(xlsx_path=excel_path, out_dir=output_dir, fmt='csv', workers=None, force=False):
+    """Convert changed sheets in parallel; returns (converted sheet names, skipped sheet names)."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, manifest_name)
+    manifest = load_manifest(manifest_path)
+    hashes = sheet_hashes(xlsx_path)
+
+    todo, skipped = [], []
+    for sheet, digest in hashes.items():
+        out_path = os.path.join(out_dir, f'{sheet}.{fmt}')
+        entry = manifest.get(sheet, {})
+        if not force and entry.get(fmt) == digest and os.path.exists(out_path):
+            skipped.append(sheet)
+        else:
+            todo.append((sheet, out_path))
+
+    converted = []
+    if todo:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(convert_sheet, xlsx_path, sheet, out_path, fmt): sheet
+                           for sheet, out_path in todo}
+                for future in as_completed(futures):
+                    sheet = futures[future]
+                    rows = future.result()
+                    manifest.setdefault(sheet, {})[fmt] = hashes[sheet]
+                    converted.append(sheet)
+                    print(f'  {sheet}: {rows} rows')
+        finally:
+            # record the sheets that did convert, even if another one failed
+            with open(manifest_path, 'w') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+    return converted, skipped
 
-# Load the Excel file
-excel_file = pd.ExcelFile(excel_path)
 
-# Export each sheet to a separate CSV file
-for sheet_name in excel_file.sheet_names:
-    df = pd.read_excel(excel_path, sheet_name=sheet_name)
-    csv_path = os.path.join(output_dir, f'{sheet_name}.csv')
-    df.to_csv(csv_path, index=False)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('excel_path', nargs='?', default=excel_path)
+    parser.add_argument('--output-dir', default=output_dir)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='convert every sheet even if unchanged')
+    args = parser.parse_args()
 
-print(f'Exported {len(excel_file.sheet_names)} sheets to CSV files in "{output_dir}".')
+    converted, skipped = ingest(args.excel_path, args.output_dir, args.format, args.workers, args.force)
+    print(f'Exported {len(converted)} sheets to {args.format.upper()} files in "{args.output_dir}" '
+          f'({len(skipped)} unchanged sheets skipped).')
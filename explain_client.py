@@ -0,0 +1,202 @@
+"""
+Explanation client for the dashboard's "Explain & Advise" agent.
+
+    GeminiBackend   one pooled requests.Session per process, (connect, read) timeouts, and retries
+                    with exponential backoff on connection errors, 429 and 5xx responses
+    StubBackend     local, deterministic backend for exercising the cache and concurrency offline
+    DiskLRUCache    SQLite-backed cache keyed on (applicant row hash, question, model name), evicting
+                    the least recently used entries beyond max_entries
+    ExplanationClient
+                    cache lookup, then the backend; submit() runs the call on a thread pool and returns
+                    a Future, and concurrent submits of the same key share one backend call
+
+Usage (offline check of cache and concurrency with the stub backend):
+    python explain_client.py --requests 40 --distinct 5 --concurrency 8
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GEMINI_URL = 'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent'
+cache_path = '.explanation_cache.sqlite'
+
+
+class ExplanationError(Exception):
+    pass
+
+
+def build_prompt(applicant_data, user_question):
+    return (
+        "You are a senior credit risk analyst. Analyze the following applicant's data, which includes features from 10 different data sources: "
+        "demographics, employment/income, financial obligations, credit bureau, loan application details, collateral, banking relationship, external risk signals, regulatory compliance, and risk assessment scores.\n\n"
+        "For each feature, provide:\n"
+        "- A definition and its importance in credit risk assessment (industry context)\n"
+        "- The applicant's value and how it compares to industry benchmarks or best practices\n"
+        "- Why this value increases or decreases risk (with examples)\n"
+        "- Actionable recommendations for improvement\n\n"
+        "Structure your report as follows:\n"
+        "1. Executive Summary: Overall risk profile and key findings\n"
+        "2. Feature-by-Feature Analysis: For each feature, provide the above details\n"
+        "3. Segment Analysis: Highlight any segment-specific risks (e.g., product, branch, source)\n"
+        "4. Regulatory and Policy Flags: Note any compliance issues\n"
+        "5. Recommendations: Practical steps for the applicant to improve their risk profile\n"
+        "6. Conclusion: Final assessment and advice\n\n"
+        "Applicant data:\n"
+        f"{applicant_data}\n"
+        "User question:\n"
+        f"{user_question}\n"
+        "Please provide a detailed, professional report suitable for a credit risk committee review."
+    )
+
+
+def row_hash(applicant_data):
+    """Stable hash of an applicant's row (dict of column -> value)."""
+    text = json.dumps(applicant_data, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class GeminiBackend:
+    def __init__(self, api_key, model='gemini-2.0-flash', timeout=(5, 60), retries=3, backoff=0.5, pool_size=8):
+        self.model = model
+        self.url = GEMINI_URL.format(model=model)
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json', 'X-goog-api-key': api_key})
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=['POST'], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+
+    def generate(self, prompt):
+        payload = {'contents': [{'parts': [{'text': prompt}]}]}
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ExplanationError(f'Gemini API error: {e}') from e
+        if not response.ok:
+            raise ExplanationError(f'Gemini API error: {response.text}')
+        result = response.json()
+        return result['candidates'][0]['content']['parts'][0]['text']
+
+
+class StubBackend:
+    """Offline backend: returns a canned explanation after `delay` seconds and counts its calls."""
+
+    def __init__(self, delay=0.2, model='stub'):
+        self.model = model
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate(self, prompt):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return f'[stub explanation for prompt {hashlib.sha256(prompt.encode()).hexdigest()[:12]}]'
+
+
+class DiskLRUCache:
+    """Explanation texts in a SQLite file, keeping the max_entries most recently used."""
+
+    def __init__(self, path=cache_path, max_entries=512):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS explanations '
+                          '(key TEXT PRIMARY KEY, text TEXT NOT NULL, used REAL NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS explanations_used ON explanations (used)')
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            found = self.conn.execute('SELECT text FROM explanations WHERE key = ?', (key,)).fetchone()
+            if found is None:
+                return None
+            self.conn.execute('UPDATE explanations SET used = ? WHERE key = ?', (time.time(), key))
+            self.conn.commit()
+            return found[0]
+
+    def put(self, key, text):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO explanations VALUES (?, ?, ?)', (key, text, time.time()))
+            self.conn.execute('DELETE FROM explanations WHERE key NOT IN '
+                              '(SELECT key FROM explanations ORDER BY used DESC LIMIT ?)', (self.max_entries,))
+            self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM explanations').fetchone()[0]
+
+
+class ExplanationClient:
+    def __init__(self, backend, cache=None, max_workers=4):
+        self.backend = backend
+        self.cache = cache
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def key(self, applicant_data, question):
+        return hashlib.sha256('\0'.join([row_hash(applicant_data), question, self.backend.model]).encode()).hexdigest()
+
+    def explain(self, applicant_data, question):
+        """Blocking: the cached explanation, or a fresh one from the backend (then cached)."""
+        key = self.key(applicant_data, question)
+        text = None if self.cache is None else self.cache.get(key)
+        if text is None:
+            text = self.backend.generate(build_prompt(applicant_data, question))
+            if self.cache is not None:
+                self.cache.put(key, text)
+        return text
+
+    def submit(self, applicant_data, question):
+        """Non-blocking: a Future for explain(); identical in-flight requests share one Future."""
+        key = self.key(applicant_data, question)
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is None:
+                future = self.pool.submit(self.explain, applicant_data, question)
+                self.inflight[key] = future
+                future.add_done_callback(lambda _, key=key: self._done(key))
+            return future
+
+    def _done(self, key):
+        with self.lock:
+            self.inflight.pop(key, None)
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--distinct', type=int, default=5, help='distinct (applicant, question) pairs among them')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--delay', type=float, default=0.2, help='stub latency in seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        backend = StubBackend(delay=args.delay)
+        client = ExplanationClient(backend, DiskLRUCache(os.path.join(workdir, 'cache.sqlite')), args.concurrency)
+        rows = [{'Applicant_ID': i, 'Grade': 'Prime'} for i in range(args.distinct)]
+        start = time.perf_counter()
+        futures = [client.submit(rows[i % args.distinct], 'Why?') for i in range(args.requests)]
+        texts = [f.result() for f in futures]
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        again = [client.explain(rows[i % args.distinct], 'Why?') for i in range(args.requests)]
+        warm = time.perf_counter() - start
+        assert texts == again
+        print(f'{args.requests} requests, {args.distinct} distinct: {backend.calls} backend calls, '
+              f'{cold:.2f}s cold (concurrent), {warm * 1000:.1f} ms warm (all cache hits), '
+              f'{len(client.cache)} cache entries')
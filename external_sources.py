@@ -0,0 +1,346 @@
+"""
+Asynchronous ingestion of the externally sourced sheets from their providers.
+
+Credit_Bureau_Data, External_Data_Sources and Regulatory_Compliance come from a credit bureau, an
+alternative-data vendor and a KYC/AML screening service. Each provider has an adapter (Provider): the
+URL of one key's record, and how its reply maps to the sheet's columns. Ingestion fetches the records
+for every key of the loan book and returns the three sheets as frames, which build_modeling_view.py
+joins in place of the static files (--providers URL).
+
+    concurrency   --concurrency coroutines take (provider, key) jobs from one shared list, so at most
+                  that many requests are in flight whatever the book size
+    pooling       one aiohttp session per run; its connector keeps at most --pool-size keep-alive
+                  connections open and reuses them across providers and requests
+    retries       connection errors, timeouts, 429 and 5xx are retried with exponential backoff and
+                  jitter, waiting at least as long as a Retry-After header asks; 404 means the provider has
+                  no record (a missing row, as in a left join); other errors fail the run
+    TTL cache     records (and not-founds) are kept in SQLite (.provider_cache.sqlite) per gateway URL,
+                  provider and key with their fetch time; a key fetched from the same gateway within its
+                  provider's validity window (bureau 30 days, alternative data 7 days, KYC/AML 1 day) is
+                  not requested again
+
+mock_providers.py serves the static sheets in each provider's reply format with configurable latency
+and failures, for testing this end to end.
+
+Usage:
+    python external_sources.py fetch --url http://127.0.0.1:8090 [--concurrency 64] [--pool-size 32]
+                                     [--output-dir DIR] [--no-cache]
+    python build_modeling_view.py --base DIR [--chunksize 100000]
+    python external_sources.py bench [--latency-ms 20] [--error-rate 0.01] [--concurrency 64]
+    python build_modeling_view.py --providers http://127.0.0.1:8090
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+import storage
+
+cache_path = '.provider_cache.sqlite'
+DAY = 86400.0
+# replies worth another attempt, as in explain_client.py
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF = 10.0
+
+
+class ProviderError(Exception):
+    pass
+
+
+class Provider:
+    """Adapter for one provider: where a key's record is, and how the reply maps to the sheet's columns."""
+
+    name = None     # the build_modeling_view.files entry this provider replaces
+    sheet = None    # storage.SOURCE_SCHEMAS entry of the rows it returns
+    key = None      # join key the records are requested by
+    path = None
+    ttl = 0.0       # seconds a fetched record stays valid
+
+    def url(self, base_url, key):
+        return f'{base_url.rstrip("/")}/{self.path}/{key}'
+
+    def parse(self, key, payload):
+        """The sheet row (column -> value) in a 200 reply."""
+        raise NotImplementedError
+
+    def columns(self):
+        return list(storage.SOURCE_SCHEMAS[self.sheet])
+
+
+class BureauProvider(Provider):
+    name, sheet, key, path, ttl = 'bureau', 'Credit_Bureau_Data', 'Applicant_ID', 'bureau/v1/reports', 30 * DAY
+
+    def parse(self, key, payload):
+        return {'Applicant_ID': key, **payload['report']}
+
+
+class AlternativeDataProvider(Provider):
+    name, sheet, key, path, ttl = 'external', 'External_Data_Sources', 'Applicant_ID', 'altdata/v1/signals', 7 * DAY
+
+    def parse(self, key, payload):
+        return {'Applicant_ID': key, **payload['signals']}
+
+
+class ScreeningProvider(Provider):
+    name, sheet, key, path, ttl = 'regulatory', 'Regulatory_Compliance', 'Application_ID', 'kyc/v1/screenings', 1 * DAY
+
+    def parse(self, key, payload):
+        return {'Application_ID': key, **payload['checks']}
+
+
+PROVIDERS = {p.name: p for p in [BureauProvider(), AlternativeDataProvider(), ScreeningProvider()]}
+
+
+class TTLCache:
+    """
+    Fetched records per (gateway URL, provider, key) in SQLite with their fetch time; None records are
+    not-founds. The same provider behind two gateways (a mock and production, say) is cached apart.
+    """
+
+    def __init__(self, path=cache_path):
+        self.conn = sqlite3.connect(path)
+        # records cached before the gateway was part of the key cannot be attributed to one, so they are dropped
+        self.conn.execute('DROP TABLE IF EXISTS provider_records')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS gateway_records (gateway TEXT NOT NULL, provider TEXT NOT NULL, '
+                          'key INTEGER NOT NULL, fetched REAL NOT NULL, record TEXT, '
+                          'PRIMARY KEY (gateway, provider, key)) WITHOUT ROWID')
+        self.conn.commit()
+
+    def fresh(self, base_url, provider, keys, now):
+        """Records of keys fetched from base_url within provider.ttl of now, as key -> record (or None)."""
+        gateway = base_url.rstrip('/')
+        self.conn.execute('DELETE FROM gateway_records WHERE gateway = ? AND provider = ? AND fetched < ?',
+                          (gateway, provider.name, now - provider.ttl))
+        self.conn.commit()
+        wanted = set(keys)
+        rows = self.conn.execute('SELECT key, record FROM gateway_records WHERE gateway = ? AND provider = ?',
+                                 (gateway, provider.name))
+        return {key: None if record is None else json.loads(record) for key, record in rows if key in wanted}
+
+    def put(self, base_url, provider, records, now):
+        gateway = base_url.rstrip('/')
+        self.conn.executemany('INSERT OR REPLACE INTO gateway_records VALUES (?, ?, ?, ?, ?)',
+                              [(gateway, provider.name, key, now, None if r is None else json.dumps(r))
+                               for key, r in records])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def records_frame(provider, records):
+    """Sheet rows as a frame typed the way storage.read_table reads the sheet."""
+    schema = storage.SOURCE_SCHEMAS[provider.sheet]
+    frame = pd.DataFrame.from_records(records, columns=provider.columns())
+    for col, kind in schema.items():
+        if kind in ('int', 'float'):
+            frame[col] = pd.to_numeric(frame[col])
+    return storage.apply_categories(frame, schema)
+
+
+class Ingestion:
+    """Fetches provider records for a loan book; stats describe the last fetch."""
+
+    def __init__(self, base_url, providers=None, cache=None, concurrency=64, pool_size=32, retries=3, backoff=0.1,
+                 timeout=10.0, flush_every=1000):
+        self.base_url = base_url
+        self.providers = {name: PROVIDERS[name] for name in providers or PROVIDERS}
+        self.cache = cache
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.flush_every = flush_every
+        self.stats = {}
+
+    async def get(self, session, provider, key):
+        """One key's record, or None on 404; retries transient failures."""
+        url = provider.url(self.base_url, key)
+        for attempt in range(self.retries + 1):
+            wait = None
+            start = time.perf_counter()
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        payload = await response.json()
+                        self.stats['latencies'].append(time.perf_counter() - start)
+                        return provider.parse(key, payload)
+                    if response.status == 404:
+                        await response.read()
+                        self.stats['latencies'].append(time.perf_counter() - start)
+                        return None
+                    body = await response.text()
+                    if response.status not in RETRY_STATUSES:
+                        raise ProviderError(f'{provider.name} {key}: HTTP {response.status}: {body[:200]}')
+                    failure = f'HTTP {response.status}'
+                    if 'Retry-After' in response.headers:
+                        try:
+                            wait = float(response.headers['Retry-After'])
+                        except ValueError:
+                            pass
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                failure = f'{type(e).__name__}: {e}'
+            if attempt == self.retries:
+                raise ProviderError(f'{provider.name} {key}: gave up after {attempt + 1} attempts ({failure})')
+            self.stats['retries'] += 1
+            delay = self.backoff * 2 ** attempt * (0.5 + random.random() / 2)
+            await asyncio.sleep(min(max(delay, wait or 0.0), MAX_BACKOFF))
+
+    async def fetch_all(self, jobs):
+        """Records for (provider, key) jobs, fetched by self.concurrency coroutines over one pooled session."""
+        results = {}
+        pending = {name: [] for name in self.providers}
+        queue = iter(jobs)
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        def flush(name):
+            if self.cache is not None and pending[name]:
+                self.cache.put(self.base_url, self.providers[name], pending[name], time.time())
+            pending[name] = []
+
+        async def worker():
+            # the shared iterator hands each job to exactly one worker
+            for provider, key in queue:
+                record = await self.get(session, provider, key)
+                results[provider.name, key] = record
+                pending[provider.name].append((key, record))
+                if len(pending[provider.name]) >= self.flush_every:
+                    flush(provider.name)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            try:
+                await asyncio.gather(*(worker() for _ in range(max(min(self.concurrency, len(jobs)), 1))))
+            finally:
+                # whatever was fetched before a failure is kept for the next run
+                for name in pending:
+                    flush(name)
+        return results
+
+    def fetch(self, keys):
+        """Sheet frames for {provider name: keys}; cached records inside their validity window are reused."""
+        self.stats = {'requests': 0, 'cache_hits': 0, 'not_found': 0, 'retries': 0, 'latencies': [], 'seconds': 0.0}
+        start = time.perf_counter()
+        now = time.time()
+        found, jobs = {}, []
+        for name, provider in self.providers.items():
+            wanted = list(dict.fromkeys(int(k) for k in keys[name]))
+            cached = self.cache.fresh(self.base_url, provider, wanted, now) if self.cache is not None else {}
+            self.stats['cache_hits'] += len(cached)
+            found[name] = cached
+            jobs += [(provider, key) for key in wanted if key not in cached]
+        # interleave the providers, so one slow provider does not hold up the others' share of the pool
+        random.Random(0).shuffle(jobs)
+        self.stats['requests'] = len(jobs)
+        for (name, key), record in asyncio.run(self.fetch_all(jobs)).items():
+            found[name][key] = record
+        frames = {}
+        for name, provider in self.providers.items():
+            ordered = [found[name][int(k)] for k in dict.fromkeys(int(k) for k in keys[name])]
+            self.stats['not_found'] += sum(r is None for r in ordered)
+            frames[name] = records_frame(provider, [r for r in ordered if r is not None])
+        self.stats['seconds'] = time.perf_counter() - start
+        return frames
+
+    def sources(self, loan):
+        """The provider sheets for the keys of a loan applications frame, as load_sources returns them."""
+        return self.fetch({name: loan[p.key].dropna() for name, p in self.providers.items()})
+
+    def summary(self):
+        s = self.stats
+        line = (f"{s['requests']:,} requests, {s['cache_hits']:,} cache hits, {s['not_found']:,} not found, "
+                f"{s['retries']:,} retries in {s['seconds']:.2f}s")
+        if s['latencies']:
+            ms = np.asarray(s['latencies']) * 1000
+            line += (f" ({s['requests'] / s['seconds']:,.0f} req/s; latency ms p50 {np.percentile(ms, 50):.1f} "
+                     f"p99 {np.percentile(ms, 99):.1f})")
+        return line
+
+
+def wait_for_server(url, timeout=60):
+    from urllib.request import urlopen
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urlopen(url.rstrip('/') + '/stats', timeout=1) as response:
+                return json.loads(response.read())
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f'mock providers did not come up on {url}')
+
+
+if __name__ == '__main__':
+    import shutil
+    import subprocess
+    import sys
+    import tempfile
+
+    import build_modeling_view as bmv
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['fetch', 'bench'])
+    parser.add_argument('--url', default='http://127.0.0.1:8090', help='provider gateway (bench spawns a mock here)')
+    parser.add_argument('--base', default=bmv.base, help='source sheets: the loan book, and what the mock serves')
+    parser.add_argument('--concurrency', type=int, default=64, help='requests in flight')
+    parser.add_argument('--pool-size', type=int, default=32, help='keep-alive connections')
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds per attempt')
+    parser.add_argument('--output-dir', help='with fetch, write a source directory here: the fetched sheets, and '
+                                              'the other sheets copied from --base (build it with --base DIR)')
+    parser.add_argument('--no-cache', action='store_true', help='with fetch, neither read nor fill the TTL cache')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='with bench, mock median latency')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='with bench, mock share of 503 replies')
+    args = parser.parse_args()
+
+    loan = storage.read_table(os.path.join(args.base, bmv.files['loan']))
+    if args.command == 'fetch':
+        ingestion = Ingestion(args.url, cache=None if args.no_cache else TTLCache(), concurrency=args.concurrency,
+                              pool_size=args.pool_size, retries=args.retries, timeout=args.timeout)
+        frames = ingestion.sources(loan)
+        print(ingestion.summary())
+        for name, frame in frames.items():
+            print(f'  {name}: {len(frame):,} rows')
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+                storage.write_dataset(frame, os.path.join(args.output_dir, bmv.files[name]))
+        if args.output_dir:
+            for name, file in bmv.files.items():
+                if name not in frames:
+                    source = storage.stored_path(os.path.join(args.base, file))
+                    shutil.copy2(source, os.path.join(args.output_dir, os.path.basename(source)))
+            print(f'Source sheets -> {args.output_dir} (python build_modeling_view.py --base {args.output_dir})')
+        raise SystemExit(0)
+
+    from urllib.parse import urlparse
+    url = urlparse(args.url)
+    mock = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_providers.py')
+    server = subprocess.Popen([sys.executable, mock, '--host', url.hostname, '--port', str(url.port), '--base', args.base,
+                               '--latency-ms', str(args.latency_ms), '--error-rate', str(args.error_rate)])
+    try:
+        wait_for_server(args.url)
+        with tempfile.TemporaryDirectory() as workdir:
+            cache = TTLCache(os.path.join(workdir, 'cache.sqlite'))
+            runs = [('sequential, 1 in flight', 1, None), (f'cold, {args.concurrency} in flight', args.concurrency, cache),
+                    ('warm (TTL cache)', args.concurrency, cache)]
+            for label, concurrency, run_cache in runs:
+                ingestion = Ingestion(args.url, cache=run_cache, concurrency=concurrency, pool_size=args.pool_size,
+                                      retries=args.retries, timeout=args.timeout)
+                # the sequential baseline fetches a sample, so it finishes in seconds
+                book = loan.iloc[:max(200, len(loan) // 50)] if concurrency == 1 else loan
+                frames = ingestion.sources(book)
+                print(f'{label:<28}{len(book):>10,} applications: {ingestion.summary()}')
+            cache.close()
+        stats = wait_for_server(args.url)
+        print('mock providers: ' + ', '.join(f'{k} {v:,}' for k, v in stats.items()))
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,220 @@
+"""
+Feature-matrix cache: the model features and Default_12m of a view as contiguous float32 arrays on disk,
+memory-mapped by every process that reads them.
+
+An entry is keyed by a hash of the view file's content and the feature list, so a rebuilt view or a
+changed feature list gets a new entry and a stale matrix is never read. Entries live in
+.feature_cache/<key>/:
+    X.f32      rows x features, float32 in C order (the dtype sklearn's trees compare)
+    y.f32      Default_12m as float32, NaN where the input has no label
+    ids.i64    Application_ID and Applicant_ID, rows x 2
+    meta.json  rows, features, source path and digest
+The view is read once, chunk by chunk, straight into the files. An entry is written to a temporary
+directory and renamed into place, so a concurrent reader never sees half a matrix; the newest KEEP
+entries are kept.
+
+FeatureMatrix maps the files with np.memmap and pickles as its directory: handing one to a process
+pool sends a path, and every worker maps the same page-cache pages instead of receiving a copy.
+train_credit_risk_model.py trains and evaluates from it, and score_credit_risk_model.py --feature-cache
+scores row ranges of it across its workers.
+
+Usage:
+    python feature_cache.py build [--input modeling_view_with_risk]
+    python feature_cache.py info
+    python feature_cache.py clear
+    python feature_cache.py bench [--input modeling_view_with_risk] [--workers N]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+FORMAT_VERSION = 1
+CACHE_DIR = '.feature_cache'
+KEEP = 4
+LABEL = 'Default_12m'
+
+
+def cache_key(source_digest, columns):
+    return hashlib.sha256(json.dumps([FORMAT_VERSION, source_digest, list(columns)]).encode()).hexdigest()[:20]
+
+
+def source_chunks(path, columns, chunksize):
+    if path.endswith('.sqlite'):
+        # the feature store reads the projection in one query
+        yield storage.read_view(columns=columns, path=path, compact=False)
+    else:
+        yield from storage.iter_table(path, chunksize, columns=columns, schema=storage.view_schema())
+
+
+class FeatureMatrix:
+    """Memory-mapped X, y and ids of one cache entry; pickles as its directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        rows, width = self.meta['rows'], len(self.meta['features'])
+        self.features = self.meta['features']
+        self.labeled = self.meta['labeled']
+        # np.memmap cannot map an empty file
+        mapped = rows > 0
+        self.X = np.memmap(os.path.join(directory, 'X.f32'), np.float32, 'r', shape=(rows, width)) if mapped \
+            else np.empty((0, width), np.float32)
+        self.y = np.memmap(os.path.join(directory, 'y.f32'), np.float32, 'r', shape=(rows,)) if mapped \
+            else np.empty(0, np.float32)
+        self.ids = np.memmap(os.path.join(directory, 'ids.i64'), np.int64, 'r', shape=(rows, 2)) if mapped \
+            else np.empty((0, 2), np.int64)
+
+    def __len__(self):
+        return len(self.X)
+
+    def __reduce__(self):
+        return FeatureMatrix, (self.directory,)
+
+    def frame(self, rows=slice(None)):
+        """Features for rows (a slice or an index array) as a DataFrame; a slice is not copied."""
+        return pd.DataFrame(self.X[rows], columns=self.features, copy=False)
+
+    def labels(self, rows=slice(None)):
+        """Default_12m as integers."""
+        if not self.labeled:
+            raise ValueError(f'{self.meta["source"]} has no {LABEL} column')
+        return self.y[rows].astype(np.int64)
+
+    def keys(self, rows=slice(None)):
+        ids = self.ids[rows]
+        return pd.DataFrame({'Application_ID': ids[:, 0], 'Applicant_ID': ids[:, 1]})
+
+
+def build(path, directory, columns, chunksize=200_000, digest=None):
+    """Write path's feature matrix into directory (which must not exist); returns its FeatureMatrix."""
+    available = storage.table_columns(path) if not path.endswith('.sqlite') else storage.view_schema()
+    labeled = LABEL in available
+    read = storage.KEY_COLUMNS + list(columns) + ([LABEL] if labeled else [])
+    tmp = f'{directory}.tmp-{os.getpid()}'
+    os.makedirs(tmp)
+    rows = 0
+    try:
+        with open(os.path.join(tmp, 'X.f32'), 'wb') as fx, open(os.path.join(tmp, 'y.f32'), 'wb') as fy, \
+                open(os.path.join(tmp, 'ids.i64'), 'wb') as fi:
+            for chunk in source_chunks(path, read, chunksize):
+                fx.write(np.ascontiguousarray(chunk[list(columns)].to_numpy(dtype=np.float32)).tobytes())
+                y = chunk[LABEL].to_numpy(dtype=np.float32, na_value=np.nan) if labeled else np.full(len(chunk), np.nan, np.float32)
+                fy.write(y.tobytes())
+                fi.write(np.ascontiguousarray(chunk[storage.KEY_COLUMNS].to_numpy(dtype=np.int64)).tobytes())
+                rows += len(chunk)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'format_version': FORMAT_VERSION, 'rows': rows, 'features': list(columns), 'labeled': labeled,
+                       'source': storage.stored_path(path), 'digest': digest,
+                       'created': time.strftime('%Y-%m-%dT%H:%M:%S')}, f, indent=1)
+        try:
+            os.rename(tmp, directory)
+        except OSError:
+            # another process finished the same entry first; its files are identical
+            if not os.path.isdir(directory):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return FeatureMatrix(directory)
+
+
+def entries(cache_dir=CACHE_DIR):
+    """Complete entries, newest first."""
+    if not os.path.isdir(cache_dir):
+        return []
+    found = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if '.tmp-' not in name]
+    found = [d for d in found if os.path.exists(os.path.join(d, 'meta.json'))]
+    return sorted(found, key=os.path.getmtime, reverse=True)
+
+
+def prune(keep=KEEP, cache_dir=CACHE_DIR):
+    for directory in entries(cache_dir)[keep:]:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def model_features():
+    # imported here: the trainer imports this module
+    from train_credit_risk_model import features
+    return features
+
+
+def load(path=None, columns=None, cache_dir=CACHE_DIR, chunksize=200_000):
+    """The feature matrix of a view (path defaults to storage.view_path(), columns to the model features), built on first use."""
+    path = path or storage.view_path()
+    columns = columns or model_features()
+    digest = storage.file_digest(storage.stored_path(path))
+    directory = os.path.join(cache_dir, cache_key(digest, columns))
+    if os.path.isdir(directory):
+        os.utime(directory)  # most recently used survives prune()
+        return FeatureMatrix(directory)
+    matrix = build(path, directory, columns, chunksize, digest)
+    prune(cache_dir=cache_dir)
+    return matrix
+
+
+def touch_rows(matrix, bounds):
+    # a worker's share of the bench: sums its rows straight from the mapped pages
+    start, stop = bounds
+    return float(matrix.X[start:stop].sum(dtype=np.float64))
+
+
+def bench(path, workers):
+    from concurrent.futures import ProcessPoolExecutor
+    features = model_features()
+    start = time.perf_counter()
+    frame = storage.read_view(columns=features + [LABEL], path=path)
+    X, y = frame[features].to_numpy(dtype=np.float32), frame[LABEL].to_numpy()
+    parse_secs = time.perf_counter() - start
+    start = time.perf_counter()
+    matrix = load(path)
+    first_secs = time.perf_counter() - start
+    start = time.perf_counter()
+    matrix = load(path)
+    open_secs = time.perf_counter() - start
+    assert np.array_equal(matrix.X, X) and np.array_equal(matrix.labels(), y)
+    print(f'{len(matrix):,} rows x {len(features)} features ({matrix.X.nbytes / 2**20:.1f} MB as float32)')
+    print(f'parse the view into X, y: {parse_secs:.2f}s | cache lookup (first run builds): {first_secs:.2f}s | '
+          f'cached open (content hash + map): {open_secs:.3f}s')
+    print(f'pickled per worker task: DataFrame {len(pickle.dumps(frame[features])) / 2**20:.1f} MB, '
+          f'FeatureMatrix {len(pickle.dumps(matrix))} bytes')
+    step = -(-len(matrix) // (workers or os.cpu_count()))
+    bounds = [(s, min(s + step, len(matrix))) for s in range(0, len(matrix), step)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        total = sum(pool.map(touch_rows, [matrix] * len(bounds), bounds))
+        pool_secs = time.perf_counter() - start
+    print(f'{len(bounds)} pool tasks read every row from the shared mapping in {pool_secs:.3f}s '
+          f'(sum {total:.6g}, in-process {X.sum(dtype=np.float64):.6g})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['build', 'info', 'clear', 'bench'])
+    parser.add_argument('--input', default=None, help='view to cache (default: the view the trainer reads)')
+    parser.add_argument('--workers', type=int, default=None, help='with bench, pool size (default: one per CPU)')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        matrix = load(args.input)
+        print(f"{matrix.meta['source']}: {len(matrix):,} rows x {len(matrix.features)} features in "
+              f'{time.perf_counter() - start:.2f}s -> {matrix.directory}')
+    elif args.command == 'info':
+        for directory in entries():
+            matrix = FeatureMatrix(directory)
+            print(f"{directory}: {matrix.meta['source']} ({matrix.meta['digest'][:12]}), {len(matrix):,} rows x "
+                  f"{len(matrix.features)} features, labeled={matrix.labeled}, created {matrix.meta['created']}")
+    elif args.command == 'clear':
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    else:
+        bench(args.input or storage.view_path(), args.workers)
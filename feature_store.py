@@ -0,0 +1,255 @@
+"""
+Local feature store for the modeling view: a SQLite file keyed on Application_ID and Applicant_ID.
+
+Each sync stores the view's rows (engineered features, buckets, points, PD_hat, Grade, and the source
+attributes and dates) in two tables:
+    current     the latest version of every application, indexed on Application_ID and on
+                (Applicant_ID, Application_ID), for point lookups and range scans
+    history     every version ever synced, stamped with recorded_at (when it was synced) and its
+                source Application_Date, for point-in-time reads; removed applications get a tombstone
+Only applications whose row content changed since the last sync are written.
+
+Reads return the same frames as storage.read_view: compact dtypes, Risk_Profile derived on request.
+Scripts that read the view through storage.read_view (the trainer, applicant_analysis.py, the
+dashboard) read the store instead when MODELING_VIEW points at it:
+    MODELING_VIEW=feature_store.sqlite python train_credit_risk_model.py
+
+Usage:
+    python feature_store.py sync [--view modeling_view_with_risk]      # or build_modeling_view.py --feature-store
+    python feature_store.py get --applicant-id 1001 [--as-of 2023-06-30]
+    python feature_store.py scan --start 1001 --end 1100
+    python feature_store.py bench [--lookups 1000]                   # lookup latency vs loading the view file
+"""
+
+import argparse
+import datetime
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+store_path = 'feature_store.sqlite'
+
+# SQLite allows 999 bound parameters per statement in older builds
+MAX_PARAMS = 900
+
+
+class FeatureStore:
+    def __init__(self, path=store_path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.schema = storage.view_schema()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def tables(self):
+        return {r[0] for r in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    def stored_columns(self):
+        return [r[1] for r in self.conn.execute('PRAGMA table_info(current)')
+                if r[1] not in ('view_row', 'recorded_at', 'row_hash')]
+
+    def sync(self, view, recorded_at=None):
+        """
+        Store a modeling view (any layout storage writers accept); returns (written, removed) counts.
+        Rows are compared by content hash with the current versions.
+        """
+        frame = storage.prepare_frame(storage.stored_frame(view, self.schema), self.schema)
+        # one dtype per kind, so the row hashes do not depend on how compact the given frame was
+        frame = frame.astype({c: object if isinstance(t, pd.CategoricalDtype) else 'int64'
+                              for c, t in frame.dtypes.items()
+                              if isinstance(t, pd.CategoricalDtype) or (isinstance(t, np.dtype) and t.kind in 'iu')})
+        frame = frame.reset_index(drop=True)
+        # CSV round trips can move a float's last bit, which is not a change
+        floats = frame.select_dtypes('float').columns
+        row_hash = pd.util.hash_pandas_object(frame.assign(**{c: frame[c].round(10) for c in floats}), index=False)
+        row_hash = row_hash.to_numpy().view('int64')
+        recorded_at = recorded_at or datetime.datetime.now().isoformat(timespec='microseconds')
+        positions = pd.DataFrame({'Application_ID': frame['Application_ID'], 'view_row': np.arange(len(frame))})
+
+        if 'current' in self.tables():
+            if self.stored_columns() != list(frame.columns):
+                raise ValueError(f'{self.path} holds different view columns; delete it to rebuild the store')
+            stored = pd.read_sql_query('SELECT Application_ID, row_hash FROM current', self.conn)
+        else:
+            stored = pd.DataFrame({'Application_ID': pd.Series(dtype='int64'), 'row_hash': pd.Series(dtype='int64')})
+        previous = pd.Series(stored['row_hash'].to_numpy(), index=stored['Application_ID'].to_numpy())
+        changed = previous.reindex(frame['Application_ID']).to_numpy() != row_hash
+        removed = np.setdiff1d(previous.index.to_numpy(), frame['Application_ID'].to_numpy())
+
+        rows = frame[changed].assign(view_row=np.flatnonzero(changed), recorded_at=recorded_at,
+                                     row_hash=row_hash[changed])
+        with self.conn:
+            if removed.size:
+                pd.DataFrame({'Application_ID': removed}).to_sql('_removed', self.conn, if_exists='replace', index=False)
+                self.conn.execute(
+                    'INSERT INTO history (Application_ID, Applicant_ID, Application_Date, recorded_at, deleted) '
+                    'SELECT Application_ID, Applicant_ID, Application_Date, ?, 1 FROM current '
+                    'WHERE Application_ID IN (SELECT Application_ID FROM _removed)', (recorded_at,))
+                self.conn.execute('DELETE FROM current WHERE Application_ID IN (SELECT Application_ID FROM _removed)')
+                self.conn.execute('DROP TABLE _removed')
+            rows[['Application_ID']].to_sql('_replaced', self.conn, if_exists='replace', index=False)
+            if 'current' in self.tables():
+                self.conn.execute('DELETE FROM current WHERE Application_ID IN (SELECT Application_ID FROM _replaced)')
+            rows.drop(columns=['view_row', 'row_hash']).assign(deleted=0).to_sql('history', self.conn, if_exists='append', index=False)
+            rows[['view_row'] + list(frame.columns) + ['recorded_at', 'row_hash']] \
+                .to_sql('current', self.conn, if_exists='append', index=False)
+            # unchanged rows keep their version but follow the view's current row order
+            positions.to_sql('_positions', self.conn, if_exists='replace', index=False)
+            self.conn.execute('UPDATE current SET view_row = p.view_row FROM _positions p '
+                              'WHERE p.Application_ID = current.Application_ID AND p.view_row != current.view_row')
+            self.conn.execute('DROP TABLE _replaced')
+            self.conn.execute('DROP TABLE _positions')
+            self.conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS current_application ON current (Application_ID)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS current_applicant ON current (Applicant_ID, Application_ID)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS current_recorded ON current (recorded_at)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS history_application ON history (Application_ID, recorded_at)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS history_recorded ON history (recorded_at)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS history_point_in_time '
+                              'ON history (Applicant_ID, Application_Date, Application_ID, recorded_at)')
+        return int(changed.sum()), int(removed.size)
+
+    def query(self, sql, params, columns, compact=True):
+        """Run a SELECT over current/history columns and return it like storage.read_view."""
+        read_columns = storage.view_read_columns(columns) or self.stored_columns()
+        cols = ', '.join(f'"{c}"' for c in read_columns)
+        cursor = self.conn.execute(sql.format(cols=cols), params)
+        frame = pd.DataFrame.from_records(cursor.fetchall(), columns=[d[0] for d in cursor.description])
+        return storage.finish_view(storage.apply_categories(frame, self.schema), columns, compact)
+
+    def read(self, columns=None, compact=True):
+        """The whole current view, in the row order of the last synced view."""
+        return self.query('SELECT {cols} FROM current ORDER BY view_row', (), columns, compact)
+
+    def get(self, applicant_ids=None, application_ids=None, columns=None, compact=False):
+        """
+        Point lookup of the current rows of some applicants or applications. Not compacted by default:
+        for a handful of rows the dtype conversion costs more than it saves.
+        """
+        key, ids = ('Applicant_ID', applicant_ids) if applicant_ids is not None else ('Application_ID', application_ids)
+        ids = [int(i) for i in np.atleast_1d(ids)]
+        parts = [self.query(f'SELECT {{cols}} FROM current WHERE {key} IN ({", ".join("?" * len(batch))}) '
+                            'ORDER BY Applicant_ID, Application_ID', batch, columns, compact)
+                 for batch in (ids[i:i + MAX_PARAMS] for i in range(0, len(ids), MAX_PARAMS))]
+        return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+    def scan(self, start=None, end=None, columns=None, batch_size=50_000):
+        """Yield the current rows with start <= Applicant_ID <= end in Applicant_ID order, batch_size at a time."""
+        low = (-2**63, -2**63) if start is None else (int(start), -2**63)
+        high = 2**63 - 1 if end is None else int(end)
+        read_columns = None if columns is None else list(dict.fromkeys(columns + ['Applicant_ID', 'Application_ID']))
+        while True:
+            # keyset pagination: each batch resumes after the last (Applicant_ID, Application_ID) seen
+            batch = self.query('SELECT {cols} FROM current WHERE (Applicant_ID, Application_ID) > (?, ?) '
+                               'AND Applicant_ID <= ? ORDER BY Applicant_ID, Application_ID LIMIT ?',
+                               (*low, high, batch_size), read_columns)
+            if batch.empty:
+                return
+            low = (int(batch['Applicant_ID'].iloc[-1]), int(batch['Application_ID'].iloc[-1]))
+            yield batch if columns is None else batch[columns]
+            if len(batch) < batch_size:
+                return
+
+    def last_recorded(self):
+        """recorded_at of the latest sync that wrote or removed anything (None for an empty store)."""
+        if 'history' not in self.tables():
+            return None
+        return self.conn.execute('SELECT MAX(recorded_at) FROM history').fetchone()[0]
+
+    def changes(self, since, columns=None):
+        """
+        What syncs after `since` (a recorded_at) changed: the current rows they wrote, and the
+        Application_IDs they removed that have not come back since.
+        """
+        rows = self.query('SELECT {cols} FROM current WHERE recorded_at > ? ORDER BY view_row', (since,), columns)
+        removed = [r[0] for r in self.conn.execute(
+            'SELECT DISTINCT Application_ID FROM history WHERE deleted = 1 AND recorded_at > ? '
+            'AND Application_ID NOT IN (SELECT Application_ID FROM current)', (since,))]
+        return rows, removed
+
+    def as_of(self, date, applicant_ids=None, known_at=None, columns=None):
+        """
+        Point-in-time view: each applicant's latest application dated on or before date, in the version
+        that was current at known_at (default: the latest synced). Applications removed by then are skipped.
+        """
+        where, params = ['Application_Date <= ?'], [str(date)]
+        if known_at is not None:
+            where.append('recorded_at <= ?')
+            params.append(str(known_at))
+        if applicant_ids is not None:
+            ids = [int(i) for i in np.atleast_1d(applicant_ids)]
+            where.append(f'Applicant_ID IN ({", ".join("?" * len(ids))})')
+            params += ids
+        sql = ('SELECT {cols} FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY Application_ID ORDER BY recorded_at DESC) '
+               f'AS version FROM history WHERE {" AND ".join(where)}) WHERE version = 1 AND deleted = 0')
+        latest = self.query(sql, params, None if columns is None else
+                            list(dict.fromkeys(columns + ['Applicant_ID', 'Application_Date', 'Application_ID'])))
+        latest = latest.sort_values(['Applicant_ID', 'Application_Date', 'Application_ID'])
+        latest = latest.drop_duplicates('Applicant_ID', keep='last').reset_index(drop=True)
+        return latest if columns is None else latest[columns]
+
+
+def bench(store, lookups, view=storage.VIEW_PATH):
+    ids = store.read(columns=['Applicant_ID'])['Applicant_ID'].to_numpy()
+    chosen = np.random.default_rng(0).choice(ids, min(lookups, len(ids)))
+    start = time.perf_counter()
+    frame = storage.read_view(path=view)
+    load_secs = time.perf_counter() - start
+    latencies = []
+    for applicant_id in chosen:
+        start = time.perf_counter()
+        store.get(applicant_ids=[applicant_id])
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    start = time.perf_counter()
+    scanned = sum(len(batch) for batch in store.scan(columns=['Applicant_ID', 'DTI', 'LTV', 'PD_hat', 'Grade']))
+    scan_secs = time.perf_counter() - start
+    print(f'{len(frame):,} applications')
+    print(f'load the whole view file: {load_secs * 1000:.0f} ms')
+    print(f'store point lookup (all columns): p50 {np.percentile(latencies, 50):.2f} ms, '
+          f'p99 {np.percentile(latencies, 99):.2f} ms over {len(chosen):,} lookups')
+    print(f'store range scan (5 columns): {scanned / scan_secs:,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['sync', 'get', 'scan', 'bench'])
+    parser.add_argument('--store', default=store_path)
+    parser.add_argument('--view', default=storage.VIEW_PATH, help='modeling view to sync from')
+    parser.add_argument('--applicant-id', type=int, nargs='+')
+    parser.add_argument('--as-of', help='with get: point-in-time as of this application date (YYYY-MM-DD)')
+    parser.add_argument('--start', type=int)
+    parser.add_argument('--end', type=int)
+    parser.add_argument('--columns', nargs='+', default=['Application_ID', 'Applicant_ID', 'Application_Date', 'DTI',
+                                                          'LTV', 'Total_Points', 'PD_hat', 'Grade', 'Risk_Profile'])
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+
+    with FeatureStore(args.store) as store:
+        if args.command == 'sync':
+            start = time.perf_counter()
+            written, removed = store.sync(storage.read_table(args.view))
+            print(f'{args.store}: {written:,} applications written, {removed:,} removed '
+                  f'({time.perf_counter() - start:.1f}s)')
+        elif args.command == 'get':
+            if args.as_of:
+                rows = store.as_of(args.as_of, args.applicant_id, columns=args.columns)
+            else:
+                rows = store.get(applicant_ids=args.applicant_id, columns=args.columns)
+            print(rows.to_string(index=False))
+        elif args.command == 'scan':
+            for batch in store.scan(args.start, args.end, args.columns):
+                print(batch.to_string(index=False))
+        else:
+            bench(store, args.lookups, args.view)
@@ -0,0 +1,159 @@
+"""
+Incremental rebuild of the modeling view.
+
+The state directory keeps, from the previous build:
+    row_hashes.pkl   per source sheet, a hash of every row indexed by its join key
+    raw_view.pkl     the merged, feature-engineered view before missing values are filled
+    view.pkl         the final scored view (what the output file contains)
+    meta.pkl         the fill medians and each application's position in the loan sheet
+
+On the next build every source row is re-hashed and compared with the stored hashes.
+A loan application is recomputed (merge, target, features, fill and points) when any of these hold:
+    - its own loan row, or a satellite row it joins to, was added, changed or deleted;
+    - its position in the loan sheet moved, because Default_12m draws seed(42) random numbers by row
+      position;
+    - a global median changed, and the row has a missing value in that column.
+Every other row is copied from the stored view. Medians are always recomputed over the whole
+stored raw view, a vectorized column pass, so fills match a full rebuild. Period depends only on
+each row's Application_Date, so recomputed rows land in the same split a full rebuild gives them.
+
+build_view_incremental(verify=True) also runs a full rebuild and asserts the two views are identical.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import build_modeling_view as bmv
+
+STATE_DIR = '.modeling_view_state'
+LOAN_KEYS = ['Application_ID']
+
+
+def source_keys(name):
+    return LOAN_KEYS if name == 'loan' else dict(bmv.joins)[name]
+
+
+def key_index(frame, keys):
+    return pd.MultiIndex.from_frame(frame[keys]) if len(keys) > 1 else pd.Index(frame[keys[0]])
+
+
+def row_hashes(frame, keys):
+    """Hash each row, indexed by its key. Numbers hash by value so an int column turning float does not flag every row."""
+    normalized = frame.copy()
+    for col in normalized.columns:
+        if pd.api.types.is_bool_dtype(normalized[col]):
+            normalized[col] = normalized[col].astype(object)
+        elif pd.api.types.is_numeric_dtype(normalized[col]):
+            normalized[col] = normalized[col].astype('float64')
+    hashes = pd.Series(pd.util.hash_pandas_object(normalized, index=False).to_numpy(), index=key_index(frame, keys))
+    if not hashes.index.is_unique:
+        raise ValueError(f'{"/".join(keys)} is not unique in the {"loan" if keys == LOAN_KEYS else "satellite"} sheet; '
+                         'rows cannot be tracked incrementally')
+    return hashes
+
+
+def changed_keys(new, old):
+    """Keys added, changed or deleted between two hash Series."""
+    changed = new.index[new.ne(old.reindex(new.index)).to_numpy()]
+    return changed.append(old.index.difference(new.index))
+
+
+def conform_dtypes(raw, df):
+    """Give merged sheet columns the dtype a full rebuild would: the sheet's dtype, widened where values are missing."""
+    for name in ['loan'] + [n for n, _ in bmv.joins]:
+        for col, dtype in df[name].dtypes.items():
+            if col not in raw.columns:
+                continue
+            has_na = raw[col].isna().any()
+            if pd.api.types.is_bool_dtype(dtype):
+                target = np.dtype(object) if has_na else dtype
+            elif pd.api.types.is_integer_dtype(dtype):
+                target = np.dtype('float64') if has_na else dtype
+            else:
+                target = dtype
+            if raw[col].dtype != target:
+                raw[col] = raw[col].astype(target)
+    return raw
+
+
+def raw_rows(df, loan, draws):
+    """Merge, target and feature-engineer a subset of loan rows (before missing-value fill)."""
+    model = bmv.merge_sources({**df, 'loan': loan})
+    model = bmv.add_target_and_period(model, draws=draws)
+    return bmv.engineer_features(model)
+
+
+def load_state(state_dir):
+    names = ['row_hashes', 'raw_view', 'view', 'meta']
+    if not all(os.path.exists(os.path.join(state_dir, f'{n}.pkl')) for n in names):
+        return None
+    return {n: pd.read_pickle(os.path.join(state_dir, f'{n}.pkl')) for n in names}
+
+
+def save_state(state_dir, hashes, raw, view, medians, positions):
+    os.makedirs(state_dir, exist_ok=True)
+    pd.to_pickle(hashes, os.path.join(state_dir, 'row_hashes.pkl'))
+    pd.to_pickle(raw, os.path.join(state_dir, 'raw_view.pkl'))
+    pd.to_pickle(view, os.path.join(state_dir, 'view.pkl'))
+    pd.to_pickle({'medians': medians, 'positions': positions}, os.path.join(state_dir, 'meta.pkl'))
+
+
+def build_view_incremental(df, state_dir=STATE_DIR, verify=False):
+    """Return (view, number of recomputed rows, fill medians), updating the state directory."""
+    loan = df['loan']
+    hashes = {name: row_hashes(frame, source_keys(name)) for name, frame in df.items()}
+    positions = pd.Series(np.arange(len(loan)), index=pd.Index(loan['Application_ID']))
+    draws = np.random.RandomState(42).rand(len(loan))
+    state = load_state(state_dir)
+
+    if state is None:
+        # No previous build: everything is new
+        raw = raw_rows(df, loan, draws).set_index('Application_ID', drop=False)
+        raw.index.name = None
+        medians = bmv.numeric_medians(raw)
+        view = bmv.apply_scorecard(bmv.fill_missing(raw.copy(), medians))
+        dirty_count = len(view)
+    else:
+        # Applications touched by a changed source row, or whose draw position moved
+        dirty = pd.Series(False, index=positions.index)
+        for name, new in hashes.items():
+            keys = source_keys(name)
+            affected = changed_keys(new, state['row_hashes'].get(name, pd.Series(dtype='uint64')))
+            if len(affected):
+                dirty |= key_index(loan, keys).isin(affected)
+        old_positions = state['meta']['positions']
+        dirty |= old_positions.reindex(positions.index).ne(positions).to_numpy()
+
+        # Update the raw view: keep clean rows, recompute dirty ones, follow the current loan order
+        recomputed = raw_rows(df, loan[dirty.to_numpy()], draws[dirty.to_numpy()])
+        recomputed.index = pd.Index(recomputed['Application_ID'])
+        kept = state['raw_view'].loc[state['raw_view'].index.intersection(dirty.index[~dirty])]
+        raw = pd.concat([kept, recomputed]).reindex(positions.index)
+        raw.index.name = None
+        raw = conform_dtypes(raw, df)
+
+        # Medians over the whole raw view; rows with a gap in a column whose median moved are dirty too
+        medians = bmv.numeric_medians(raw)
+        old_medians = state['meta']['medians']
+        moved = [c for c, m in medians.items() if not (m == old_medians.get(c) or (pd.isna(m) and pd.isna(old_medians.get(c))))]
+        if moved:
+            dirty |= raw[moved].isna().any(axis=1).to_numpy()
+
+        rescored = bmv.apply_scorecard(bmv.fill_missing(raw.loc[dirty.to_numpy()].copy(), medians))
+        kept_view = state['view'].loc[state['view'].index.intersection(dirty.index[~dirty])]
+        view = pd.concat([kept_view, rescored]).reindex(positions.index)
+        for col in raw.columns:
+            if view[col].dtype != raw[col].dtype:
+                view[col] = view[col].astype(raw[col].dtype)
+        for col in rescored.columns.difference(raw.columns):
+            if view[col].dtype != rescored[col].dtype:
+                view[col] = view[col].astype(rescored[col].dtype)
+        dirty_count = int(dirty.sum())
+
+    save_state(state_dir, hashes, raw, view, medians, positions)
+    view = view.reset_index(drop=True)
+    if verify:
+        pd.testing.assert_frame_equal(view, bmv.build_view(df))
+    return view, dirty_count, medians
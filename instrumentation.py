@@ -0,0 +1,144 @@
+"""
+Stage timing and memory instrumentation for the pipeline scripts.
+
+Off by default: stage() then returns a shared no-op context manager, so instrumented code pays one
+global lookup per stage. It is switched on by a script's --profile REPORT flag, or by setting
+PIPELINE_PROFILE=REPORT in the environment.
+
+When on, every stage records:
+    wall_s        elapsed wall-clock seconds
+    cpu_s         process CPU seconds (all threads)
+    rss_mb        resident set size at the end of the stage
+    rss_delta_mb  change in resident set size over the stage
+    peak_rss_mb   process peak RSS so far (a stage raised the peak if this grew past the previous row's)
+    rows          row count, when the stage sets one
+
+Stages nest; a nested stage is named parent/child. At exit the run is written to REPORT:
+a .json file gets one document per run (overwritten), a .csv file gets the run's stages appended with
+a run timestamp and script name, so nightly runs can be trended from one file.
+
+    with instrumentation.stage('merge') as s:
+        model = merge_sources(df)
+        s.rows = len(model)
+"""
+
+import atexit
+import csv
+import datetime
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+_run = None
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+
+class _NullStage:
+    # reads as 0 so `stage.rows += n` works while disabled; writes are dropped
+    rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+class Stage:
+    def __init__(self, run, name, rows=None):
+        self.run = run
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.run.stack.append(self.name)
+        self.path = '/'.join(self.run.stack)
+        self.rss = current_rss_mb()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        rss = current_rss_mb()
+        self.run.stack.pop()
+        self.run.stages.append({
+            'stage': self.path, 'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6),
+            'rss_mb': round(rss, 1), 'rss_delta_mb': round(rss - self.rss, 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1), 'rows': self.rows,
+        })
+        return False
+
+
+class Run:
+    def __init__(self, report_path):
+        self.report_path = report_path
+        self.stack = []
+        self.stages = []
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.script = os.path.basename(sys.argv[0])
+        self.wall = time.perf_counter()
+
+    def stage(self, name, rows=None):
+        return Stage(self, name, rows)
+
+    def write(self):
+        total = round(time.perf_counter() - self.wall, 6)
+        if self.report_path.endswith('.csv'):
+            new = not os.path.exists(self.report_path)
+            fields = ['run_started', 'script', 'stage', 'wall_s', 'cpu_s', 'rss_mb', 'rss_delta_mb',
+                      'peak_rss_mb', 'rows']
+            with open(self.report_path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                if new:
+                    writer.writeheader()
+                for row in self.stages + [{'stage': 'total', 'wall_s': total, 'peak_rss_mb': round(peak_rss_mb(), 1)}]:
+                    writer.writerow({'run_started': self.started, 'script': self.script, **row})
+        else:
+            report = {
+                'run_started': self.started, 'script': self.script, 'argv': sys.argv[1:],
+                'python': platform.python_version(), 'host': platform.node(),
+                'total_wall_s': total, 'peak_rss_mb': round(peak_rss_mb(), 1), 'stages': self.stages,
+            }
+            with open(self.report_path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+
+def enable(report_path=None):
+    """Start recording stages, written to report_path (or $PIPELINE_PROFILE) at exit. No-op without a path."""
+    global _run
+    report_path = report_path or os.environ.get('PIPELINE_PROFILE')
+    if not report_path or _run is not None:
+        return
+    _run = Run(report_path)
+    atexit.register(_run.write)
+
+
+def stage(name, rows=None):
+    """Context manager timing one named stage; set .rows on it to record a row count."""
+    if _run is None:
+        return NULL_STAGE
+    return _run.stage(name, rows)
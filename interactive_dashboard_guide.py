@@ -7,11 +7,13 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 
+import chart_data
+from chart_data import MAX_POINTS
+
 # Sample data structure for demonstration
-def create_sample_credit_data():
+def create_sample_credit_data(n_customers=1000):
     """Create sample credit risk data for demonstration."""
     np.random.seed(42)
-    n_customers = 1000
     
     data = {
         'customer_id': range(1, n_customers + 1),
@@ -36,8 +38,32 @@ def create_sample_credit_data():
 # PLOTLY - Main Interactive Charts (Best Streamlit Integration)
 # =============================================================================
 
-def create_risk_distribution_chart(df):
+def create_risk_distribution_chart(df, max_points=MAX_POINTS):
     """Interactive Risk Distribution with Hover Details"""
+    import plotly.graph_objects as go
+    
+    if len(df) <= max_points:
+        return risk_scatter(df, "Credit Risk Analysis - Interactive Scatter Plot")
+    
+    # Large portfolios: a density heatmap of every customer, with a sample on top that keeps
+    # the high-risk tail; row details for a selected box come from chart_data.rows_in_box
+    grid = chart_data.DensityGrid(df, 'credit_score', 'income', value='risk_score')
+    sample = chart_data.sample_points(df, max_points, tail_column='risk_score', strata='risk_category')
+    fig = risk_scatter(sample, f"Credit Risk Analysis - {len(df):,} customers "
+                               f"(density, {len(sample):,} shown individually)", webgl=True)
+    fig.add_trace(go.Heatmap(
+        x=grid.x_centers(), y=grid.y_centers(),
+        z=np.where(grid.counts > 0, grid.counts, np.nan), customdata=grid.means,
+        colorscale='Greys', showscale=False, opacity=0.6, name='Customers',
+        hovertemplate="Credit Score: %{x:.0f}<br>Income: $%{y:,.0f}<br>" +
+                      "Customers: %{z:,}<br>Avg Risk: %{customdata:.3f}<extra></extra>"
+    ))
+    # draw the heatmap underneath the points
+    fig.data = fig.data[-1:] + fig.data[:-1]
+    return fig
+
+def risk_scatter(df, title, webgl=False):
+    """One marker per customer, with the customer's details on hover."""
     import plotly.express as px
     
     fig = px.scatter(df, 
@@ -51,7 +77,8 @@ def create_risk_distribution_chart(df):
                         'employment_years': True,
                         'loan_purpose': True
                     },
-                    title="Credit Risk Analysis - Interactive Scatter Plot",
+                    title=title,
+                    render_mode='webgl' if webgl else 'auto',
                     labels={
                         'credit_score': 'Credit Score',
                         'income': 'Annual Income ($)',
@@ -126,10 +153,13 @@ def create_risk_metrics_dashboard(df):
 # ALTAIR - Statistical Analysis Views
 # =============================================================================
 
-def create_statistical_analysis_chart(df):
+def create_statistical_analysis_chart(df, max_points=MAX_POINTS):
     """Interactive Selection and Filtering with Altair"""
     import altair as alt
     
+    if len(df) > max_points:
+        return binned_statistical_analysis_chart(df)
+    
     # Enable Altair to render in Streamlit
     alt.data_transformers.enable('json')
     
@@ -166,6 +196,45 @@ def create_statistical_analysis_chart(df):
     chart = (hist | scatter)
     return chart
 
+def binned_statistical_analysis_chart(df):
+    """The same two views from pre-aggregated bins, so the spec carries bins instead of rows."""
+    import altair as alt
+    
+    # a few hundred bins fit inline; the json transformer would write every row to disk
+    alt.data_transformers.enable('default')
+    
+    hist_data = chart_data.histogram(df, 'credit_score', bins=30, by='risk_category')
+    hist = alt.Chart(hist_data).mark_bar().encode(
+        alt.X('bin_start:Q', title='credit_score (binned)'),
+        alt.X2('bin_end:Q'),
+        alt.Y('sum(count):Q', title='Count of Records'),
+        alt.Color('risk_category:N'),
+        tooltip=['risk_category:N', 'bin_start:Q', 'bin_end:Q', 'count:Q']
+    ).properties(
+        width=300,
+        height=200,
+        title='Credit Score Distribution by Risk'
+    )
+    
+    grid = chart_data.DensityGrid(df, 'income', 'loan_amount', bins=40, value='risk_score',
+                                  log_x=True, log_y=True)
+    density = alt.Chart(grid.cells()).mark_rect().encode(
+        alt.X('x_start:Q', title='income', scale=alt.Scale(type='log')),
+        alt.X2('x_end:Q'),
+        alt.Y('y_start:Q', title='loan_amount', scale=alt.Scale(type='log')),
+        alt.Y2('y_end:Q'),
+        alt.Color('mean:Q', title='avg risk_score', scale=alt.Scale(scheme='viridis')),
+        tooltip=[alt.Tooltip('count:Q', title='customers'), alt.Tooltip('mean:Q', title='avg risk', format='.3f')]
+    ).add_params(
+        alt.selection_interval(bind='scales')
+    ).properties(
+        width=300,
+        height=200,
+        title=f'Income vs Loan Amount (Log Scale, {len(df):,} customers binned)'
+    )
+    
+    return hist | density
+
 def create_correlation_heatmap(df):
     """Correlation Matrix Heatmap with Altair"""
     import altair as alt
@@ -194,54 +263,74 @@ def create_correlation_heatmap(df):
 # BOKEH - Advanced Real-time Monitoring Dashboards
 # =============================================================================
 
+def realtime_risk_monitor(df, max_points=MAX_POINTS):
+    """Real-time Risk Monitoring with Advanced Hover"""
+    from bokeh.plotting import figure
+    from bokeh.models import HoverTool, ColorBar, LinearColorMapper
+    from bokeh.palettes import Greys256, Viridis256
+    from bokeh.transform import transform
+    
+    # Create color mapper
+    color_mapper = LinearColorMapper(palette=Viridis256, 
+                                   low=df['risk_score'].min(), 
+                                   high=df['risk_score'].max())
+    
+    # Create figure
+    p = figure(title="Real-time Credit Risk Monitor",
+              x_axis_label='Credit Score',
+              y_axis_label='Debt-to-Income Ratio',
+              width=700, height=500)
+    
+    points = df
+    if len(df) > max_points:
+        # every customer goes into a density image; only a sample keeping the high-risk tail is sent as points
+        grid = chart_data.DensityGrid(df, 'credit_score', 'debt_to_income')
+        x0, x1 = grid.x_edges[0], grid.x_edges[-1]
+        y0, y1 = grid.y_edges[0], grid.y_edges[-1]
+        density = LinearColorMapper(palette=Greys256[::-1], low=1, high=max(grid.counts.max(), 2),
+                                    low_color=(0, 0, 0, 0))
+        p.image(image=[grid.counts], x=x0, y=y0, dw=x1 - x0, dh=y1 - y0, color_mapper=density, alpha=0.6)
+        points = chart_data.sample_points(df, max_points, tail_column='risk_score', strata='risk_category')
+        p.title.text += f" ({len(df):,} customers, {len(points):,} shown individually)"
+    
+    # Marker size follows the loan amount
+    amount = np.log(points['loan_amount'])
+    span = max(amount.max() - amount.min(), 1e-9)
+    points = points.assign(loan_amount_scaled=4 + 12 * (amount - amount.min()) / span)
+    
+    # Add circle markers
+    circles = p.scatter('credit_score', 'debt_to_income', 
+                        marker='circle',
+                        size='loan_amount_scaled',
+                        color=transform('risk_score', color_mapper),
+                        alpha=0.7,
+                        source=points)
+    
+    # Advanced hover tool (points only; the density image has no per-row data)
+    hover = HoverTool(renderers=[circles], tooltips=[
+        ("Customer ID", "@customer_id"),
+        ("Credit Score", "@credit_score"),
+        ("Income", "$@income{0,0}"),
+        ("Loan Amount", "$@loan_amount{0,0}"),
+        ("Risk Score", "@risk_score{0.000}"),
+        ("Risk Category", "@risk_category"),
+        ("Employment Years", "@employment_years"),
+        ("Loan Purpose", "@loan_purpose"),
+        ("Region", "@region")
+    ])
+    
+    p.add_tools(hover)
+    
+    # Add color bar
+    color_bar = ColorBar(color_mapper=color_mapper, width=8, location=(0,0))
+    p.add_layout(color_bar, 'right')
+    
+    return p
+
 def bokeh_examples():
     """Examples of Bokeh charts for real-time monitoring."""
     
-    # 1. Real-time Risk Monitoring with Advanced Hover
-    def realtime_risk_monitor(df):
-        from bokeh.plotting import figure
-        from bokeh.models import HoverTool, ColorBar, LinearColorMapper
-        from bokeh.palettes import Viridis256
-        from bokeh.transform import transform
-        
-        # Create color mapper
-        color_mapper = LinearColorMapper(palette=Viridis256, 
-                                       low=df['risk_score'].min(), 
-                                       high=df['risk_score'].max())
-        
-        # Create figure
-        p = figure(title="Real-time Credit Risk Monitor",
-                  x_axis_label='Credit Score',
-                  y_axis_label='Debt-to-Income Ratio',
-                  width=700, height=500)
-        
-        # Add circle markers
-        circles = p.circle('credit_score', 'debt_to_income', 
-                          size='loan_amount_scaled',
-                          color=transform('risk_score', color_mapper),
-                          alpha=0.7,
-                          source=df)
-        
-        # Advanced hover tool
-        hover = HoverTool(tooltips=[
-            ("Customer ID", "@customer_id"),
-            ("Credit Score", "@credit_score"),
-            ("Income", "$@income{0,0}"),
-            ("Loan Amount", "$@loan_amount{0,0}"),
-            ("Risk Score", "@risk_score{0.000}"),
-            ("Risk Category", "@risk_category"),
-            ("Employment Years", "@employment_years"),
-            ("Loan Purpose", "@loan_purpose"),
-            ("Region", "@region")
-        ])
-        
-        p.add_tools(hover)
-        
-        # Add color bar
-        color_bar = ColorBar(color_mapper=color_mapper, width=8, location=(0,0))
-        p.add_layout(color_bar, 'right')
-        
-        return p
+    # 1. Real-time Risk Monitoring with Advanced Hover: see realtime_risk_monitor() above
     
     # 2. Interactive Dashboard with Widgets
     def interactive_dashboard_with_widgets():
@@ -314,21 +403,76 @@ def plotnine_examples():
         
         return p2
 
+# =============================================================================
+# PORTFOLIO VIEW - Pre-aggregated Cube over the Modeling View
+# =============================================================================
+
+@st.cache_resource
+def portfolio_cube_cache():
+    """One cube per server process; see portfolio_cube.py."""
+    from portfolio_cube import CubeCache
+    return CubeCache()
+
+def portfolio_section():
+    """PD and exposure by Grade, Loan_Type, Processing_Branch and Period, answered from the cube."""
+    import plotly.express as px
+    from portfolio_cube import DIMENSIONS
+
+    try:
+        # only stats the view file unless it changed; then applies the changed applications
+        cube = portfolio_cube_cache().get()
+    except FileNotFoundError:
+        st.info("Build the modeling view (build_modeling_view.py) to see the portfolio cube.")
+        return
+
+    st.sidebar.header("Portfolio Filters")
+    filters = {}
+    for dim in DIMENSIONS:
+        levels = cube.levels(dim)
+        chosen = st.sidebar.multiselect(dim.replace('_', ' '), levels, default=levels)
+        if len(chosen) < len(levels):
+            filters[dim] = chosen
+    group_by = st.selectbox("Break down by", DIMENSIONS)
+
+    totals = cube.totals(filters)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Applications", f"{int(totals['applications']):,}")
+    with col2:
+        st.metric("Exposure", f"${totals['exposure']:,.0f}")
+    with col3:
+        st.metric("Mean PD", f"{totals['mean_pd']:.2%}" if totals['applications'] else "-")
+    with col4:
+        st.metric("Default Rate", f"{totals['default_rate']:.2%}" if totals['applications'] else "-")
+
+    breakdown = cube.query([group_by], filters).reset_index()
+    fig = px.bar(breakdown, x=group_by, y='exposure', color='mean_pd',
+                 hover_data={'applications': ':,', 'default_rate': ':.2%', 'mean_pd': ':.2%'},
+                 labels={'exposure': 'Exposure ($)', 'mean_pd': 'Mean PD'},
+                 title=f"Exposure and Mean PD by {group_by.replace('_', ' ')}")
+    st.plotly_chart(fig, use_container_width=True)
+
 # =============================================================================
 # STREAMLIT INTEGRATION EXAMPLE
 # =============================================================================
 
+@st.cache_data
+def load_sample_credit_data(n_customers):
+    return create_sample_credit_data(n_customers)
+
 def main_dashboard():
     """Main Streamlit dashboard integrating all visualization libraries."""
     
     st.title("🏦 Interactive Credit Risk Dashboard")
     st.markdown("Dynamic visualizations that change based on customer data")
     
-    # Load data
-    df = create_sample_credit_data()
-    
     # Sidebar filters
     st.sidebar.header("Dashboard Filters")
+    n_customers = st.sidebar.select_slider("Sample Customers", [1_000, 10_000, 100_000, 1_000_000])
+    
+    # Load data
+    df = load_sample_credit_data(n_customers)
+    
     selected_risk = st.sidebar.multiselect("Risk Categories", 
                                           df['risk_category'].unique(),
                                           default=df['risk_category'].unique())
@@ -358,13 +502,30 @@ def main_dashboard():
     # Plotly Charts (Main Interactive)
     st.header("📊 Main Interactive Analysis (Plotly)")
     plotly_fig = create_risk_distribution_chart(filtered_df)
-    st.plotly_chart(plotly_fig, use_container_width=True)
+    if len(filtered_df) <= MAX_POINTS:
+        st.plotly_chart(plotly_fig, use_container_width=True)
+    else:
+        # only sampled points carry hover data; rows under a selected box are fetched on demand
+        event = st.plotly_chart(plotly_fig, use_container_width=True, key="risk_distribution",
+                                on_select="rerun", selection_mode="box")
+        boxes = event.selection.box
+        if boxes:
+            rows = chart_data.rows_in_box(filtered_df, 'credit_score', 'income', boxes[0]['x'], boxes[0]['y'],
+                                          sort_by='risk_score')
+            st.caption(f"Highest-risk customers in the selected box (up to {len(rows)} shown)")
+            st.dataframe(rows, use_container_width=True)
+        else:
+            st.caption("Drag a box on the chart to list the customers inside it, highest risk first.")
     
     # Altair Charts (Statistical Analysis)
     st.header("📈 Statistical Analysis (Altair)")
     altair_chart = create_statistical_analysis_chart(filtered_df)
     st.altair_chart(altair_chart, use_container_width=True)
     
+    # Portfolio cube (filters answered from pre-aggregated cells, not by rescanning rows)
+    st.header("🏦 Portfolio Overview (Cube)")
+    portfolio_section()
+    
     # Real-time updates message
     st.info("💡 All charts update automatically when you change the filters - demonstrating real-time interactivity!")
 
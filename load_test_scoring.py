@@ -0,0 +1,126 @@
+"""
+Load test for scoring_service.py: p50/p99 latency and throughput.
+
+Requests are raw application records taken from the source sheets (loan applications merged with
+their satellite rows, minus the leakage columns), sent one application per request by --concurrency
+client threads, each on its own keep-alive connection.
+
+Usage:
+    python load_test_scoring.py --spawn [--requests 5000] [--concurrency 16]
+    python load_test_scoring.py --url http://127.0.0.1:8080 ...     # against a running service
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+import build_modeling_view as bmv
+
+
+def sample_records():
+    """Raw application records as the origination flow would send them."""
+    merged = bmv.merge_sources(bmv.load_sources())
+    merged = merged.drop(columns=[c for c in bmv.leakage_cols if c in merged.columns])
+    return [json.dumps(r).encode() for r in json.loads(merged.to_json(orient='records'))]
+
+
+def wait_for_service(host, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f'scoring service did not come up on {host}:{port}')
+
+
+def health(host, port):
+    conn = http.client.HTTPConnection(host, port)
+    conn.request('GET', '/health')
+    return json.loads(conn.getresponse().read())
+
+
+def run(host, port, bodies, n_requests, concurrency):
+    """Send n_requests across concurrency threads; returns (latencies in seconds, errors, wall seconds)."""
+    counter = itertools.count()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection(host, port)
+        mine = []
+        while (i := next(counter)) < n_requests:
+            body = bodies[i % len(bodies)]
+            start = time.perf_counter()
+            conn.request('POST', '/score', body, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            payload = response.read()
+            mine.append(time.perf_counter() - start)
+            if response.status != 200:
+                with lock:
+                    errors.append(payload.decode())
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return np.array(latencies), errors, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--spawn', action='store_true', help='start scoring_service.py for the duration of the test')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=100, help='requests sent before measuring')
+    parser.add_argument('--max-batch', type=int, default=64, help='passed to the spawned service')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help='passed to the spawned service')
+    parser.add_argument('--artifact', help='passed to the spawned service (serve a compiled artifact)')
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    host, port = url.hostname, url.port or 80
+    service = None
+    if args.spawn:
+        service = subprocess.Popen([sys.executable, 'scoring_service.py', '--host', host, '--port', str(port),
+                                    '--max-batch', str(args.max_batch), '--max-wait-ms', str(args.max_wait_ms)]
+                                   + (['--artifact', args.artifact] if args.artifact else []))
+    try:
+        wait_for_service(host, port)
+        bodies = sample_records()
+        run(host, port, bodies, args.warmup, args.concurrency)
+        before = health(host, port)
+        latencies, errors, wall = run(host, port, bodies, args.requests, args.concurrency)
+        after = health(host, port)
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+    ms = latencies * 1000
+    batches = after['batches'] - before['batches']
+    print(f'{len(latencies)} requests, {args.concurrency} concurrent clients, {len(errors)} errors')
+    print(f'throughput {len(latencies) / wall:,.0f} req/s over {wall:.2f}s '
+          f'(mean batch {(after["records"] - before["records"]) / max(batches, 1):.1f} records)')
+    print(f'latency ms  p50 {np.percentile(ms, 50):.2f}  p90 {np.percentile(ms, 90):.2f}  '
+          f'p99 {np.percentile(ms, 99):.2f}  max {ms.max():.2f}')
+    if errors:
+        print('first error:', errors[0])
@@ -0,0 +1,280 @@
+"""
+Synthetic source sheets at production scale.
+
+Writes all ten sheets of excel_sheets_csv/ with the exact columns and types of storage.SOURCE_SCHEMAS
+and the same key relationships: one loan application per applicant, Applicant_ID-keyed sheets with
+one row per applicant, Application_ID-keyed sheets with one row per application, and the risk sheet
+keyed by both.
+
+Each applicant gets a latent risk factor that drives credit score, utilization, late payments,
+inquiries, DTI, tenure, Probability_of_Default and the risk grade, so the trainer has signal to find.
+Optional columns (Cross_Sell_Products, Previous_Loan_History, Third_Party_Guarantors) are often
+missing, and --missing blanks that fraction of every other non-key value so the fill logic is exercised.
+
+Applicants are generated and appended in chunks of --chunk-rows to every sheet at once, so memory
+follows the chunk size. Output is deterministic for a given --seed and --chunk-rows.
+
+Usage:
+    python make_synthetic_data.py --applicants 1000000 [--output-dir synthetic_sheets] [--format csv|parquet]
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import build_modeling_view as bmv
+import instrumentation
+import storage
+
+FIRST_APPLICANT_ID = 1001
+FIRST_APPLICATION_ID = 5001
+OPTIONAL_COLUMNS = {'Cross_Sell_Products': 0.3, 'Previous_Loan_History': 0.2, 'Third_Party_Guarantors': 0.3}
+
+
+def choice(rng, n, labels, p=None):
+    return np.asarray(labels, dtype=object)[rng.choice(len(labels), n, p=p)]
+
+
+def numbered(prefix, numbers, width=0, suffix=''):
+    return (prefix + pd.Series(numbers).astype(str).str.zfill(width) + suffix).to_numpy(dtype=object)
+
+
+def dates(days):
+    """ISO date strings from days since 1970-01-01."""
+    return np.asarray(days, dtype='int64').astype('datetime64[D]').astype(str).astype(object)
+
+
+def day(text):
+    return int(np.datetime64(text, 'D').astype('int64'))
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def make_chunk(rng, start, n):
+    """Rows start..start+n-1 of every sheet, as {sheet name: DataFrame}."""
+    i = np.arange(start, start + n)
+    applicant = FIRST_APPLICANT_ID + i
+    application = FIRST_APPLICATION_ID + i
+    risk = rng.standard_normal(n)
+    noise = lambda scale=1.0: rng.normal(0, scale, n)
+
+    app_day = rng.integers(day('2023-01-01'), day('2024-12-31') + 1, n)
+    requested = rng.integers(50_000, 500_001, n)
+    loan = {
+        'Application_ID': application, 'Applicant_ID': applicant,
+        'Loan_Type': choice(rng, n, ['Personal', 'Business', 'Home', 'Auto']),
+        'Requested_Loan_Amount': requested,
+        'Loan_Tenure_Months': rng.choice([12, 24, 36, 60, 120, 180], n),
+        'Interest_Rate_Offered': np.clip(10 + 1.5 * risk + noise(), 6, 16).round(2),
+        'Purpose_of_Loan': choice(rng, n, ['Medical', 'Business Expansion', 'Education', 'Home Purchase']),
+        'Application_Date': dates(app_day),
+        'Application_Source': choice(rng, n, ['Branch', 'Agent', 'Online']),
+        'Processing_Branch': choice(rng, n, ['Branch A', 'Branch B', 'Branch C']),
+    }
+
+    age = rng.integers(21, 66, n)
+    demographics = {
+        'Applicant_ID': applicant,
+        'Full_Name': numbered('Applicant ', i),
+        'Date_of_Birth': dates(day('2024-06-30') - age * 365 - rng.integers(0, 365, n)),
+        'Age': age,
+        'Gender': choice(rng, n, ['Male', 'Female', 'Other'], p=[0.49, 0.49, 0.02]),
+        'Marital_Status': choice(rng, n, ['Single', 'Married', 'Divorced']),
+        'Number_of_Dependents': rng.integers(0, 5, n),
+        'Education_Level': choice(rng, n, ['High School', "Bachelor's", "Master's", 'PhD']),
+        'Contact_Information': numbered('user', i, suffix='@mail.com'),
+        'Identity_Verification': numbered('ID', i, width=4),
+    }
+
+    years_in_job = np.clip(np.round(6 - 2 * risk + noise(3)), 0, 35).astype('int64')
+    gross = np.round(np.exp(9.1 - 0.15 * risk + noise(0.35))).astype('int64')
+    net = np.round(gross * rng.uniform(0.65, 0.92, n)).astype('int64')
+    employment = {
+        'Applicant_ID': applicant,
+        'Employment_Status': choice(rng, n, ['Salaried', 'Self-Employed', 'Business Owner'], p=[0.6, 0.25, 0.15]),
+        'Employer_Name': numbered('Company ', rng.integers(0, 1000, n)),
+        'Industry_Sector': choice(rng, n, ['IT', 'Finance', 'Healthcare', 'Retail']),
+        'Job_Title': choice(rng, n, ['Analyst', 'Developer', 'Manager', 'Consultant']),
+        'Years_in_Current_Job': years_in_job,
+        'Total_Work_Experience': years_in_job + rng.integers(0, 20, n),
+        'Monthly_Gross_Income': gross,
+        'Net_Monthly_Income': net,
+        'Additional_Income_Sources': rng.integers(0, 5001, n),
+        'Income_Stability_Score': np.clip(0.75 - 0.1 * risk + noise(0.08), 0, 1).round(2),
+        'Employer_Credit_Rating': choice(rng, n, ['AAA', 'AA', 'A', 'BBB', 'BB']),
+    }
+
+    dti = np.clip(0.35 + 0.15 * risk + noise(0.1), 0.02, 1.8)
+    total_obligations = np.round(net * dti).astype('int64')
+    emi = np.round(total_obligations * rng.uniform(0.3, 0.7, n)).astype('int64')
+    obligations = {
+        'Applicant_ID': applicant,
+        'Existing_EMI_Amount': emi,
+        'Credit_Card_Outstanding': rng.integers(0, 10_001, n),
+        'Other_Loan_Balances': rng.integers(0, 30_001, n),
+        'Total_Monthly_Obligations': total_obligations,
+        'Debt_to_Income_Ratio': (total_obligations / net).round(2),
+        'Free_Cash_Flow': net - total_obligations,
+        'Savings_Account_Balance': rng.integers(1_000, 100_001, n),
+        'Investment_Portfolio_Value': rng.integers(0, 150_001, n),
+        'Fixed_Deposit_Amount': rng.integers(0, 50_001, n),
+    }
+
+    bureau = {
+        'Applicant_ID': applicant,
+        'Credit_Score': np.clip(np.round(720 - 60 * risk + noise(30)), 300, 900).astype('int64'),
+        'Credit_History_Length': rng.integers(1, 31, n),
+        'Number_of_Credit_Accounts': rng.integers(1, 16, n),
+        'Active_Credit_Cards': rng.integers(0, 7, n),
+        'Credit_Utilization_Ratio': np.clip(0.45 + 0.2 * risk + noise(0.15), 0, 1).round(2),
+        'Payment_History_Score': np.clip(0.85 - 0.08 * risk + noise(0.05), 0, 1).round(2),
+        'Number_of_Late_Payments': rng.poisson(np.exp(0.2 + 0.6 * risk)),
+        'Previous_Defaults': rng.random(n) < sigmoid(-2.5 + risk),
+        'Bankruptcy_History': rng.random(n) < sigmoid(-4 + risk),
+        'Credit_Inquiries_Last_12_Months': rng.poisson(np.exp(0.6 + 0.4 * risk)),
+        'Credit_Mix_Score': rng.uniform(0.3, 1, n).round(2),
+    }
+
+    collateral_value = np.round(requested * rng.uniform(0.8, 3.0, n)).astype('int64')
+    collateral = {
+        'Application_ID': application,
+        'Collateral_Type': choice(rng, n, ['Property', 'Vehicle', 'Fixed Deposit', 'Securities']),
+        'Collateral_Value': collateral_value,
+        'Loan_to_Value_Ratio': (requested / collateral_value).round(2),
+        'Property_Location': choice(rng, n, ['City A', 'City B', 'City C']),
+        'Property_Age': rng.integers(0, 40, n),
+        'Market_Valuation_Date': dates(app_day - rng.integers(0, 730, n)),
+        'Insurance_Coverage': choice(rng, n, ['Yes', 'No']),
+        'Legal_Clear_Title': choice(rng, n, ['Yes', 'No'], p=[0.9, 0.1]),
+        'Third_Party_Guarantors': choice(rng, n, ['Guarantor A', 'Guarantor B']),
+    }
+
+    banking = {
+        'Applicant_ID': applicant,
+        'Customer_Since': dates(app_day - np.clip(np.round(rng.exponential(1500, n) - 200 * risk), 0, 7000)),
+        'Account_Types': choice(rng, n, ['Savings', 'Current', 'FD', 'Savings,FD']),
+        'Average_Monthly_Balance': np.round(np.exp(10.3 - 0.2 * risk + noise(0.6))).astype('int64'),
+        'Transaction_Volume': rng.integers(100, 8_001, n),
+        'Cross_Sell_Products': choice(rng, n, ['Insurance', 'Investments']),
+        'Customer_Segment': choice(rng, n, ['Basic', 'Regular', 'Premium'], p=[0.5, 0.35, 0.15]),
+        'Relationship_Manager_ID': numbered('RM', rng.integers(0, 500, n), width=3),
+        'Previous_Loan_History': choice(rng, n, ['Good', 'Average', 'Poor']),
+        'Repayment_Track_Record': choice(rng, n, ['On-Time', 'Delayed', 'Defaulted'], p=[0.75, 0.2, 0.05]),
+    }
+
+    external = {
+        'Applicant_ID': applicant,
+        'Utility_Payment_History': choice(rng, n, ['Good', 'Average', 'Poor']),
+        'Mobile_Phone_Bill_Payments': choice(rng, n, ['On-Time', 'Late'], p=[0.8, 0.2]),
+        'Social_Media_Risk_Indicators': choice(rng, n, ['Low', 'Medium', 'High']),
+        'Geolocation_Risk_Score': rng.uniform(0, 1, n).round(2),
+        'Device_Fingerprint_Data': numbered('Device_', i, width=4),
+        'Alternative_Credit_Score': np.clip(np.round(650 - 70 * risk + noise(60)), 300, 900).astype('int64'),
+        'Psychometric_Assessment_Score': rng.uniform(0.3, 1, n).round(2),
+        'Digital_Footprint_Analysis': choice(rng, n, ['Strong', 'Moderate', 'Weak']),
+    }
+
+    regulatory = {
+        'Application_ID': application,
+        'KYC_Compliance_Status': choice(rng, n, ['Compliant', 'Pending', 'Non-Compliant'], p=[0.85, 0.1, 0.05]),
+        'AML_Check_Result': choice(rng, n, ['Clear', 'Flagged'], p=[0.95, 0.05]),
+        'Sanctions_List_Screening': choice(rng, n, ['Passed', 'Flagged'], p=[0.98, 0.02]),
+        'PEP_Check': choice(rng, n, ['No', 'Yes'], p=[0.97, 0.03]),
+        'FATCA_Compliance': choice(rng, n, ['Yes', 'No'], p=[0.9, 0.1]),
+        'Regulatory_Limit_Check': choice(rng, n, ['Pass', 'Fail'], p=[0.92, 0.08]),
+        'Sector_Exposure_Limit': choice(rng, n, ['Within Limit', 'Exceeded'], p=[0.9, 0.1]),
+        'Single_Borrower_Limit': choice(rng, n, ['Within Limit', 'Exceeded'], p=[0.93, 0.07]),
+    }
+
+    pd_value = np.clip(sigmoid(-2.2 + 0.9 * risk + noise(0.3)), 0.01, 0.6).round(2)
+    lgd = rng.uniform(0.2, 0.8, n).round(2)
+    ead = np.round(requested * rng.uniform(0.8, 1.2, n)).astype('int64')
+    risk_scores = {
+        'Application_ID': application, 'Applicant_ID': applicant,
+        'Internal_Risk_Score': np.clip(650 - 80 * risk + noise(40), 300, 900).round(2),
+        'Probability_of_Default': pd_value,
+        'Loss_Given_Default': lgd,
+        'Exposure_at_Default': ead,
+        'Expected_Loss': np.round(pd_value * lgd * ead).astype('int64'),
+        'Risk_Grade': np.where(pd_value < 0.1, 'Prime', np.where(pd_value < 0.25, 'Near-Prime', 'Sub-Prime')).astype(object),
+        'Automated_Decision': np.where(pd_value < 0.2, 'Approve', 'Manual Review').astype(object),
+        'Manual_Override_Flag': rng.random(n) < 0.05,
+        'Final_Decision': choice(rng, n, ['Approved', 'Rejected', 'Pending'], p=[0.6, 0.25, 0.15]),
+        'Decision_Date': dates(app_day + rng.integers(0, 60, n)),
+    }
+
+    return {
+        'Loan_Application_Details': loan, 'Personal_Demographics': demographics, 'Employment_Income': employment,
+        'Financial_Obligations': obligations, 'Credit_Bureau_Data': bureau, 'Collateral_Security': collateral,
+        'Banking_Relationship': banking, 'External_Data_Sources': external, 'Regulatory_Compliance': regulatory,
+        'Risk_Assessment_Scores': risk_scores,
+    }
+
+
+def to_frame(columns, schema, rng, missing):
+    """Order columns by the sheet schema and blank optional and (at rate `missing`) other non-key values."""
+    frame = pd.DataFrame({col: columns[col] for col in schema})
+    n = len(frame)
+    for col, kind in schema.items():
+        if col in storage.KEY_COLUMNS:
+            continue
+        rate = OPTIONAL_COLUMNS.get(col, missing)
+        if rate <= 0:
+            continue
+        blank = rng.random(n) < rate
+        if kind == 'int':
+            frame[col] = pd.array(frame[col], dtype='Int64')
+            frame.loc[blank, col] = pd.NA
+        elif kind == 'float':
+            frame[col] = frame[col].where(~blank)
+        else:
+            values = frame[col].astype(object)
+            values[blank] = np.nan
+            frame[col] = values
+    return frame
+
+
+def generate(applicants, output_dir='synthetic_sheets', fmt='csv', chunk_rows=250_000, seed=42, missing=0.02):
+    """Write the ten sheets for `applicants` applicants; returns the sheet paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    sheets = [os.path.splitext(f)[0] for f in bmv.files.values()]
+    writers = {s: storage.TableWriter(os.path.join(output_dir, s), fmt, schema=storage.SOURCE_SCHEMAS[s])
+               for s in sheets}
+    try:
+        for chunk, start in enumerate(range(0, applicants, chunk_rows)):
+            rng = np.random.default_rng([seed, chunk])
+            with instrumentation.stage('generate') as st:
+                tables = make_chunk(rng, start, min(chunk_rows, applicants - start))
+                frames = {s: to_frame(tables[s], storage.SOURCE_SCHEMAS[s], rng, missing) for s in sheets}
+                st.rows = len(frames[sheets[0]])
+            with instrumentation.stage('write'):
+                for sheet in sheets:
+                    writers[sheet].write(frames[sheet])
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return [writers[s].path for s in sheets]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--applicants', type=int, default=10_000)
+    parser.add_argument('--output-dir', default='synthetic_sheets')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--chunk-rows', type=int, default=250_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--missing', type=float, default=0.02, help='fraction of non-key values left blank')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='record per-stage time and memory to REPORT (.json or .csv, see instrumentation.py)')
+    args = parser.parse_args()
+    instrumentation.enable(args.profile)
+
+    start = time.perf_counter()
+    paths = generate(args.applicants, args.output_dir, args.format, args.chunk_rows, args.seed, args.missing)
+    print(f'Wrote {len(paths)} sheets for {args.applicants:,} applicants to "{args.output_dir}" '
+          f'in {time.perf_counter() - start:.1f}s')
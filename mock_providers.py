@@ -0,0 +1,103 @@
+"""
+Local mock of the bureau, alternative-data and KYC/AML providers, for testing external_sources.py.
+
+Each provider adapter's path serves the matching row of the static sheet, wrapped in that provider's
+reply format (bureau 'report', alternative data 'signals', screening 'checks'); unknown keys get 404.
+Every reply waits a lognormal latency with median --latency-ms (spread --jitter), and --error-rate of
+the requests get a 503 with Retry-After: 0. A provider already serving --max-concurrent requests
+answers 429, like a rate-limited API.
+
+Endpoints:
+    GET /<provider path>/<key>   e.g. /bureau/v1/reports/1001, /kyc/v1/screenings/5001
+    GET /stats                   requests, errors and rate-limited replies so far
+
+Usage:
+    python mock_providers.py [--host 127.0.0.1] [--port 8090] [--base excel_sheets_csv]
+                             [--latency-ms 20] [--jitter 0.5] [--error-rate 0.01] [--max-concurrent 256]
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+
+import numpy as np
+from aiohttp import web
+
+import build_modeling_view as bmv
+import storage
+from external_sources import PROVIDERS
+
+ENVELOPES = {'bureau': 'report', 'external': 'signals', 'regulatory': 'checks'}
+
+
+def provider_records(base, provider):
+    """key -> the sheet row without its key, as JSON-ready Python values."""
+    frame = storage.read_table(os.path.join(base, bmv.files[provider.name]))
+    keys = frame[provider.key].to_numpy()
+    body = frame.drop(columns=[provider.key]).astype(object)
+    # missing values are JSON null, as a provider would send them
+    body = body.where(body.notna(), None)
+    return {int(k): {c: v.item() if isinstance(v, np.generic) else v for c, v in row.items()}
+            for k, row in zip(keys, body.to_dict(orient='records'))}
+
+
+def make_app(base=bmv.base, latency_ms=20.0, jitter=0.5, error_rate=0.01, max_concurrent=256, seed=0):
+    rng = random.Random(seed)
+    stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'not_found': 0}
+    app = web.Application()
+
+    def handler(provider):
+        records = provider_records(base, provider)
+        envelope = ENVELOPES[provider.name]
+        active = 0
+
+        async def handle(request):
+            nonlocal active
+            stats['requests'] += 1
+            if active >= max_concurrent:
+                stats['rate_limited'] += 1
+                return web.json_response({'error': 'too many requests'}, status=429, headers={'Retry-After': '0.05'})
+            active += 1
+            try:
+                await asyncio.sleep(latency_ms / 1000 * math.exp(rng.gauss(0, jitter)))
+                if rng.random() < error_rate:
+                    stats['errors'] += 1
+                    return web.json_response({'error': 'upstream unavailable'}, status=503, headers={'Retry-After': '0'})
+                try:
+                    record = records[int(request.match_info['key'])]
+                except (KeyError, ValueError):
+                    stats['not_found'] += 1
+                    return web.json_response({'error': 'no record'}, status=404)
+                return web.json_response({provider.key.lower(): int(request.match_info['key']), envelope: record})
+            finally:
+                active -= 1
+
+        return handle
+
+    for provider in PROVIDERS.values():
+        app.router.add_get(f'/{provider.path}/{{key}}', handler(provider))
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app.router.add_get('/stats', get_stats)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--base', default=bmv.base, help='directory of the source sheets to serve')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='median reply latency')
+    parser.add_argument('--jitter', type=float, default=0.5, help='sigma of the lognormal latency')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='share of requests answered 503')
+    parser.add_argument('--max-concurrent', type=int, default=256, help='requests per provider before 429s')
+    args = parser.parse_args()
+
+    app = make_app(args.base, args.latency_ms, args.jitter, args.error_rate, args.max_concurrent)
+    print(f'Mock providers listening on http://{args.host}:{args.port} (latency {args.latency_ms:g} ms, '
+          f'errors {args.error_rate:.1%})', flush=True)
+    web.run_app(app, host=args.host, port=args.port, print=None, access_log=None)
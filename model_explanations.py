@@ -0,0 +1,363 @@
+"""
+Local model explanations: global permutation importance and per-application tree-path contributions.
+
+importance     ROC AUC drop when one feature is shuffled, on the rows the model was not fitted on
+               (the trainer's 30% holdout, or --period Validation/OOT for train_model_search.py models).
+               Every (feature, repeat) shuffle is one task, and the tasks are spread across --workers
+               processes that each load the model and the evaluation rows once. Each shuffle is seeded
+               from (seed, feature, repeat), so the result does not depend on the worker count.
+               Written to model_importance.json.
+contributions  Decomposes each application's Model_Pred_Prob into the forest's mean root probability
+               (Contrib_Base) plus one Contrib_<feature> per model feature: every split on the decision
+               path adds the change in the node's default probability to the feature it splits on, and
+               the trees are averaged. The parts sum to the forest's probability. Per tree, the running
+               sums of all nodes are built level by level, so a leaf index gives every row's path sum at once.
+               The view is streamed in chunks across --workers processes, as in
+               score_credit_risk_model.py. Reason_1..3 name the features that raise the probability
+               most. Written to modeling_view_with_explanations, next to the predictions.
+
+applicant_dashboard.py reads both files to show reason codes without a network call. Contributions need a
+tree forest (RandomForestClassifier, the trainer's model); importance works with any saved classifier.
+
+Usage:
+    python model_explanations.py importance [--model credit_risk_model.pkl] [--period Validation]
+                                            [--repeats 5] [--sample 50000] [--workers N]
+    python model_explanations.py contributions [--model credit_risk_model.pkl] [--input modeling_view_with_risk]
+                                               [--format csv|parquet] [--chunksize 100000] [--workers N]
+    python model_explanations.py show APPLICATION_ID
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import instrumentation
+import storage
+from train_credit_risk_model import features
+
+model_path = 'credit_risk_model.pkl'
+importance_path = 'model_importance.json'
+REASON_CODES = 3
+
+# reason code text for each model feature; a positive contribution means the feature raises the PD
+REASON_TEXT = {
+    'DTI': 'Debt-to-income ratio',
+    'LTV': 'Loan-to-value ratio',
+    'Points_DTI': 'Debt-to-income band',
+    'Points_Utilization': 'Credit utilization',
+    'Points_LatePay': 'Late payment history',
+    'Points_Inquiry': 'Recent credit inquiries',
+    'Points_IncomeStability': 'Years in current job',
+    'Points_LTV': 'Loan-to-value band',
+    'Points_Tenure': 'Length of banking relationship',
+    'Total_Points': 'Overall scorecard points',
+    'Total_Score': 'Overall scorecard score',
+}
+
+
+def contribution_columns():
+    return ['Contrib_Base'] + [f'Contrib_{f}' for f in features]
+
+
+def reason_columns():
+    return [f'Reason_{i}' for i in range(1, REASON_CODES + 1)]
+
+
+# --- permutation importance ---
+
+_eval = {}
+
+
+def init_importance_worker(model, X, y):
+    clf = joblib.load(model)
+    if hasattr(clf, 'n_jobs'):
+        clf.n_jobs = 1  # the pool is the parallelism
+    _eval.update(clf=clf, X=X, y=y)
+
+
+def auc(clf, X, y):
+    from sklearn.metrics import roc_auc_score
+    return roc_auc_score(y, clf.predict_proba(X)[:, 1])
+
+
+def shuffled_auc(task):
+    """ROC AUC with one feature shuffled; task is (feature position, repeat, seed), position None shuffles none."""
+    col, repeat, seed = task
+    X = _eval['X']
+    if col is None:
+        return auc(_eval['clf'], X, _eval['y'])
+    rng = np.random.default_rng([seed, col, repeat])
+    name = X.columns[col]
+    shuffled = X.assign(**{name: X[name].to_numpy()[rng.permutation(len(X))]})
+    return auc(_eval['clf'], shuffled, _eval['y'])
+
+
+def evaluation_rows(period=None, sample=None, seed=42):
+    """Features and labels of the rows the model was not fitted on."""
+    from sklearn.model_selection import train_test_split
+    columns = features + ['Default_12m'] + (['Period'] if period else [])
+    model = storage.read_view(columns=storage.KEY_COLUMNS + columns)
+    if period:
+        model = model[(model['Period'].astype(str) == period).to_numpy()]
+        X, y = model[features], model['Default_12m']
+    else:
+        # the same split as train_credit_risk_model.py
+        _, X, _, y = train_test_split(model[features], model['Default_12m'], test_size=0.3, random_state=42)
+    if sample and len(X) > sample:
+        keep = np.sort(np.random.default_rng(seed).choice(len(X), sample, replace=False))
+        X, y = X.iloc[keep], y.iloc[keep]
+    if y.nunique() != 2:
+        raise ValueError('the evaluation rows need both outcomes to compute ROC AUC')
+    return X.reset_index(drop=True), y.to_numpy()
+
+
+def permutation_importance(model=model_path, X=None, y=None, repeats=5, seed=42, workers=None):
+    """Mean and std of the ROC AUC drop per feature, with the unshuffled AUC."""
+    tasks = [(None, 0, seed)] + [(col, repeat, seed) for col in range(X.shape[1]) for repeat in range(repeats)]
+    if workers == 0:
+        init_importance_worker(model, X, y)
+        scores = [shuffled_auc(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_importance_worker,
+                                 initargs=(model, X, y)) as pool:
+            scores = list(pool.map(shuffled_auc, tasks))
+    baseline = scores[0]
+    drops = baseline - np.asarray(scores[1:]).reshape(X.shape[1], repeats)
+    return {
+        'baseline_auc': float(baseline),
+        'features': {name: {'mean': float(d.mean()), 'std': float(d.std()), 'drops': d.tolist()}
+                     for name, d in zip(X.columns, drops)},
+    }
+
+
+def load_importance(path=importance_path):
+    """Saved importance as a frame sorted by mean AUC drop (None when not computed yet)."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        saved = json.load(f)
+    frame = pd.DataFrame([{'feature': name, 'mean': v['mean'], 'std': v['std']}
+                          for name, v in saved['features'].items()])
+    frame.attrs.update({k: v for k, v in saved.items() if k != 'features'})
+    return frame.sort_values('mean', ascending=False, ignore_index=True)
+
+
+# --- tree-path contributions ---
+
+class ForestPaths:
+    """Per-node default probabilities and path increments of a tree forest, for contributions()."""
+
+    def __init__(self, clf):
+        if not hasattr(clf, 'estimators_') or not hasattr(clf.estimators_[0], 'tree_'):
+            raise TypeError(f'tree-path contributions need a tree forest, not a {type(clf).__name__}')
+        if list(clf.classes_) != [0, 1]:
+            raise ValueError(f'expected classes [0, 1], got {list(clf.classes_)}')
+        self.trees = []
+        for est in clf.estimators_:
+            tree = est.tree_
+            counts = tree.value[:, 0, :]
+            # predict_proba normalizes each node's class weights; class 1 is the default
+            prob = counts[:, 1] / counts.sum(axis=1)
+            parent = np.full(tree.node_count, -1)
+            # the nodes one level further down at each step, so a node's parent is filled before it
+            levels, frontier = [], np.array([0])
+            while True:
+                split = frontier[tree.children_left[frontier] >= 0]
+                if not split.size:
+                    break
+                parent[tree.children_left[split]] = split
+                parent[tree.children_right[split]] = split
+                frontier = np.concatenate([tree.children_left[split], tree.children_right[split]])
+                levels.append(frontier)
+            self.trees.append((tree, prob, parent, tree.feature[parent], prob - prob[parent], levels))
+        self.base = np.mean([prob[0] for _, prob, *_ in self.trees])
+
+    def path_sums(self, i, width):
+        """Summed increments per feature from the root to every node of tree i: shape (nodes, width)."""
+        tree, _, parent, split_feature, delta, levels = self.trees[i]
+        sums = np.zeros((tree.node_count, width))
+        for nodes in levels:
+            sums[nodes] = sums[parent[nodes]]
+            sums[nodes, split_feature[nodes]] += delta[nodes]
+        return sums
+
+    def contributions(self, X):
+        """(probability, contributions) for a feature matrix; contributions has one column per feature."""
+        X = np.ascontiguousarray(X, dtype=np.float32)  # sklearn trees compare float32 inputs
+        prob = np.zeros(len(X))
+        contrib = np.zeros((len(X), X.shape[1]))
+        for i, (tree, node_prob, *_) in enumerate(self.trees):
+            leaf = tree.apply(X)
+            prob += node_prob[leaf]
+            contrib += self.path_sums(i, X.shape[1])[leaf]
+        return prob / len(self.trees), contrib / len(self.trees)
+
+
+_forest = {}
+
+
+def init_contribution_worker(model):
+    _forest.update(model=model, paths=None)
+
+
+def forest_paths():
+    # built on the first chunk, so a model that is not a forest fails that chunk instead of the pool
+    if _forest['paths'] is None:
+        _forest['paths'] = ForestPaths(joblib.load(_forest['model']))
+    return _forest['paths']
+
+
+def reason_codes(contrib, names):
+    """The names of the REASON_CODES largest positive contributions per row, most first (None past the last)."""
+    top = np.argsort(-contrib, axis=1, kind='stable')[:, :REASON_CODES]
+    picked = np.take_along_axis(contrib, top, axis=1)
+    codes = np.asarray(names, dtype=object)[top]
+    codes[picked <= 0] = None
+    return codes
+
+
+def explain_chunk(chunk):
+    paths = forest_paths()
+    prob, contrib = paths.contributions(chunk[features].to_numpy(dtype=np.float64))
+    out = chunk[[c for c in storage.KEY_COLUMNS if c in chunk.columns]].copy()
+    out['Model_Pred_Prob'] = prob
+    out['Contrib_Base'] = paths.base
+    for j, name in enumerate(features):
+        out[f'Contrib_{name}'] = contrib[:, j]
+    for name, codes in zip(reason_columns(), reason_codes(contrib, features).T):
+        out[name] = codes
+    return out
+
+
+def explain_file(input_path=storage.VIEW_PATH, output_path=storage.EXPLANATIONS_PATH, fmt=None, chunksize=100_000,
+                 workers=None, model=model_path):
+    """Write contributions and reason codes for every row of input_path; returns (rows, largest sum error)."""
+    if fmt is None:
+        fmt = 'parquet' if storage.stored_path(input_path).endswith('.parquet') else 'csv'
+    available = storage.table_columns(input_path)
+    chunks = storage.iter_table(input_path, chunksize, columns=[c for c in storage.KEY_COLUMNS if c in available] + features,
+                                schema=storage.view_schema())
+    rows, error = 0, 0.0
+
+    def write(result):
+        nonlocal rows, error
+        writer.write(result)
+        rows += len(result)
+        parts = result[contribution_columns()].to_numpy().sum(axis=1)
+        error = max(error, float(np.abs(parts - result['Model_Pred_Prob'].to_numpy()).max(initial=0)))
+
+    with storage.TableWriter(output_path, fmt, schema=storage.explanations_schema()) as writer:
+        if workers == 0:
+            init_contribution_worker(model)
+            for chunk in chunks:
+                write(explain_chunk(chunk))
+            return rows, error
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_contribution_worker, initargs=(model,)) as pool:
+            window = 2 * (workers or os.cpu_count())
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(explain_chunk, chunk))
+                if len(pending) >= window:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    return rows, error
+
+
+class Explanations:
+    """Saved contributions indexed by Application_ID, for per-application lookups."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.positions = pd.Series(np.arange(len(frame)), index=frame['Application_ID'].to_numpy())
+
+    @classmethod
+    def load(cls, path=storage.EXPLANATIONS_PATH):
+        return cls(storage.read_table(path))
+
+    def get(self, application_id):
+        """(Model_Pred_Prob, Contrib_Base, contributions by feature, reason codes) for one application, or None."""
+        pos = self.positions.get(application_id)
+        if pos is None:
+            return None
+        row = self.frame.iloc[pos]
+        contrib = pd.Series({f: row[f'Contrib_{f}'] for f in features}, name=row['Application_ID'])
+        reasons = [r for r in row[reason_columns()] if isinstance(r, str)]
+        return row['Model_Pred_Prob'], row['Contrib_Base'], contrib, reasons
+
+
+def signature(path=storage.EXPLANATIONS_PATH):
+    """Changes whenever the saved contributions are rewritten (None when there are none)."""
+    source = storage.stored_path(path)
+    if not os.path.exists(source):
+        return None
+    stat = os.stat(source)
+    return source, stat.st_mtime_ns, stat.st_size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['importance', 'contributions', 'show'])
+    parser.add_argument('application_id', nargs='?', type=int, help='with show, the application to explain')
+    parser.add_argument('--model', default=model_path)
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: one per CPU; 0 runs in this process)')
+    parser.add_argument('--period', choices=['Train', 'Validation', 'OOT'], default=None,
+                        help="importance on this Period instead of the trainer's 30%% holdout")
+    parser.add_argument('--sample', type=int, default=None, help='importance on at most SAMPLE evaluation rows')
+    parser.add_argument('--repeats', type=int, default=5, help='shuffles per feature')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help=f'default: {importance_path} or {storage.EXPLANATIONS_PATH}')
+    parser.add_argument('--input', default=storage.VIEW_PATH, help='with contributions, the view to explain')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None,
+                        help='contributions output format (default: the format of the input)')
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='record time and memory to REPORT (.json or .csv, see instrumentation.py)')
+    args = parser.parse_args()
+    instrumentation.enable(args.profile)
+
+    if args.command == 'importance':
+        with instrumentation.stage('load'):
+            X, y = evaluation_rows(args.period, args.sample, args.seed)
+        start = time.perf_counter()
+        with instrumentation.stage('importance', rows=len(X) * len(features) * args.repeats):
+            result = permutation_importance(args.model, X, y, args.repeats, args.seed, args.workers)
+        secs = time.perf_counter() - start
+        result.update(model=args.model, rows=len(X), repeats=args.repeats, seed=args.seed,
+                      evaluation=args.period or 'holdout', metric='roc_auc')
+        output = args.output or importance_path
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=1)
+        print(f"{len(features)} features x {args.repeats} shuffles on {len(X):,} {result['evaluation']} rows "
+              f"in {secs:.2f}s (ROC AUC {result['baseline_auc']:.4f}) -> {output}")
+        for _, r in load_importance(output).iterrows():
+            print(f"  {r['feature']:<24}{r['mean']:>9.4f} +/- {r['std']:.4f}")
+    elif args.command == 'contributions':
+        output = args.output or storage.EXPLANATIONS_PATH
+        start = time.perf_counter()
+        try:
+            with instrumentation.stage('contributions'):
+                rows, error = explain_file(args.input, output, args.format, args.chunksize, args.workers, args.model)
+        except (TypeError, ValueError) as e:
+            parser.error(str(e))
+        secs = time.perf_counter() - start
+        print(f'Explained {rows:,} rows in {secs:.2f}s ({rows / secs:,.0f} rows/sec) -> {storage.stem(output)} '
+              f'(contributions sum to the probability within {error:.1e})')
+    else:
+        if args.application_id is None:
+            parser.error('show needs an APPLICATION_ID')
+        found = Explanations.load(args.output or storage.EXPLANATIONS_PATH).get(args.application_id)
+        if found is None:
+            raise SystemExit(f'application {args.application_id} has no saved explanation')
+        prob, base, contrib, reasons = found
+        print(f'Model_Pred_Prob {prob:.4f} = base {base:.4f} + contributions')
+        for name, value in contrib.sort_values(ascending=False).items():
+            print(f'  {name:<24}{value:>+9.4f}')
+        print('Reason codes: ' + ('; '.join(REASON_TEXT[r] for r in reasons) or 'none'))
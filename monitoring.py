@@ -0,0 +1,385 @@
+"""
+Streaming population-stability and calibration monitoring for scored applications.
+
+The reference population is the Train period of the modeling view. Scored batches (files in the
+view's layout: the scorecard buckets, PD_hat, Grade, Application_Date, and Default_12m once
+outcomes are known; Model_Pred_Prob is monitored too when present) are streamed in chunks and
+folded into per-window counters, keyed by application month (or day, or one label per batch). The
+view has no Model_Pred_Prob, so the baseline joins it from the predictions file score_credit_risk_model.py
+writes in the view's row order (--predictions):
+    buckets       counts per label of Utilization_Bucket, Late_Pay_Bucket, Inq_Bucket, Tenure_Bucket
+                  and Grade (plus one slot for unknown or missing labels), for CSI
+    scores        a fixed 1,000-bin histogram on [0, 1] of each score, with its sum and sum of squares.
+                  PSI regroups it into the baseline's score deciles, so no rows are kept
+    calibration   per Grade and score: labeled rows, sum of predicted PD, sum of p(1 - p), defaults,
+                  for realized against predicted default rates
+Every counter is a sum, so windows merge by addition and memory does not grow with the rows
+streamed: a million-row day costs one chunk plus the counters.
+
+After each ingest the windows it touched are checked against the baseline:
+    CSI / score PSI >= 0.10 is a warning, >= 0.25 an alert (the usual PSI bands)
+    |z| >= 3 for realized defaults against the predicted PD sum of a grade (binomial z-score)
+Each check needs --min-rows rows that carry its column (and labeled rows in the grade); a column a
+batch does not have, such as the buckets in the predictions file, is not checked. New findings are
+printed and appended to the alert log as JSON lines; a finding already logged for a window is not
+repeated. The state records the content digest of every ingested batch, and a batch that was already
+ingested (under any name) is skipped, so rerunning an ingest after a failure does not count rows twice.
+
+Usage:
+    python monitoring.py baseline [--view modeling_view_with_risk] [--predictions modeling_view_with_predictions]
+                                  [--period Train]
+    python monitoring.py ingest BATCH [BATCH ...] [--window month|day|batch] [--chunksize 200000]
+    python monitoring.py report
+"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+import storage
+
+state_path = 'monitoring_state.json'
+alerts_path = 'monitoring_alerts.jsonl'
+FORMAT_VERSION = 1
+
+BUCKET_COLUMNS = ['Utilization_Bucket', 'Late_Pay_Bucket', 'Inq_Bucket', 'Tenure_Bucket', 'Grade']
+SCORE_COLUMNS = ['PD_hat', 'Model_Pred_Prob']
+SCORE_GRID = 1000
+SCORE_DECILES = 10
+
+PSI_WARN = 0.10
+PSI_ALERT = 0.25
+CALIBRATION_Z = 3.0
+MIN_ROWS = 500
+# PSI of an empty bin is undefined; empty shares are floored at this
+PSI_FLOOR = 1e-4
+
+
+def psi(expected, actual):
+    """Population stability index between two count vectors over the same bins."""
+    e = np.maximum(np.asarray(expected, dtype='float64') / max(np.sum(expected), 1), PSI_FLOOR)
+    a = np.maximum(np.asarray(actual, dtype='float64') / max(np.sum(actual), 1), PSI_FLOOR)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def severity(value):
+    return 'alert' if value >= PSI_ALERT else 'warn' if value >= PSI_WARN else None
+
+
+class Window:
+    """Mergeable counters for the rows of one window (or of the baseline)."""
+
+    def __init__(self, labels, scores):
+        # labels: {bucket column: label list}; scores: the score columns this window tracks
+        self.labels = labels
+        self.rows = 0
+        # rows that carried each bucket column; a batch without the column leaves its counts empty
+        self.observed = {col: 0 for col in labels}
+        self.buckets = {col: np.zeros(len(values) + 1, dtype='int64') for col, values in labels.items()}
+        self.scores = {col: {'counts': np.zeros(SCORE_GRID, dtype='int64'), 'sum': 0.0, 'sumsq': 0.0}
+                       for col in scores}
+        self.calibration = {col: {} for col in scores}
+
+    def add(self, chunk):
+        self.rows += len(chunk)
+        for col, values in self.labels.items():
+            if col in chunk.columns:
+                # slot 0 collects labels outside the layout (and missing values)
+                codes = pd.Categorical(chunk[col].astype(str), categories=values).codes + 1
+                self.buckets[col] += np.bincount(codes, minlength=len(values) + 1)
+                self.observed[col] += len(chunk)
+        labeled = chunk['Default_12m'].notna().to_numpy() if 'Default_12m' in chunk.columns else None
+        for col, score in self.scores.items():
+            if col not in chunk.columns:
+                continue
+            x = chunk[col].to_numpy(dtype='float64')
+            known = np.isfinite(x)
+            x = x[known]
+            score['counts'] += np.bincount(np.clip((x * SCORE_GRID).astype('int64'), 0, SCORE_GRID - 1),
+                                           minlength=SCORE_GRID)
+            score['sum'] += float(x.sum())
+            score['sumsq'] += float((x * x).sum())
+            if labeled is None or 'Grade' not in chunk.columns:
+                continue
+            rows = known & labeled
+            p = chunk[col].to_numpy(dtype='float64')[rows]
+            frame = pd.DataFrame({'grade': chunk['Grade'].astype(str).to_numpy()[rows], 'n': 1, 'pred': p,
+                                  'var': p * (1 - p), 'defaults': chunk['Default_12m'].to_numpy(dtype='float64')[rows]})
+            for grade, sums in frame.groupby('grade')[['n', 'pred', 'var', 'defaults']].sum().iterrows():
+                total = self.calibration[col].setdefault(grade, [0.0, 0.0, 0.0, 0.0])
+                for i, value in enumerate(sums.to_numpy()):
+                    total[i] += float(value)
+
+    def merge(self, other):
+        self.rows += other.rows
+        for col in self.buckets:
+            self.buckets[col] += other.buckets[col]
+            self.observed[col] += other.observed[col]
+        for col, score in self.scores.items():
+            score['counts'] += other.scores[col]['counts']
+            score['sum'] += other.scores[col]['sum']
+            score['sumsq'] += other.scores[col]['sumsq']
+            for grade, sums in other.calibration[col].items():
+                total = self.calibration[col].setdefault(grade, [0.0, 0.0, 0.0, 0.0])
+                for i, value in enumerate(sums):
+                    total[i] += value
+
+    def score_count(self, col):
+        return int(self.scores[col]['counts'].sum())
+
+    def score_mean(self, col):
+        n = self.score_count(col)
+        return self.scores[col]['sum'] / n if n else float('nan')
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'observed': self.observed,
+            'buckets': {col: counts.tolist() for col, counts in self.buckets.items()},
+            'scores': {col: {'counts': s['counts'].tolist(), 'sum': s['sum'], 'sumsq': s['sumsq']}
+                       for col, s in self.scores.items()},
+            'calibration': self.calibration,
+        }
+
+    @classmethod
+    def from_dict(cls, data, labels):
+        window = cls(labels, list(data['scores']))
+        window.rows = data['rows']
+        window.observed = dict(data['observed'])
+        window.buckets = {col: np.asarray(counts, dtype='int64') for col, counts in data['buckets'].items()}
+        for col, s in data['scores'].items():
+            window.scores[col] = {'counts': np.asarray(s['counts'], dtype='int64'), 'sum': s['sum'], 'sumsq': s['sumsq']}
+        window.calibration = data['calibration']
+        return window
+
+
+def scored_chunks(view, predictions, columns, chunksize):
+    """Chunks of the view's `columns` with Model_Pred_Prob from the predictions file, which is in the view's row order."""
+    chunks = storage.iter_table(view, chunksize, columns=['Application_ID', *columns], schema=storage.view_schema())
+    scored = storage.iter_table(predictions, chunksize, columns=['Application_ID', 'Model_Pred_Prob'],
+                                schema=storage.predictions_schema())
+    for chunk, probs in zip(chunks, scored):
+        if not np.array_equal(chunk['Application_ID'].to_numpy(), probs['Application_ID'].to_numpy()):
+            raise ValueError(f'{predictions} is not in the row order of {view}; rescore the view')
+        chunk['Model_Pred_Prob'] = probs['Model_Pred_Prob'].to_numpy()
+        yield chunk
+
+
+def decile_groups(counts):
+    """Group of each score-grid bin: the baseline's score deciles (bins holding one repeated score merge)."""
+    cumulative = np.cumsum(counts) / max(counts.sum(), 1)
+    # a bin belongs to the decile its first row falls in, so a heavy bin is never split
+    start = np.concatenate([[0.0], cumulative[:-1]])
+    return np.minimum((start * SCORE_DECILES).astype('int64'), SCORE_DECILES - 1)
+
+
+class Monitor:
+    """The baseline window, the monitored windows, the findings already reported per window and the batches ingested."""
+
+    def __init__(self, baseline, windows=None, reported=None, source=None, ingested=None):
+        self.baseline = baseline
+        self.windows = windows or {}
+        self.reported = reported or {}
+        self.source = source
+        # content digest -> path and time of each ingested batch
+        self.ingested = ingested or {}
+        self.groups = {col: decile_groups(s['counts']) for col, s in baseline.scores.items()}
+
+    @classmethod
+    def build_baseline(cls, path=None, period='Train', chunksize=200_000, predictions=None):
+        """Stream the view's rows in `period` into the baseline counters, with Model_Pred_Prob from `predictions` if scored."""
+        path = path or storage.view_path()
+        predictions = predictions or storage.PREDICTIONS_PATH
+        schema = storage.view_schema()
+        labels = {col: list(schema[col]) for col in BUCKET_COLUMNS}
+        columns = storage.table_columns(path)
+        joined = 'Model_Pred_Prob' not in columns and os.path.exists(storage.stored_path(predictions))
+        scores = [c for c in SCORE_COLUMNS if c in columns or (joined and c == 'Model_Pred_Prob')]
+        wanted = [c for c in BUCKET_COLUMNS + scores + ['Default_12m', 'Period'] if c in columns]
+        if joined:
+            chunks = scored_chunks(path, predictions, wanted, chunksize)
+        else:
+            chunks = storage.iter_table(path, chunksize, columns=wanted, schema=schema)
+        baseline = Window(labels, scores)
+        for chunk in chunks:
+            if period and 'Period' in chunk.columns:
+                chunk = chunk[chunk['Period'].astype(str) == period]
+            baseline.add(chunk)
+        return cls(baseline, source={'path': path, 'period': period, 'predictions': predictions if joined else None})
+
+    @classmethod
+    def load(cls, path=state_path):
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('format') != FORMAT_VERSION:
+            raise ValueError(f'{path} has monitoring format {state.get("format")}, expected {FORMAT_VERSION}')
+        labels = state['labels']
+        windows = {key: Window.from_dict(data, labels) for key, data in state['windows'].items()}
+        return cls(Window.from_dict(state['baseline'], labels), windows, state['reported'], state['source'],
+                   state['ingested'])
+
+    def save(self, path=state_path):
+        state = {'format': FORMAT_VERSION, 'source': self.source, 'labels': self.baseline.labels,
+                 'baseline': self.baseline.to_dict(),
+                 'windows': {key: window.to_dict() for key, window in sorted(self.windows.items())},
+                 'reported': self.reported, 'ingested': self.ingested}
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def window(self, key):
+        if key not in self.windows:
+            self.windows[key] = Window(self.baseline.labels, list(self.baseline.scores))
+        return self.windows[key]
+
+    def ingest(self, path, window_by='month', chunksize=200_000):
+        """
+        Fold a scored batch file into its windows; returns the keys of the windows it touched, or None
+        if a file with the same content was ingested before.
+        """
+        digest = storage.file_digest(storage.stored_path(path))
+        if digest in self.ingested:
+            return None
+        columns = storage.table_columns(path)
+        wanted = [c for c in BUCKET_COLUMNS + list(self.baseline.scores) + ['Default_12m', 'Application_Date']
+                  if c in columns]
+        touched = set()
+        for chunk in storage.iter_table(path, chunksize, columns=wanted, schema=storage.view_schema()):
+            if window_by == 'batch' or 'Application_Date' not in chunk.columns:
+                keys = {os.path.basename(storage.stem(path)): chunk}
+            else:
+                width = 7 if window_by == 'month' else 10
+                keys = dict(tuple(chunk.groupby(chunk['Application_Date'].astype(str).str[:width], sort=False)))
+            for key, rows in keys.items():
+                self.window(key).add(rows)
+                touched.add(key)
+        self.ingested[digest] = {'path': path, 'ingested_at': datetime.datetime.now().isoformat(timespec='seconds')}
+        return sorted(touched)
+
+    def evaluate(self, key, min_rows=MIN_ROWS):
+        """Findings for one window: (metric, column, value, severity) tuples, most severe first."""
+        window = self.windows[key]
+        findings = []
+        for col, counts in window.buckets.items():
+            if window.observed[col] >= min_rows:
+                value = psi(self.baseline.buckets[col], counts)
+                findings.append(('csi', col, value, severity(value)))
+        for col, groups in self.groups.items():
+            if window.score_count(col) >= min_rows:
+                value = psi(np.bincount(groups, self.baseline.scores[col]['counts'], SCORE_DECILES),
+                            np.bincount(groups, window.scores[col]['counts'], SCORE_DECILES))
+                findings.append(('score_psi', col, value, severity(value)))
+        for col, grades in window.calibration.items():
+            for grade, (n, pred, var, defaults) in grades.items():
+                if n >= min_rows and var > 0:
+                    z = (defaults - pred) / np.sqrt(var)
+                    findings.append(('calibration_z', f'{col}:{grade}', float(z),
+                                     'alert' if abs(z) >= CALIBRATION_Z else None))
+        return findings
+
+    def new_alerts(self, keys, min_rows=MIN_ROWS):
+        """Findings in `keys` at warn/alert level that were not reported before; marks them reported."""
+        alerts = []
+        for key in keys:
+            reported = self.reported.setdefault(key, [])
+            for metric, column, value, level in self.evaluate(key, min_rows):
+                tag = f'{metric}:{column}:{level}'
+                if level is None or tag in reported:
+                    continue
+                reported.append(tag)
+                alerts.append({'window': key, 'metric': metric, 'column': column, 'value': round(value, 4),
+                               'severity': level, 'rows': self.windows[key].rows})
+        return alerts
+
+    def report(self):
+        rows = []
+        for key, window in sorted(self.windows.items()):
+            csi = {col: psi(self.baseline.buckets[col], counts) for col, counts in window.buckets.items()
+                   if window.observed[col]}
+            worst = max(csi, key=csi.get) if csi else ''
+            row = {'window': key, 'rows': window.rows, 'max_csi': csi.get(worst, float('nan')), 'max_csi_column': worst}
+            for col, groups in self.groups.items():
+                if window.score_count(col):
+                    row[f'{col}_psi'] = psi(np.bincount(groups, self.baseline.scores[col]['counts'], SCORE_DECILES),
+                                            np.bincount(groups, window.scores[col]['counts'], SCORE_DECILES))
+                    row[f'{col}_mean'] = window.score_mean(col)
+                totals = np.sum(list(window.calibration[col].values()), axis=0) \
+                    if window.calibration[col] else np.zeros(4)
+                if totals[0]:
+                    row[f'{col}_predicted_dr'] = totals[1] / totals[0]
+                    row[f'{col}_realized_dr'] = totals[3] / totals[0]
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def log_alerts(alerts, path=alerts_path):
+    stamp = datetime.datetime.now().isoformat(timespec='seconds')
+    with open(path, 'a') as f:
+        for alert in alerts:
+            f.write(json.dumps({'evaluated_at': stamp, **alert}) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['baseline', 'ingest', 'report'])
+    parser.add_argument('batches', nargs='*', help='scored batch files to ingest')
+    parser.add_argument('--view', help='modeling view for the baseline (default: storage.view_path())')
+    parser.add_argument('--predictions', default=storage.PREDICTIONS_PATH,
+                        help="score_credit_risk_model.py output joined for the baseline's Model_Pred_Prob (if it exists)")
+    parser.add_argument('--period', default='Train', help='Period of the view that is the baseline population')
+    parser.add_argument('--window', choices=['month', 'day', 'batch'], default='month',
+                        help='window rows by application month or day, or one window per batch file')
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--min-rows', type=int, default=MIN_ROWS, help='rows a window (or grade) needs before it is checked')
+    parser.add_argument('--state', default=state_path)
+    parser.add_argument('--alerts', default=alerts_path)
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='record per-stage time and memory to REPORT (.json or .csv, see instrumentation.py)')
+    args = parser.parse_args()
+    instrumentation.enable(args.profile)
+
+    if args.command == 'baseline':
+        with instrumentation.stage('baseline') as st:
+            try:
+                monitor = Monitor.build_baseline(args.view, args.period, args.chunksize, args.predictions)
+            except ValueError as e:
+                parser.error(str(e))
+            st.rows = monitor.baseline.rows
+        monitor.save(args.state)
+        print(f'Baseline: {monitor.baseline.rows:,} {args.period} rows, scores {", ".join(monitor.baseline.scores)} '
+              f'-> {args.state}')
+    elif args.command == 'ingest':
+        monitor = Monitor.load(args.state)
+        touched = set()
+        for batch in args.batches:
+            start = time.perf_counter()
+            before = sum(w.rows for w in monitor.windows.values())
+            with instrumentation.stage(f'ingest:{os.path.basename(batch)}') as st:
+                keys = monitor.ingest(batch, args.window, args.chunksize)
+                st.rows = rows = sum(w.rows for w in monitor.windows.values()) - before
+            if keys is None:
+                print(f'{batch}: already ingested, skipped')
+                continue
+            touched.update(keys)
+            secs = time.perf_counter() - start
+            print(f'{batch}: {rows:,} rows in {secs:.1f}s ({rows / secs if secs else 0:,.0f} rows/s)')
+        alerts = monitor.new_alerts(sorted(touched), args.min_rows)
+        monitor.save(args.state)
+        if alerts:
+            log_alerts(alerts, args.alerts)
+        for alert in alerts:
+            print(f"{alert['severity'].upper():<6}{alert['window']:<12}{alert['metric']:<15}{alert['column']:<28}"
+                  f"{alert['value']:>8.3f}  ({alert['rows']:,} rows)")
+        print(f'{len(alerts)} new findings in {len(touched)} windows' + (f' (logged to {args.alerts})' if alerts else ''))
+    else:
+        monitor = Monitor.load(args.state)
+        joined = f" + {monitor.source['predictions']}" if monitor.source['predictions'] else ''
+        print(f"Baseline: {monitor.baseline.rows:,} rows ({monitor.source['period']} of {monitor.source['path']}{joined})")
+        print(monitor.report().to_string(index=False, float_format=lambda x: f'{x:.4f}'))
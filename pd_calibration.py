@@ -0,0 +1,403 @@
+"""
+Empirical PD calibration of Total_Points or the model probability against Default_12m.
+
+Fitting works from sufficient statistics rather than rows. Labeled rows are streamed once, and each
+row adds to its bin on a fixed score grid:
+    Total_Points       one bin per point value (0 to the scorecard's maximum)
+    Model_Pred_Prob    1,000 equal bins on [0, 1]
+Every bin keeps three sums: rows, defaults and the sum of the score. The sums are mergeable, so
+--period Train is read once and later outcome files are added on top (update) without re-reading history.
+
+Fitting methods, all on the binned sums:
+    isotonic   pool-adjacent-violators on the bin default rates, weighted by rows (monotone)
+    binned     the default rate of --bins groups of about equal row count (quantile bins)
+    logistic   logit(PD) = a + b * score, fitted by Newton's method on the binned counts
+The fit is saved as a compact lookup table of (score, PD) knots (at most one per occupied bin) with the sums
+used to fit it. apply() is np.interp over the knots, so calibrating 10M rows is a single array pass.
+Fitted PDs are kept within [1e-4, 1 - 1e-4].
+
+Each fit is checked on the Validation and OOT periods it was not fitted on, against the scorecard
+ladder (PD_hat) or the raw model probability. The model was trained on Train, so its probabilities
+are best calibrated with --period Validation and checked on OOT. The metrics are rows, observed and mean predicted default rate, Brier score,
+log loss and calibration error over score deciles.
+
+A Total_Points calibration can replace the ladder in scorecard.score:
+    python build_modeling_view.py --calibration pd_calibration.json
+or rescore an existing view in place of the ladder's PD_hat and Grade (apply).
+
+Usage:
+    python pd_calibration.py fit [--score Total_Points|Model_Pred_Prob] [--method isotonic|binned|logistic] [--bins 10]
+    python pd_calibration.py validate [--calibration pd_calibration.json]
+    python pd_calibration.py update OUTCOMES [OUTCOMES ...]    # labeled rows with the score and Default_12m
+    python pd_calibration.py apply --output calibrated/modeling_view_with_risk   # readable as MODELING_VIEW=calibrated/...
+"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+import scorecard
+import storage
+
+calibration_path = 'pd_calibration.json'
+FORMAT_VERSION = 1
+
+METHODS = ['isotonic', 'binned', 'logistic']
+PD_FLOOR = 1e-4
+PROBABILITY_BINS = 1000
+VALIDATION_PERIODS = ['Validation', 'OOT']
+ECE_GROUPS = 10
+
+
+def max_points():
+    """The largest Total_Points the scorecard can give."""
+    total = 0
+    for _, table in scorecard.POINTS_COLUMNS.values():
+        total += max(table['labels']) if 'edges' in table else max([*table['points'].values(), table['default']])
+    return total
+
+
+def score_grid(score):
+    """(low, high, bins) of the fixed grid a score is accumulated on."""
+    if score == 'Total_Points':
+        return 0.0, float(max_points() + 1), max_points() + 1
+    return 0.0, 1.0, PROBABILITY_BINS
+
+
+def grid_index(x, grid):
+    low, high, bins = grid
+    return np.clip(((np.asarray(x, dtype='float64') - low) * (bins / (high - low))).astype('int64'), 0, bins - 1)
+
+
+class BinStats:
+    """Rows, defaults and score sum per bin of a score grid; adding or merging is addition."""
+
+    def __init__(self, grid, n=None, defaults=None, x_sum=None):
+        self.grid = grid
+        bins = grid[2]
+        self.n = np.zeros(bins) if n is None else np.asarray(n, dtype='float64')
+        self.defaults = np.zeros(bins) if defaults is None else np.asarray(defaults, dtype='float64')
+        self.x_sum = np.zeros(bins) if x_sum is None else np.asarray(x_sum, dtype='float64')
+
+    def add(self, x, y):
+        x = np.asarray(x, dtype='float64')
+        y = np.asarray(y, dtype='float64')
+        known = np.isfinite(x) & np.isfinite(y)
+        x, y = x[known], y[known]
+        index = grid_index(x, self.grid)
+        bins = self.grid[2]
+        self.n += np.bincount(index, minlength=bins)
+        self.defaults += np.bincount(index, weights=y, minlength=bins)
+        self.x_sum += np.bincount(index, weights=x, minlength=bins)
+
+    def merge(self, other):
+        self.n += other.n
+        self.defaults += other.defaults
+        self.x_sum += other.x_sum
+
+    def occupied(self):
+        """Non-empty bins as (mean score, rows, defaults) arrays in score order."""
+        keep = self.n > 0
+        return self.x_sum[keep] / self.n[keep], self.n[keep], self.defaults[keep]
+
+    def to_dict(self):
+        return {'grid': list(self.grid), 'n': self.n.tolist(), 'defaults': self.defaults.tolist(),
+                'x_sum': self.x_sum.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(tuple(data['grid']), data['n'], data['defaults'], data['x_sum'])
+
+
+def pava(rates, weights):
+    """Weighted pool-adjacent-violators: the non-decreasing fit to rates, as (block values, block sizes)."""
+    values, sizes, totals = [], [], []
+    for rate, weight in zip(rates, weights):
+        values.append(rate)
+        totals.append(weight)
+        sizes.append(1)
+        while len(values) > 1 and values[-2] > values[-1]:
+            weight = totals[-2] + totals[-1]
+            values[-2] = (values[-2] * totals[-2] + values[-1] * totals[-1]) / weight
+            totals[-2] = weight
+            sizes[-2] += sizes[-1]
+            del values[-1], totals[-1], sizes[-1]
+    return np.asarray(values), np.asarray(sizes)
+
+
+def fit_isotonic(x, n, d):
+    values, sizes = pava(d / n, n)
+    # knots at the first and last score of each pooled block, so the fit is flat within a block
+    last = np.cumsum(sizes) - 1
+    first = last - sizes + 1
+    ends = np.column_stack([first, last]).ravel()
+    knot_x, knot_pd = x[ends], np.repeat(values, 2)
+    keep = np.concatenate([[True], np.diff(ends) > 0])
+    return knot_x[keep], knot_pd[keep]
+
+
+def fit_binned(x, n, d, bins):
+    # quantile groups: a bin joins the group its first row falls in, so no bin is split
+    start = np.concatenate([[0.0], np.cumsum(n)[:-1]]) / n.sum()
+    group = np.minimum((start * bins).astype('int64'), bins - 1)
+    group = np.unique(group, return_inverse=True)[1]
+    rows = np.bincount(group, weights=n)
+    return np.bincount(group, weights=x * n) / rows, np.bincount(group, weights=d) / rows
+
+
+def fit_logistic(x, n, d, iterations=50):
+    # standardized score for a well-conditioned Newton step on the binomial log likelihood
+    centre, scale = np.average(x, weights=n), np.sqrt(np.average((x - np.average(x, weights=n)) ** 2, weights=n)) or 1.0
+    z = (x - centre) / scale
+    X = np.column_stack([np.ones_like(z), z])
+    beta = np.array([np.log(max(d.sum(), 0.5) / max(n.sum() - d.sum(), 0.5)), 0.0])
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-X @ beta))
+        gradient = X.T @ (d - n * p)
+        hessian = (X * (n * p * (1 - p))[:, None]).T @ X
+        step = np.linalg.solve(hessian, gradient)
+        beta += step
+        if np.abs(step).max() < 1e-10:
+            break
+    return x, 1 / (1 + np.exp(-(beta[0] + beta[1] * z)))
+
+
+class PDCalibration:
+    """A fitted score -> PD lookup table, with the bin sums it was fitted from."""
+
+    def __init__(self, score, method, stats, bins=10, knots=None, fitted=None, validation=None):
+        self.score = score
+        self.method = method
+        self.stats = stats
+        self.bins = bins
+        self.fitted = fitted or {}
+        self.validation = validation or {}
+        if knots is None:
+            self.refit()
+        else:
+            self.knot_x, self.knot_pd = (np.asarray(k, dtype='float64') for k in knots)
+
+    def refit(self):
+        """Fit the lookup table to the current sums."""
+        x, n, d = self.stats.occupied()
+        if not len(x):
+            raise ValueError(f'no labeled rows with a {self.score} to calibrate')
+        if self.method == 'isotonic':
+            knot_x, knot_pd = fit_isotonic(x, n, d)
+        elif self.method == 'binned':
+            knot_x, knot_pd = fit_binned(x, n, d, self.bins)
+        else:
+            knot_x, knot_pd = fit_logistic(x, n, d)
+        self.knot_x, self.knot_pd = knot_x, np.clip(knot_pd, PD_FLOOR, 1 - PD_FLOOR)
+        self.fitted.update(rows=int(n.sum()), defaults=int(d.sum()),
+                           at=datetime.datetime.now().isoformat(timespec='seconds'))
+        self.validation = {}
+
+    def apply(self, scores):
+        """Calibrated PD of every score (linear between knots, flat beyond the ends)."""
+        return np.interp(np.asarray(scores, dtype='float64'), self.knot_x, self.knot_pd)
+
+    def add(self, scores, defaults):
+        self.stats.add(scores, defaults)
+
+    def table(self):
+        return pd.DataFrame({self.score: self.knot_x, 'PD': self.knot_pd})
+
+    def save(self, path=calibration_path):
+        state = {'format': FORMAT_VERSION, 'score': self.score, 'method': self.method, 'bins': self.bins,
+                 'knots': [self.knot_x.tolist(), self.knot_pd.tolist()], 'fitted': self.fitted,
+                 'validation': self.validation, 'stats': self.stats.to_dict()}
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=calibration_path):
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('format') != FORMAT_VERSION:
+            raise ValueError(f'{path} has calibration format {state.get("format")}, expected {FORMAT_VERSION}')
+        return cls(state['score'], state['method'], BinStats.from_dict(state['stats']), state['bins'],
+                   state['knots'], state['fitted'], state['validation'])
+
+
+def labeled_chunks(score, view=None, predictions=None, chunksize=500_000, extra=()):
+    """
+    Chunks of the view with Period, Default_12m, the score and `extra` columns. Model_Pred_Prob is read
+    from the predictions file, which score_credit_risk_model.py writes in the view's row order.
+    """
+    view = view or storage.view_path()
+    columns = ['Application_ID', 'Period', 'Default_12m', *extra]
+    if score != 'Model_Pred_Prob':
+        yield from storage.iter_table(view, chunksize, columns=columns + [score], schema=storage.view_schema())
+        return
+    predictions = predictions or storage.PREDICTIONS_PATH
+    chunks = storage.iter_table(view, chunksize, columns=columns, schema=storage.view_schema())
+    scored = storage.iter_table(predictions, chunksize, columns=['Application_ID', score],
+                                schema=storage.predictions_schema())
+    for chunk, probs in zip(chunks, scored):
+        if not np.array_equal(chunk['Application_ID'].to_numpy(), probs['Application_ID'].to_numpy()):
+            raise ValueError(f'{predictions} is not in the row order of {view}; rescore the view')
+        chunk[score] = probs[score].to_numpy()
+        yield chunk
+
+
+def fit(score, method, bins=10, periods=('Train',), view=None, predictions=None, chunksize=500_000):
+    """Stream the labeled rows of `periods` into bin sums and fit a calibration to them."""
+    stats = BinStats(score_grid(score))
+    for chunk in labeled_chunks(score, view, predictions, chunksize):
+        rows = chunk['Period'].astype(str).isin(periods).to_numpy()
+        stats.add(chunk[score].to_numpy()[rows], chunk['Default_12m'].to_numpy()[rows])
+    calibration = PDCalibration(score, method, stats, bins)
+    calibration.fitted['periods'] = list(periods)
+    return calibration
+
+
+class Metrics:
+    """Mergeable sums for the calibration metrics of one set of predicted PDs."""
+
+    def __init__(self, grid):
+        self.bins = BinStats(grid)
+        self.predicted = np.zeros(grid[2])
+        self.brier = 0.0
+        self.log_loss = 0.0
+
+    def add(self, scores, pd_values, y):
+        index = grid_index(scores, self.bins.grid)
+        self.bins.add(scores, y)
+        self.predicted += np.bincount(index, weights=pd_values, minlength=len(self.predicted))
+        p = np.clip(pd_values, PD_FLOOR, 1 - PD_FLOOR)
+        self.brier += float(((pd_values - y) ** 2).sum())
+        self.log_loss -= float((y * np.log(p) + (1 - y) * np.log(1 - p)).sum())
+
+    def summary(self):
+        n = self.bins.n.sum()
+        if not n:
+            return {'rows': 0}
+        # calibration error over score deciles: row-weighted |mean predicted - observed| per decile
+        start = np.concatenate([[0.0], np.cumsum(self.bins.n)[:-1]]) / n
+        group = np.minimum((start * ECE_GROUPS).astype('int64'), ECE_GROUPS - 1)
+        rows = np.bincount(group, weights=self.bins.n, minlength=ECE_GROUPS)
+        gap = np.abs(np.bincount(group, weights=self.predicted, minlength=ECE_GROUPS)
+                     - np.bincount(group, weights=self.bins.defaults, minlength=ECE_GROUPS))
+        return {'rows': int(n), 'observed_dr': self.bins.defaults.sum() / n, 'mean_pd': self.predicted.sum() / n,
+                'brier': self.brier / n, 'log_loss': self.log_loss / n, 'calibration_error': gap[rows > 0].sum() / n}
+
+
+def validate(calibration, periods=None, view=None, predictions=None, chunksize=500_000):
+    """
+    Metrics of the calibration and of the current PD (the ladder's PD_hat, or the raw probability) per period;
+    by default Validation and OOT, less any period the calibration was fitted on.
+    """
+    if periods is None:
+        periods = [p for p in VALIDATION_PERIODS if p not in calibration.fitted.get('periods', [])]
+    grid = calibration.stats.grid
+    reference = 'PD_hat' if calibration.score == 'Total_Points' else calibration.score
+    extra = ['PD_hat'] if reference == 'PD_hat' else []
+    metrics = {(period, name): Metrics(grid) for period in periods for name in ('calibrated', reference)}
+    for chunk in labeled_chunks(calibration.score, view, predictions, chunksize, extra):
+        period_of = chunk['Period'].astype(str).to_numpy()
+        for period in periods:
+            rows = period_of == period
+            if not rows.any():
+                continue
+            x = chunk[calibration.score].to_numpy(dtype='float64')[rows]
+            y = chunk['Default_12m'].to_numpy(dtype='float64')[rows]
+            metrics[(period, 'calibrated')].add(x, calibration.apply(x), y)
+            metrics[(period, reference)].add(x, chunk[reference].to_numpy(dtype='float64')[rows], y)
+    return {f'{period}:{name}': m.summary() for (period, name), m in metrics.items()}
+
+
+def apply_view(calibration, input_path, output_path, fmt=None, chunksize=500_000):
+    """Rewrite a view with PD_hat and Grade from a Total_Points calibration; returns the number of rows."""
+    if calibration.score != 'Total_Points':
+        raise ValueError(f'only a Total_Points calibration replaces PD_hat (this one calibrates {calibration.score})')
+    if fmt is None:
+        fmt = 'parquet' if storage.stored_path(input_path).endswith('.parquet') else 'csv'
+    schema = storage.view_schema()
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    rows = 0
+    with storage.TableWriter(output_path, fmt, schema=schema) as writer:
+        for chunk in storage.iter_table(input_path, chunksize, schema=schema):
+            chunk['PD_hat'] = calibration.apply(chunk['Total_Points'])
+            chunk['Grade'] = pd.Categorical(scorecard.grade_map(chunk['PD_hat']), categories=schema['Grade'])
+            writer.write(chunk)
+            rows += len(chunk)
+    return rows
+
+
+def print_validation(results):
+    frame = pd.DataFrame.from_dict(results, orient='index')
+    frame.index.name = 'period:pd'
+    print(frame.to_string(float_format=lambda x: f'{x:.4f}'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['fit', 'validate', 'update', 'apply'])
+    parser.add_argument('outcomes', nargs='*', help='with update, labeled files with the score column and Default_12m')
+    parser.add_argument('--score', choices=['Total_Points', 'Model_Pred_Prob'], default='Total_Points')
+    parser.add_argument('--method', choices=METHODS, default='isotonic')
+    parser.add_argument('--bins', type=int, default=10, help='groups for --method binned')
+    parser.add_argument('--period', nargs='+', default=['Train'], help='periods of the view the fit uses')
+    parser.add_argument('--view', help='modeling view (default: storage.view_path())')
+    parser.add_argument('--predictions', help=f'model predictions for Model_Pred_Prob (default: {storage.PREDICTIONS_PATH})')
+    parser.add_argument('--calibration', default=calibration_path)
+    parser.add_argument('--input', help='with apply, the view to rescore (default: storage.view_path())')
+    parser.add_argument('--output', help='with apply, the rescored view')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None)
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='record per-stage time and memory to REPORT (.json or .csv, see instrumentation.py)')
+    args = parser.parse_args()
+    instrumentation.enable(args.profile)
+
+    start = time.perf_counter()
+    if args.command == 'fit':
+        with instrumentation.stage('fit') as st:
+            calibration = fit(args.score, args.method, args.bins, args.period, args.view, args.predictions, args.chunksize)
+            st.rows = calibration.fitted['rows']
+        with instrumentation.stage('validate'):
+            calibration.validation = validate(calibration, view=args.view, predictions=args.predictions,
+                                              chunksize=args.chunksize)
+        calibration.save(args.calibration)
+        print(calibration.table().to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+        print_validation(calibration.validation)
+        print(f"{args.method} calibration of {args.score} on {calibration.fitted['rows']:,} {'/'.join(args.period)} rows, "
+              f'{len(calibration.knot_x)} knots -> {args.calibration} ({time.perf_counter() - start:.1f}s)')
+    elif args.command == 'validate':
+        calibration = PDCalibration.load(args.calibration)
+        calibration.validation = validate(calibration, view=args.view, predictions=args.predictions,
+                                          chunksize=args.chunksize)
+        calibration.save(args.calibration)
+        print_validation(calibration.validation)
+    elif args.command == 'update':
+        calibration = PDCalibration.load(args.calibration)
+        before = calibration.fitted['rows']
+        for path in args.outcomes:
+            with instrumentation.stage(f'update:{os.path.basename(path)}'):
+                for chunk in storage.iter_table(path, args.chunksize, columns=[calibration.score, 'Default_12m'],
+                                                schema={**storage.view_schema(), **storage.predictions_schema()}):
+                    calibration.add(chunk[calibration.score].to_numpy(), chunk['Default_12m'].to_numpy())
+        calibration.refit()
+        calibration.fitted.setdefault('updates', []).extend(args.outcomes)
+        calibration.save(args.calibration)
+        print(calibration.table().to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+        print(f"Refitted on {calibration.fitted['rows']:,} rows ({calibration.fitted['rows'] - before:+,}); "
+              f'run validate to re-check it -> {args.calibration}')
+    else:
+        if not args.output:
+            parser.error('apply needs --output')
+        calibration = PDCalibration.load(args.calibration)
+        with instrumentation.stage('apply') as st:
+            st.rows = rows = apply_view(calibration, args.input or storage.view_path(), args.output, args.format,
+                                        args.chunksize)
+        secs = time.perf_counter() - start
+        print(f'Calibrated {rows:,} rows in {secs:.2f}s -> {storage.stem(args.output)}')
@@ -0,0 +1,405 @@
+"""
+Pre-aggregated portfolio cube over the modeling view, for dashboard queries.
+
+Dimensions: Grade, Loan_Type, Processing_Branch and Period. The base cells group the view by all four
+and keep additive measures only:
+    applications   number of applications
+    exposure       sum of Requested_Loan_Amount
+    pd_sum         sum of PD_hat
+    defaults       sum of Default_12m
+Every rollup (each subset of the dimensions, 16 including the grand total) is summed from the base
+cells when the cube is built or refreshed. query() answers a filter plus group-by from the smallest
+rollup that holds the dimensions it uses, a few hundred rows at most whatever the size of the book,
+and derives mean PD (pd_sum / applications) and default rate (defaults / applications) per group, so
+every combination stays exact.
+
+refresh() does nothing while the view is unchanged (the file's stat, or the feature store's last
+sync). A changed view file has no record of which applications changed, and finding them means reading
+and hashing every row, which costs as much as aggregating them, so a file-backed cube is rebuilt from
+the cube's columns. A cube over the feature store (feature_store.py) refreshes incrementally: it keeps
+each application's dimension values and measures, asks the store for the applications its syncs wrote
+or removed since the cube's signature, subtracts their old contributions from the base cells, adds the
+new ones, and rebuilds the rollups from the base cells. The cube is saved next to the view (CUBE_PATH)
+so a restarted dashboard starts from it.
+
+Usage:
+    python portfolio_cube.py build [--view PATH] [--cube portfolio_cube.pkl]
+    python portfolio_cube.py refresh
+    python portfolio_cube.py query [--filter Grade=A,B] [--filter Period=OOT] [--by Loan_Type]
+    python portfolio_cube.py bench [--queries 200]
+"""
+
+import argparse
+import itertools
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+CUBE_PATH = 'portfolio_cube.pkl'
+FORMAT_VERSION = 2
+DIMENSIONS = ['Grade', 'Loan_Type', 'Processing_Branch', 'Period']
+# measure name -> view column summed into it
+MEASURES = {'exposure': 'Requested_Loan_Amount', 'pd_sum': 'PD_hat', 'defaults': 'Default_12m'}
+CUBE_COLUMNS = ['Application_ID'] + DIMENSIONS + list(MEASURES.values())
+MISSING = 'Unknown'
+
+
+def view_signature(path):
+    """What identifies a version of the view: the file's stat, or for a feature store its last sync."""
+    if path.endswith('.sqlite'):
+        from feature_store import FeatureStore
+        with FeatureStore(path) as store:
+            return path, store.last_recorded()
+    source = storage.stored_path(path)
+    stat = os.stat(source)
+    return source, stat.st_mtime_ns, stat.st_size
+
+
+def contributions(view):
+    """Each application's dimension values and float64 measures, indexed by Application_ID."""
+    frame = view[CUBE_COLUMNS].set_index('Application_ID')
+    if not frame.index.is_unique:
+        raise ValueError('Application_ID is not unique in the view; the cube cannot track applications')
+    out = {}
+    for col in DIMENSIONS:
+        values = frame[col] if isinstance(frame[col].dtype, pd.CategoricalDtype) else frame[col].astype('category')
+        if values.isna().any():
+            values = values.cat.add_categories([MISSING]).fillna(MISSING)
+        out[col] = values
+    for col in MEASURES.values():
+        values = frame[col]
+        out[col] = storage.widen_float32(values) if values.dtype == 'float32' else values.astype('float64')
+    return pd.DataFrame(out, index=frame.index)
+
+
+def append_values(a, b):
+    """a's values followed by b's, keeping categoricals categorical."""
+    if isinstance(a.dtype, pd.CategoricalDtype):
+        return pd.api.types.union_categoricals([a.array, b.astype('category').array], ignore_order=True)
+    return np.concatenate([a.to_numpy(), b.to_numpy().astype(a.dtype)])
+
+
+def aggregate(frame):
+    """Base cells of frame's applications: additive measures per combination of all dimensions."""
+    cells = frame.groupby(DIMENSIONS, observed=True, sort=False).agg(
+        applications=(DIMENSIONS[0], 'size'), **{name: (col, 'sum') for name, col in MEASURES.items()})
+    cells.index = pd.MultiIndex.from_frame(cells.index.to_frame(index=False).astype(object))
+    return cells
+
+
+def derive(frame):
+    """Add the ratio measures to summed cells."""
+    frame = frame.copy()
+    frame['applications'] = frame['applications'].astype('int64')
+    frame['mean_pd'] = frame['pd_sum'] / frame['applications']
+    frame['default_rate'] = frame['defaults'] / frame['applications']
+    return frame
+
+
+class PortfolioCube:
+    """
+    Base cells, every rollup, each dimension's category order, and (for a feature-store cube) the
+    per-application contributions that keep the cells refreshable.
+    """
+
+    def __init__(self, cells, categories, members=None, signature=None):
+        self.cells = cells
+        self.categories = categories
+        self.members = members
+        self.signature = signature
+        self.rollups = {}
+        self.roll_up()
+
+    @classmethod
+    def build(cls, view, signature=None, track=False):
+        """The cube of a view; with track, keeps the per-application contributions for incremental refresh."""
+        members = contributions(view)
+        categories = {dim: list(members[dim].cat.categories) for dim in DIMENSIONS}
+        return cls(aggregate(members), categories, members if track else None, signature)
+
+    @classmethod
+    def load(cls, path=CUBE_PATH):
+        state = pd.read_pickle(path)
+        if state.get('format') != FORMAT_VERSION:
+            raise ValueError(f'{path} has cube format {state.get("format")}, expected {FORMAT_VERSION}')
+        return cls(state['cells'], state['categories'], state['members'], state['signature'])
+
+    def save(self, path=CUBE_PATH):
+        tmp = path + '.tmp'
+        pd.to_pickle({'format': FORMAT_VERSION, 'cells': self.cells, 'categories': self.categories,
+                      'members': self.members, 'signature': self.signature}, tmp)
+        os.replace(tmp, path)
+
+    @property
+    def applications(self):
+        return int(self.cells['applications'].sum())
+
+    def roll_up(self):
+        base = self.cells.reset_index()
+        measures = ['applications'] + list(MEASURES)
+        for size in range(len(DIMENSIONS) + 1):
+            for dims in itertools.combinations(DIMENSIONS, size):
+                if dims == tuple(DIMENSIONS):
+                    self.rollups[dims] = base
+                elif dims:
+                    self.rollups[dims] = base.groupby(list(dims), sort=False)[measures].sum().reset_index()
+                else:
+                    self.rollups[dims] = base[measures].sum().to_frame().T
+
+    def apply(self, fresh, stale):
+        """Swap the contributions of the `stale` Application_IDs in the cells for the `fresh` members."""
+        old = self.members[self.members.index.isin(stale)]
+        if fresh.empty and old.empty:
+            return
+        delta = aggregate(fresh).sub(aggregate(old), fill_value=0)
+        cells = self.cells.add(delta, fill_value=0)
+        cells = cells[cells['applications'] > 0]
+        cells['applications'] = cells['applications'].astype('int64')
+        self.cells = cells
+        self.roll_up()
+
+    def merge(self, fresh, removed):
+        """
+        Apply added or changed applications (`fresh` contributions) and `removed` Application_IDs to a
+        tracked cube; returns (added, changed, removed) applications.
+        """
+        known = fresh.index.isin(self.members.index)
+        removed = self.members.index.intersection(removed)
+        self.apply(fresh, fresh.index.append(removed))
+        kept = self.members[~self.members.index.isin(fresh.index.append(removed))]
+        self.members = pd.DataFrame({col: append_values(kept[col], fresh[col]) for col in kept.columns},
+                                    index=kept.index.append(fresh.index))
+        for dim in DIMENSIONS:
+            self.categories[dim] = list(self.members[dim].cat.categories)
+        return int((~known).sum()), int(known.sum()), len(removed)
+
+    def rebuild(self, view, signature, track):
+        cube = PortfolioCube.build(view, signature, track)
+        self.__dict__.update(cube.__dict__)
+
+    def refresh(self, path=None):
+        """
+        Bring the cube up to date with the view; returns a summary of what changed, or None when unchanged.
+        A feature-store cube applies the store's changes; otherwise the cube is rebuilt.
+        """
+        path = path or storage.view_path()
+        signature = view_signature(path)
+        if signature == self.signature:
+            return None
+        store = path.endswith('.sqlite')
+        if store and self.members is not None and self.signature is not None and self.signature[0] == path \
+                and self.signature[1] is not None:
+            from feature_store import FeatureStore
+            with FeatureStore(path) as fs:
+                rows, removed = fs.changes(self.signature[1], CUBE_COLUMNS)
+                counts = self.merge(contributions(rows), removed)
+                self.signature = signature
+                # a store rebuilt from scratch has no tombstones for what it lost: fall back to a rebuild
+                if len(self.members) == fs.conn.execute('SELECT COUNT(*) FROM current').fetchone()[0]:
+                    return '{:,} added, {:,} changed, {:,} removed'.format(*counts)
+        self.rebuild(storage.read_view(columns=CUBE_COLUMNS, path=path), signature, track=store)
+        return f'rebuilt from {self.applications:,} applications'
+
+    def levels(self, dimension):
+        """The dimension's values present in the cube, in the view's category order."""
+        present = set(self.rollups[(dimension,)][dimension])
+        return [v for v in self.categories[dimension] if v in present]
+
+    def in_level_order(self, frame):
+        rank = {dim: {v: i for i, v in enumerate(self.categories[dim])} for dim in frame.index.names}
+        return frame.sort_index(key=lambda index: index.map(rank[index.name]))
+
+    def query(self, by=(), filters=None):
+        """
+        Measures per group of the `by` dimensions, over the applications whose dimension values are in
+        `filters` ({dimension: allowed values}); a single totals row when by is empty.
+        """
+        by, filters = list(by), filters or {}
+        unknown = [d for d in by + list(filters) if d not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f'unknown dimensions {unknown}; the cube has {DIMENSIONS}')
+        used = set(by) | set(filters)
+        frame = self.rollups[tuple(d for d in DIMENSIONS if d in used)]
+        if filters:
+            mask = np.ones(len(frame), dtype=bool)
+            for dim, allowed in filters.items():
+                mask &= frame[dim].isin(list(allowed)).to_numpy()
+            frame = frame[mask]
+        measures = ['applications'] + list(MEASURES)
+        if by:
+            frame = self.in_level_order(frame.groupby(by)[measures].sum())
+        else:
+            frame = frame[measures].sum().to_frame().T
+        return derive(frame)
+
+    def totals(self, filters=None):
+        return self.query(filters=filters).iloc[0]
+
+
+class CubeCache:
+    """Process-wide cube for a dashboard: loaded from (or built into) cube_path, refreshed when the view changes."""
+
+    def __init__(self, view=None, cube_path=CUBE_PATH):
+        self.view = view or storage.view_path()
+        self.cube_path = cube_path
+        self.lock = threading.Lock()
+        self.cube = None
+
+    def get(self):
+        with self.lock:
+            if self.cube is None:
+                self.cube, _ = open_cube(self.view, self.cube_path)
+            elif self.cube.refresh(self.view) is not None:
+                self.cube.save(self.cube_path)
+            return self.cube
+
+
+def build_cube(view):
+    """The cube of a view file or feature store; a feature-store cube tracks applications for incremental refresh."""
+    return PortfolioCube.build(storage.read_view(columns=CUBE_COLUMNS, path=view), view_signature(view),
+                               track=view.endswith('.sqlite'))
+
+
+def open_cube(view=None, cube_path=CUBE_PATH):
+    """Load the saved cube and refresh it from the view, or build it; saves when anything changed."""
+    view = view or storage.view_path()
+    if os.path.exists(cube_path):
+        cube = PortfolioCube.load(cube_path)
+        summary = cube.refresh(view)
+    else:
+        cube = build_cube(view)
+        summary = f'built from {cube.applications:,} applications'
+    if summary is not None:
+        cube.save(cube_path)
+    return cube, summary
+
+
+def scan_query(view, by=(), filters=None):
+    """The same answer as PortfolioCube.query, recomputed from the application rows as the dashboards did."""
+    mask = np.ones(len(view), dtype=bool)
+    for dim, allowed in (filters or {}).items():
+        mask &= view[dim].isin(list(allowed)).to_numpy()
+    frame = view[mask]
+    frame = frame.assign(**{col: frame[col].fillna(MISSING) for col in DIMENSIONS if frame[col].isna().any()})
+    measures = {'applications': ('Application_ID', 'size')}
+    measures.update({name: (col, 'sum') for name, col in MEASURES.items()})
+    if by:
+        frame = frame.groupby(list(by), observed=True).agg(**measures)
+    else:
+        frame = pd.DataFrame({name: [frame[col].sum() if how == 'sum' else len(frame)]
+                              for name, (col, how) in measures.items()})
+    return derive(frame.astype('float64'))
+
+
+def same_answer(a, b):
+    return (len(a) == len(b) and list(map(str, a.index)) == list(map(str, b.index))
+            and np.allclose(a.to_numpy(dtype='float64'), b.to_numpy(dtype='float64'), rtol=1e-6, equal_nan=True))
+
+
+def random_query(cube, rng):
+    dims = list(rng.permutation(DIMENSIONS))
+    filters = {}
+    for dim in dims[:rng.integers(0, 3)]:
+        levels = cube.levels(dim)
+        filters[dim] = list(rng.choice(levels, size=rng.integers(1, len(levels) + 1), replace=False))
+    return dims[:rng.integers(0, 3)], filters
+
+
+def bench(view_file, n_queries, seed=0):
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    view = storage.read_view(columns=CUBE_COLUMNS, path=view_file)
+    read_secs = time.perf_counter() - start
+    start = time.perf_counter()
+    cube = PortfolioCube.build(view)
+    build_secs = time.perf_counter() - start
+    print(f'{len(view):,} applications, {len(cube.cells):,} base cells '
+          f'(read {read_secs:.2f}s, build {build_secs:.2f}s)')
+
+    queries = [random_query(cube, rng) for _ in range(n_queries)]
+    cube_ms, scan_ms, mismatches = [], [], 0
+    # the dashboard's previous path: filter the in-memory rows and group them on every interaction
+    for by, filters in queries:
+        start = time.perf_counter()
+        fast = cube.query(by, filters)
+        cube_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        slow = scan_query(view, by, filters)
+        scan_ms.append((time.perf_counter() - start) * 1000)
+        mismatches += not same_answer(fast, slow)
+    for name, ms in [('cube query', cube_ms), ('row scan', scan_ms)]:
+        print(f'{name:<12} p50 {np.percentile(ms, 50):8.2f} ms | p99 {np.percentile(ms, 99):8.2f} ms')
+    print(f'speedup (p50) {np.percentile(scan_ms, 50) / np.percentile(cube_ms, 50):.0f}x; '
+          + ('all answers match the row scan' if not mismatches else f'{mismatches} ANSWERS DIFFER'))
+
+    # incremental refresh of a tracked (feature-store) cube, given the changes a sync reports:
+    # 1% of applications change grade and amount, 0.5% are removed
+    tracked = PortfolioCube.build(view, track=True)
+    changed = view.copy()
+    rows = rng.choice(len(changed), size=max(1, len(changed) // 100), replace=False)
+    grades = changed['Grade'].cat.categories if isinstance(changed['Grade'].dtype, pd.CategoricalDtype) \
+        else pd.Index(changed['Grade'].unique())
+    changed.iloc[rows, changed.columns.get_loc('Grade')] = rng.choice(grades, size=len(rows))
+    changed.iloc[rows, changed.columns.get_loc('Requested_Loan_Amount')] += 1000
+    dropped = rng.choice(len(changed), size=len(changed) // 200, replace=False)
+    removed = changed['Application_ID'].to_numpy()[dropped]
+    written = changed.iloc[np.setdiff1d(rows, dropped)]
+    changed = changed.drop(changed.index[dropped])
+    start = time.perf_counter()
+    counts = tracked.merge(contributions(written), removed)
+    update_secs = time.perf_counter() - start
+    start = time.perf_counter()
+    rebuilt = PortfolioCube.build(changed)
+    rebuild_secs = time.perf_counter() - start
+    same = same_answer(derive(tracked.cells).sort_index(), derive(rebuilt.cells).sort_index())
+    # a file-backed cube re-reads the view to rebuild; a store cube reads only the changed rows
+    print(f'refresh from a sync ({counts[1]:,} changed, {counts[2]:,} removed) {update_secs:.3f}s vs re-read and '
+          f'rebuild {read_secs + rebuild_secs:.2f}s (aggregation alone {rebuild_secs:.3f}s); '
+          + ('refreshed cube matches a rebuild' if same else 'REFRESHED CUBE DIFFERS'))
+    return not mismatches and same
+
+
+def parse_filters(items):
+    filters = {}
+    for item in items or []:
+        dim, _, values = item.partition('=')
+        filters[dim] = values.split(',')
+    return filters
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['build', 'refresh', 'query', 'bench'])
+    parser.add_argument('--view', help='modeling view file or feature store (default: storage.view_path())')
+    parser.add_argument('--cube', default=CUBE_PATH)
+    parser.add_argument('--filter', action='append', metavar='DIM=V1,V2', help='keep these values of a dimension')
+    parser.add_argument('--by', nargs='*', default=[], help='dimensions to group by')
+    parser.add_argument('--queries', type=int, default=200, help='random queries for bench')
+    args = parser.parse_args()
+    view = args.view or storage.view_path()
+
+    if args.command == 'bench':
+        if not bench(view, args.queries):
+            raise SystemExit(1)
+    elif args.command == 'build':
+        start = time.perf_counter()
+        cube = build_cube(view)
+        cube.save(args.cube)
+        print(f'{cube.applications:,} applications -> {len(cube.cells):,} base cells in {args.cube} '
+              f'({time.perf_counter() - start:.2f}s)')
+    else:
+        start = time.perf_counter()
+        cube, summary = open_cube(view, args.cube)
+        if args.command == 'refresh':
+            print('cube is up to date' if summary is None else f'{summary} ({time.perf_counter() - start:.2f}s)')
+        else:
+            start = time.perf_counter()
+            result = cube.query(args.by, parse_filters(args.filter))
+            secs = time.perf_counter() - start
+            print(result.to_string(float_format=lambda x: f'{x:,.4f}'))
+            print(f'({secs * 1000:.2f} ms)')
@@ -0,0 +1,148 @@
+"""
+Score a modeling view with the trained model, without retraining.
+
+credit_risk_model.pkl is loaded once per worker process. The input is streamed in chunks of
+--chunksize rows (only the keys, the model features and Default_12m are read) and the chunks are
+fanned out across --workers processes. At most two chunks per worker are in flight, so memory stays
+bounded. Results are collected in submission order, so the output rows follow the input order
+whatever the worker count. Predictions are appended to the output as each chunk completes.
+
+With --workers 0 the chunks are scored in this process, and --n-jobs sets the forest's own thread
+count instead.
+
+With --feature-cache the input's features come from feature_cache.py's memory-mapped matrix (built
+on the first run for that view content). The workers map the matrix themselves and are sent row
+ranges, so no chunk of data is parsed in this process or pickled to a worker.
+
+Usage:
+    python score_credit_risk_model.py [--input modeling_view_with_risk] [--output modeling_view_with_predictions]
+                                      [--format csv|parquet] [--chunksize 200000] [--workers N] [--n-jobs N]
+                                      [--feature-cache]
+"""
+
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+
+import feature_cache
+import instrumentation
+import storage
+from train_credit_risk_model import features
+
+model_path = 'credit_risk_model.pkl'
+
+_clf = None
+_matrix = None
+
+
+def load_model(path=model_path, n_jobs=None, matrix=None):
+    global _clf, _matrix
+    _clf = joblib.load(path)
+    if n_jobs is not None:
+        _clf.n_jobs = n_jobs
+    _matrix = matrix
+
+
+def score_chunk(chunk):
+    out = chunk[[c for c in storage.KEY_COLUMNS + ['Default_12m'] if c in chunk.columns]].copy()
+    out['Model_Pred_Prob'] = _clf.predict_proba(chunk[features])[:, 1]
+    return out
+
+
+def score_rows(bounds):
+    # rows [start, stop) of the worker's own mapping of the feature cache
+    return _clf.predict_proba(_matrix.frame(slice(*bounds)))[:, 1]
+
+
+def cached_rows(matrix, bounds, prob):
+    out = matrix.keys(slice(*bounds))
+    if matrix.labeled:
+        out['Default_12m'] = matrix.labels(slice(*bounds))
+    out['Model_Pred_Prob'] = prob
+    return out
+
+
+def input_columns(path):
+    # Default_12m is carried through when the input has it (the modeling view does; new applications don't)
+    available = storage.table_columns(path)
+    return [c for c in storage.KEY_COLUMNS + features + ['Default_12m'] if c in available]
+
+
+def score_file(input_path=storage.VIEW_PATH, output_path=storage.PREDICTIONS_PATH, fmt=None, chunksize=200_000,
+               workers=None, n_jobs=None, model=model_path, cache=False):
+    """Score input_path chunk by chunk into output_path; returns the number of rows scored."""
+    if fmt is None:
+        fmt = 'parquet' if storage.stored_path(input_path).endswith('.parquet') else 'csv'
+    if cache:
+        return score_cached(feature_cache.load(input_path, features), output_path, fmt, chunksize, workers, n_jobs, model)
+    chunks = storage.iter_table(input_path, chunksize, columns=input_columns(input_path),
+                                schema=storage.view_schema())
+    rows = 0
+    with storage.TableWriter(output_path, fmt, schema=storage.predictions_schema()) as writer:
+        if workers == 0:
+            load_model(model, n_jobs)
+            for chunk in chunks:
+                writer.write(score_chunk(chunk))
+                rows += len(chunk)
+            return rows
+        with ProcessPoolExecutor(max_workers=workers, initializer=load_model, initargs=(model, n_jobs)) as pool:
+            window = 2 * (workers or os.cpu_count())
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(score_chunk, chunk))
+                if len(pending) >= window:
+                    result = pending.popleft().result()
+                    writer.write(result)
+                    rows += len(result)
+            while pending:
+                result = pending.popleft().result()
+                writer.write(result)
+                rows += len(result)
+    return rows
+
+
+def score_cached(matrix, output_path, fmt, chunksize, workers, n_jobs, model):
+    """score_file over a feature_cache.FeatureMatrix: workers get row ranges and read the shared mapping."""
+    bounds = [(start, min(start + chunksize, len(matrix))) for start in range(0, len(matrix), chunksize)]
+    with storage.TableWriter(output_path, fmt, schema=storage.predictions_schema()) as writer:
+        if workers == 0:
+            load_model(model, n_jobs, matrix)
+            for b in bounds:
+                writer.write(cached_rows(matrix, b, score_rows(b)))
+            return len(matrix)
+        with ProcessPoolExecutor(max_workers=workers, initializer=load_model, initargs=(model, n_jobs, matrix)) as pool:
+            # the matrix pickles as its directory, so a task is just two integers
+            for b, prob in zip(bounds, pool.map(score_rows, bounds)):
+                writer.write(cached_rows(matrix, b, prob))
+    return len(matrix)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', default=storage.VIEW_PATH, help='modeling view to score (.csv or .parquet)')
+    parser.add_argument('--output', default=storage.PREDICTIONS_PATH)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None,
+                        help='output format (default: the format of the input)')
+    parser.add_argument('--model', default=model_path)
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='scoring processes (default: one per CPU; 0 scores in this process)')
+    parser.add_argument('--n-jobs', type=int, default=None, help="the forest's own n_jobs inside each scorer")
+    parser.add_argument('--feature-cache', action='store_true',
+                        help="read the input's features from the memory-mapped feature cache (feature_cache.py)")
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='record time and memory to REPORT (.json or .csv, see instrumentation.py)')
+    args = parser.parse_args()
+    instrumentation.enable(args.profile)
+
+    start = time.perf_counter()
+    with instrumentation.stage('score') as st:
+        rows = score_file(args.input, args.output, args.format, args.chunksize, args.workers, args.n_jobs, args.model,
+                          args.feature_cache)
+        st.rows = rows
+    secs = time.perf_counter() - start
+    print(f'Scored {rows:,} rows in {secs:.2f}s ({rows / secs:,.0f} rows/sec) -> {storage.stem(args.output)}')
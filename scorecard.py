@@ -0,0 +1,157 @@
+"""
+Table-driven scorecard engine.
+Bucketing, points, PD calibration and grade mapping are expressed as bin tables
+and evaluated with NumPy searchsorted over whole columns instead of per-row Python calls.
+"""
+
+import numpy as np
+import pandas as pd
+
+BASE_SCORE = 600
+
+# Each bin table lists ascending edges and one output per bin (len(edges) + 1).
+# side='right' means a value equal to an edge falls in the upper bin (x < edge tests),
+# side='left' means it stays in the lower bin (x <= edge tests).
+# NaN always sorts past the last edge, matching the final else-branch of the original if/elif ladders.
+# 'exact' lists values matched by equality before the edges; they take the first outputs
+# and the edges index the outputs after them.
+
+UTILIZATION_BINS = {
+    'edges': [0.1, 0.3, 0.5, 0.8],
+    'side': 'right',
+    'labels': ['0-10%', '10-30%', '30-50%', '50-80%', '>80%'],
+}
+LATE_PAY_BINS = {
+    # '0' and '1' are equality tests in the scorecard; everything else up to 3 is '2-3'
+    'exact': [0, 1],
+    'edges': [3],
+    'side': 'left',
+    'labels': ['0', '1', '2-3', '>3'],
+}
+INQUIRY_BINS = {
+    'edges': [1, 3, 6],
+    'side': 'left',
+    'labels': ['0-1', '2-3', '4-6', '>6'],
+}
+TENURE_BINS = {
+    'edges': [6, 12, 24],
+    'side': 'right',
+    'labels': ['<6', '6-12', '12-24', '>24'],
+}
+
+# Points keyed by bucket label; labels not listed fall through to 'default' like the original else-branches
+UTILIZATION_POINTS = {'points': {'0-10%': 0, '10-30%': 10, '30-50%': 20, '50-80%': 35}, 'default': 55}
+LATE_PAY_POINTS = {'points': {'0': 0, '1': 15, '2-3': 35}, 'default': 60}
+INQUIRY_POINTS = {'points': {'0-1': 0, '2-3': 10, '4-6': 25}, 'default': 45}
+INCOME_STABILITY_POINTS = {'points': {'High': 0, 'Medium': 10}, 'default': 25}
+TENURE_POINTS = {'points': {'>24': 0, '12-24': 10, '6-12': 20}, 'default': 35}
+
+# Numeric features scored directly from their value
+DTI_POINTS = {'edges': [0.25, 0.35, 0.5], 'side': 'left', 'labels': [0, 10, 25, 45]}
+LTV_POINTS = {'edges': [0.6, 0.8, 1.0], 'side': 'left', 'labels': [0, 15, 35, 60]}
+
+# Simple calibration: map Total_Points to PD_hat (pd_calibration.py fits an empirical one to replace it)
+PD_CALIBRATION = {'edges': [50, 100, 150, 200], 'side': 'left', 'labels': [0.005, 0.02, 0.045, 0.09, 0.15]}
+GRADE_BINS = {
+    'edges': [0.01, 0.03, 0.07],
+    'side': 'right',
+    'labels': ['Prime', 'Near-prime', 'Sub-prime', 'High-risk'],
+}
+
+# Scorecard points column -> (source column, table); bucket tables score labels, bin tables score values
+POINTS_COLUMNS = {
+    'Points_DTI': ('DTI', DTI_POINTS),
+    'Points_Utilization': ('Utilization_Bucket', UTILIZATION_POINTS),
+    'Points_LatePay': ('Late_Pay_Bucket', LATE_PAY_POINTS),
+    'Points_Inquiry': ('Inq_Bucket', INQUIRY_POINTS),
+    'Points_IncomeStability': ('Income_Stability', INCOME_STABILITY_POINTS),
+    'Points_LTV': ('LTV', LTV_POINTS),
+    'Points_Tenure': ('Tenure_Bucket', TENURE_POINTS),
+}
+
+
+def bin_index(values, table):
+    """Return the bin number of every value in a bin table."""
+    x = np.asarray(values, dtype='float64')
+    exact = table.get('exact', [])
+    idx = np.searchsorted(np.asarray(table['edges'], dtype='float64'), x, side=table['side']) + len(exact)
+    for bin_no, value in enumerate(exact):
+        idx[x == value] = bin_no
+    return idx
+
+
+def apply_bins(values, table):
+    """Map numeric values through a bin table, returning the bin outputs as an array."""
+    return bin_outputs(table)[bin_index(values, table)]
+
+
+def bin_outputs(table):
+    """The outputs of a bin table as an array; string labels stay Python objects like the original columns."""
+    outputs = np.asarray(table['labels'])
+    return outputs.astype(object) if outputs.dtype.kind == 'U' else outputs
+
+
+def lookup_points(labels, table):
+    """Map bucket labels to points, with unknown labels getting the table default."""
+    codes = pd.Categorical(labels, categories=list(table['points'])).codes
+    values = np.append(np.asarray(list(table['points'].values()), dtype='int64'), table['default'])
+    # code -1 (label not in the table) indexes the trailing default
+    return values[codes]
+
+
+def feature_points(model):
+    """Return a DataFrame of the seven Points_* columns for a modeling view."""
+    out = {}
+    for col, (source, table) in POINTS_COLUMNS.items():
+        if 'edges' in table:
+            out[col] = apply_bins(model[source], table).astype('int64')
+        else:
+            out[col] = lookup_points(model[source].to_numpy(), table)
+    return pd.DataFrame(out, index=model.index)
+
+
+def calibrate_pd(total_points):
+    """Vectorized PD_hat from Total_Points."""
+    return apply_bins(total_points, PD_CALIBRATION).astype('float64')
+
+
+def grade_map(pd_hat):
+    """Vectorized Grade from PD_hat."""
+    return apply_bins(pd_hat, GRADE_BINS)
+
+
+def risk_profile(grade, pd_hat):
+    """Risk_Profile labels ('<Grade> | PD_hat: <PD_hat to 3 dp>') as a Categorical, formatted once per distinct pair."""
+    grade_codes, grades = pd.factorize(np.asarray(grade, dtype=object))
+    pd_codes, pds = pd.factorize(np.asarray(pd_hat, dtype='float64'))
+    pairs, inverse = np.unique(grade_codes * len(pds) + pd_codes, return_inverse=True)
+    labels = np.asarray(grades[pairs // len(pds)], dtype=object) + ' | PD_hat: ' \
+        + pd.Series(pds[pairs % len(pds)]).round(3).astype(str).to_numpy()
+    categories, remap = np.unique(labels.astype(str), return_inverse=True)
+    return pd.Categorical.from_codes(remap[inverse], categories)
+
+
+def score(model, calibration=None):
+    """
+    Return the points, total score, PD_hat, Grade and Risk_Profile columns for a modeling view.
+    A fitted Total_Points calibration (pd_calibration.PDCalibration) replaces the PD_CALIBRATION ladder.
+    """
+    scored = feature_points(model)
+    scored['Total_Points'] = scored[list(POINTS_COLUMNS)].sum(axis=1)
+    scored['Total_Score'] = BASE_SCORE - scored['Total_Points']
+    if calibration is not None:
+        scored['PD_hat'] = calibration.apply(scored['Total_Points'])
+        scored['Grade'] = grade_map(scored['PD_hat'])
+        scored['Risk_Profile'] = np.asarray(risk_profile(scored['Grade'], scored['PD_hat']), dtype=object)
+        return scored
+    # PD_hat, Grade and Risk_Profile are all functions of the calibration bin, so resolve
+    # them once per bin and gather, rather than formatting a string per row
+    pd_levels = bin_outputs(PD_CALIBRATION).astype('float64')
+    grade_levels = grade_map(pd_levels)
+    profile_levels = np.asarray(risk_profile(grade_levels, pd_levels), dtype=object)
+    idx = bin_index(scored['Total_Points'], PD_CALIBRATION)
+    scored['PD_hat'] = pd_levels[idx]
+    scored['Grade'] = grade_levels[idx]
+    # Risk profile summary
+    scored['Risk_Profile'] = profile_levels[idx]
+    return scored
@@ -0,0 +1,249 @@
+"""
+Online scoring service for single loan applications.
+
+The scorecard tables (scorecard.py), the trained RandomForest (credit_risk_model.pkl) and the fill
+medians of the last build (modeling_view_fill_values.json, written by build_modeling_view.py) are
+loaded once at startup. Each request carries raw application records with the same fields as the
+source sheets; the service runs the build's feature engineering, median fill and scorecard on them
+and adds the model probability. PD_hat comes from the PD_CALIBRATION ladder, or from --calibration
+when the view was built with build_modeling_view.py --calibration. With --artifact, a compiled artifact
+(compiled_model.py) replaces all of these, its calibration included: it loads in milliseconds and
+scores a request without pandas or sklearn.
+
+Concurrent requests are micro-batched: a single scoring thread takes whatever requests are queued,
+waiting at most --max-wait-ms for more once the first arrives, up to --max-batch records, and scores
+them as one frame. Under load this amortizes the per-call pandas and predict_proba overhead; an
+idle service scores a lone request immediately after the wait.
+
+Endpoints:
+    POST /score     body: one application object, or a list of them; returns the same shape
+    GET  /health    model path, number of batches and records scored
+
+Usage:
+    python scoring_service.py [--host 127.0.0.1] [--port 8080] [--max-batch 64] [--max-wait-ms 2]
+                              [--calibration pd_calibration.json | --artifact credit_risk_model.npz]
+    python load_test_scoring.py --spawn          # p50/p99 latency and throughput
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import build_modeling_view as bmv
+import scorecard
+import storage
+from train_credit_risk_model import features
+
+model_path = 'credit_risk_model.pkl'
+
+# Type of every source-sheet field, so JSON values are coerced the way the sheets are read
+FIELD_TYPES = {}
+for _schema in storage.SOURCE_SCHEMAS.values():
+    FIELD_TYPES.update(_schema)
+# Source fields feature engineering reads; absent ones are treated as missing
+INPUT_FIELDS = [
+    'Total_Monthly_Obligations', 'Net_Monthly_Income', 'Collateral_Value', 'Requested_Loan_Amount',
+    'Credit_Utilization_Ratio', 'Number_of_Late_Payments', 'Credit_Inquiries_Last_12_Months',
+    'Years_in_Current_Job', 'Geolocation_Risk_Score', 'Application_Date', 'Customer_Since',
+    'Average_Monthly_Balance',
+]
+OUTPUT_COLUMNS = [
+    'DTI', 'LTV', 'Utilization_Bucket', 'Late_Pay_Bucket', 'Inq_Bucket', 'Income_Stability', 'Tenure_Bucket',
+    *scorecard.POINTS_COLUMNS, 'Total_Points', 'Total_Score', 'PD_hat', 'Grade', 'Risk_Profile', 'Model_Pred_Prob',
+]
+
+
+def application_frame(records):
+    """Raw records to a typed frame of the keys and input fields; other fields are not needed to score."""
+    frame = pd.DataFrame.from_records(records, columns=storage.KEY_COLUMNS + INPUT_FIELDS)
+    for col in INPUT_FIELDS:
+        if FIELD_TYPES[col] in ('int', 'float'):
+            frame[col] = pd.to_numeric(frame[col], errors='coerce').astype('float64')
+    return frame
+
+
+def score_applications(records, clf, medians, calibration=None):
+    """
+    Score raw application records; returns a frame of the keys (None when not given) and OUTPUT_COLUMNS.
+    A fitted Total_Points calibration replaces the PD_hat ladder, as in the build.
+    """
+    frame = bmv.engineer_features(application_frame(records))
+    # Buckets are taken before the fill, as in the build; only the derived numerics need the medians
+    for col in ['DTI', 'LTV', 'Tenure_Months']:
+        frame[col] = frame[col].fillna(medians[col])
+    scored = pd.concat([frame, scorecard.score(frame, calibration)], axis=1)
+    scored['Model_Pred_Prob'] = clf.predict_proba(scored[features])[:, 1]
+    return scored[storage.KEY_COLUMNS + OUTPUT_COLUMNS]
+
+
+def score_compiled(records, compiled):
+    """score_applications with a compiled_model.CompiledModel in place of the pickle and fill values."""
+    scored = compiled.score_records(records)
+    frame = pd.DataFrame({c: [r.get(c) for r in records] for c in storage.KEY_COLUMNS})
+    for col in OUTPUT_COLUMNS:
+        frame[col] = scored[col]
+    return frame
+
+
+def json_records(frame):
+    out = frame.astype(object).where(frame.notna(), None)
+    return [{k: v.item() if isinstance(v, np.generic) else v for k, v in row.items()}
+            for row in out.to_dict('records')]
+
+
+class MicroBatcher:
+    """Collects concurrent scoring calls and scores them together on one thread."""
+
+    def __init__(self, score_fn, max_batch=64, max_wait_ms=2.0):
+        self.score_fn = score_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.records = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, records):
+        """Queue a list of records; the Future resolves to their list of result dicts."""
+        future = Future()
+        self.queue.put((records, future))
+        return future
+
+    def _collect(self):
+        pending = [self.queue.get()]
+        size = len(pending[0][0])
+        end = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = end - time.monotonic()
+            try:
+                item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            records = [r for recs, _ in pending for r in recs]
+            try:
+                results = json_records(self.score_fn(records))
+            except Exception:
+                # one bad record should not fail its neighbours: score each request on its own
+                for recs, future in pending:
+                    try:
+                        future.set_result(json_records(self.score_fn(recs)))
+                    except Exception as exc:
+                        future.set_exception(exc)
+            else:
+                start = 0
+                for recs, future in pending:
+                    future.set_result(results[start:start + len(recs)])
+                    start += len(recs)
+            self.batches += 1
+            self.records += len(records)
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    # keep-alive, so clients can reuse one connection for many requests
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes; without TCP_NODELAY the second waits on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self.send_json(404, {'error': 'not found'})
+        batcher = self.server.batcher
+        self.send_json(200, {'status': 'ok', 'model': self.server.model_path,
+                             'batches': batcher.batches, 'records': batcher.records})
+
+    def do_POST(self):
+        if self.path != '/score':
+            return self.send_json(404, {'error': 'not found'})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except (ValueError, TypeError) as exc:
+            return self.send_json(400, {'error': f'invalid JSON: {exc}'})
+        single = isinstance(body, dict)
+        records = [body] if single else body
+        if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+            return self.send_json(400, {'error': 'expected an application object or a non-empty list of them'})
+        try:
+            results = self.server.batcher.submit(records).result()
+        except Exception as exc:
+            return self.send_json(500, {'error': str(exc)})
+        self.send_json(200, results[0] if single else results)
+
+    def log_message(self, format, *args):
+        # per-request access logs would dominate latency under load
+        pass
+
+
+def make_server(host='127.0.0.1', port=8080, model=model_path, fill_values=bmv.fill_values_path,
+                max_batch=64, max_wait_ms=2.0, artifact=None, calibration=None):
+    if artifact:
+        from compiled_model import CompiledModel
+        compiled = CompiledModel.load(artifact)
+        score_fn = lambda records: score_compiled(records, compiled)
+    else:
+        clf = joblib.load(model)
+        medians = bmv.load_fill_values(fill_values)
+        score_fn = lambda records: score_applications(records, clf, medians, calibration)
+    server = ThreadingHTTPServer((host, port), ScoringHandler)
+    server.daemon_threads = True
+    server.model_path = artifact or model
+    server.batcher = MicroBatcher(score_fn, max_batch, max_wait_ms)
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--model', default=model_path)
+    parser.add_argument('--fill-values', default=bmv.fill_values_path,
+                        help='fill medians written by build_modeling_view.py')
+    parser.add_argument('--max-batch', type=int, default=64, help='most records scored in one batch')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0,
+                        help='how long the first queued request waits for others to join its batch')
+    parser.add_argument('--calibration', metavar='PATH',
+                        help='PD_hat from the fitted Total_Points calibration the view was built with (see pd_calibration.py)')
+    parser.add_argument('--artifact', help='serve a compiled artifact (compiled_model.py export) instead of --model')
+    args = parser.parse_args()
+
+    calibration = None
+    if args.calibration:
+        if args.artifact:
+            parser.error('--calibration does not apply to --artifact (export the artifact with --calibration)')
+        from pd_calibration import PDCalibration
+        calibration = PDCalibration.load(args.calibration)
+        if calibration.score != 'Total_Points':
+            parser.error(f'{args.calibration} calibrates {calibration.score}; PD_hat needs a Total_Points calibration')
+    server = make_server(args.host, args.port, args.model, args.fill_values, args.max_batch, args.max_wait_ms,
+                         args.artifact, calibration)
+    print(f'Scoring service listening on http://{args.host}:{args.port} (model: {args.artifact or args.model})',
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
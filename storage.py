@@ -0,0 +1,468 @@
+"""
+Columnar storage for the source sheets and the modeling views.
+
+Datasets are written as Parquet with an explicit schema per dataset, so readers never re-infer types.
+Bucket and grade columns are stored as dictionary-encoded categoricals. Readers can project the columns
+they need and memory-map the file. Readers use the Parquet file unless only the CSV exists or the CSV
+is newer (applying the same projection and categorical dtypes), so scripts keep working on a CSV-only
+checkout and never read a stale Parquet copy.
+
+Dates are kept as ISO strings in both formats so the build sees the same frame either way.
+
+In memory the modeling view is compacted (compact_view): repetitive text columns become Categoricals,
+integer columns the narrowest int, float columns float32 where that is lossless, and the Yes/No and
+True/False flags nullable booleans. Writers store the canonical layout again (stored_frame), so the
+files do not depend on how compact the writer's frame was. Risk_Profile is not stored; read_view
+derives it from Grade and PD_hat. read_view can also read a feature store (feature_store.py): see view_path().
+
+Usage:
+    python storage.py convert              # write .parquet next to every source sheet and modeling view CSV
+"""
+
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+import scorecard
+
+SOURCE_DIR = 'excel_sheets_csv'
+VIEW_PATH = 'modeling_view_with_risk'
+PREDICTIONS_PATH = 'modeling_view_with_predictions'
+EXPLANATIONS_PATH = 'modeling_view_with_explanations'
+
+# Logical column types: 'int', 'float', 'str', 'bool' or a list of category labels.
+# 'int' columns are nullable; pandas reads them back as float64 when they contain missing values.
+SOURCE_SCHEMAS = {
+    'Banking_Relationship': {
+        'Applicant_ID': 'int', 'Customer_Since': 'str', 'Account_Types': 'str', 'Average_Monthly_Balance': 'int',
+        'Transaction_Volume': 'int', 'Cross_Sell_Products': 'str', 'Customer_Segment': 'str',
+        'Relationship_Manager_ID': 'str', 'Previous_Loan_History': 'str', 'Repayment_Track_Record': 'str',
+    },
+    'Collateral_Security': {
+        'Application_ID': 'int', 'Collateral_Type': 'str', 'Collateral_Value': 'int', 'Loan_to_Value_Ratio': 'float',
+        'Property_Location': 'str', 'Property_Age': 'int', 'Market_Valuation_Date': 'str', 'Insurance_Coverage': 'str',
+        'Legal_Clear_Title': 'str', 'Third_Party_Guarantors': 'str',
+    },
+    'Credit_Bureau_Data': {
+        'Applicant_ID': 'int', 'Credit_Score': 'int', 'Credit_History_Length': 'int', 'Number_of_Credit_Accounts': 'int',
+        'Active_Credit_Cards': 'int', 'Credit_Utilization_Ratio': 'float', 'Payment_History_Score': 'float',
+        'Number_of_Late_Payments': 'int', 'Previous_Defaults': 'bool', 'Bankruptcy_History': 'bool',
+        'Credit_Inquiries_Last_12_Months': 'int', 'Credit_Mix_Score': 'float',
+    },
+    'Employment_Income': {
+        'Applicant_ID': 'int', 'Employment_Status': 'str', 'Employer_Name': 'str', 'Industry_Sector': 'str',
+        'Job_Title': 'str', 'Years_in_Current_Job': 'int', 'Total_Work_Experience': 'int', 'Monthly_Gross_Income': 'int',
+        'Net_Monthly_Income': 'int', 'Additional_Income_Sources': 'int', 'Income_Stability_Score': 'float',
+        'Employer_Credit_Rating': 'str',
+    },
+    'External_Data_Sources': {
+        'Applicant_ID': 'int', 'Utility_Payment_History': 'str', 'Mobile_Phone_Bill_Payments': 'str',
+        'Social_Media_Risk_Indicators': 'str', 'Geolocation_Risk_Score': 'float', 'Device_Fingerprint_Data': 'str',
+        'Alternative_Credit_Score': 'int', 'Psychometric_Assessment_Score': 'float', 'Digital_Footprint_Analysis': 'str',
+    },
+    'Financial_Obligations': {
+        'Applicant_ID': 'int', 'Existing_EMI_Amount': 'int', 'Credit_Card_Outstanding': 'int',
+        'Other_Loan_Balances': 'int', 'Total_Monthly_Obligations': 'int', 'Debt_to_Income_Ratio': 'float',
+        'Free_Cash_Flow': 'int', 'Savings_Account_Balance': 'int', 'Investment_Portfolio_Value': 'int',
+        'Fixed_Deposit_Amount': 'int',
+    },
+    'Loan_Application_Details': {
+        'Application_ID': 'int', 'Applicant_ID': 'int', 'Loan_Type': 'str', 'Requested_Loan_Amount': 'int',
+        'Loan_Tenure_Months': 'int', 'Interest_Rate_Offered': 'float', 'Purpose_of_Loan': 'str',
+        'Application_Date': 'str', 'Application_Source': 'str', 'Processing_Branch': 'str',
+    },
+    'Personal_Demographics': {
+        'Applicant_ID': 'int', 'Full_Name': 'str', 'Date_of_Birth': 'str', 'Age': 'int', 'Gender': 'str',
+        'Marital_Status': 'str', 'Number_of_Dependents': 'int', 'Education_Level': 'str',
+        'Contact_Information': 'str', 'Identity_Verification': 'str',
+    },
+    'Regulatory_Compliance': {
+        'Application_ID': 'int', 'KYC_Compliance_Status': 'str', 'AML_Check_Result': 'str',
+        'Sanctions_List_Screening': 'str', 'PEP_Check': 'str', 'FATCA_Compliance': 'str',
+        'Regulatory_Limit_Check': 'str', 'Sector_Exposure_Limit': 'str', 'Single_Borrower_Limit': 'str',
+    },
+    'Risk_Assessment_Scores': {
+        'Application_ID': 'int', 'Applicant_ID': 'int', 'Internal_Risk_Score': 'float',
+        'Probability_of_Default': 'float', 'Loss_Given_Default': 'float', 'Exposure_at_Default': 'int',
+        'Expected_Loss': 'int', 'Risk_Grade': 'str', 'Automated_Decision': 'str', 'Manual_Override_Flag': 'bool',
+        'Final_Decision': 'str', 'Decision_Date': 'str',
+    },
+}
+
+# Columns the build adds to the merged sheets, in output order
+DERIVED_SCHEMA = {
+    'Default_12m': 'int',
+    'Period': ['Train', 'Validation', 'OOT'],
+    'DTI': 'float',
+    'LTV': 'float',
+    'Utilization_Bucket': scorecard.UTILIZATION_BINS['labels'],
+    'Late_Pay_Bucket': scorecard.LATE_PAY_BINS['labels'],
+    'Inq_Bucket': scorecard.INQUIRY_BINS['labels'],
+    'Income_Stability': ['High', 'Medium', 'Low'],
+    'Geolocation_Risk_Bucket': ['Very Low', 'Low', 'Medium', 'High', 'Very High'],
+    'Tenure_Months': 'float',
+    'Tenure_Bucket': scorecard.TENURE_BINS['labels'],
+    'Avg_Balance_Bucket': ['Low', 'Medium', 'High'],
+    **{col: 'int' for col in scorecard.POINTS_COLUMNS},
+    'Total_Points': 'int',
+    'Total_Score': 'int',
+    'PD_hat': 'float',
+    'Grade': scorecard.GRADE_BINS['labels'],
+}
+
+# Derived on read from Grade and PD_hat (scorecard.risk_profile) rather than stored
+RISK_PROFILE_INPUTS = ['Grade', 'PD_hat']
+
+# Two-valued flag columns of the view -> (true label, false label); anything else (the fill's 'Unknown') is NA
+FLAG_COLUMNS = {
+    'Previous_Defaults': ('True', 'False'), 'Bankruptcy_History': ('True', 'False'),
+    'Insurance_Coverage': ('Yes', 'No'), 'Legal_Clear_Title': ('Yes', 'No'),
+    'PEP_Check': ('Yes', 'No'), 'FATCA_Compliance': ('Yes', 'No'),
+}
+FLAG_MISSING = 'Unknown'
+
+# float32 holds up to 7 significant digits; columns with at most this many decimals are candidates
+FLOAT32_MAX_DECIMALS = 4
+
+KEY_COLUMNS = ['Application_ID', 'Applicant_ID']
+
+
+def view_schema():
+    """Schema of modeling_view_with_risk, derived from the source sheets plus the build's columns."""
+    import build_modeling_view as bmv
+    schema = dict(SOURCE_SCHEMAS['Loan_Application_Details'])
+    for name, _ in bmv.joins:
+        sheet = os.path.splitext(bmv.files[name])[0]
+        schema.update({c: t for c, t in SOURCE_SCHEMAS[sheet].items() if c not in schema})
+    for col in bmv.leakage_cols:
+        schema.pop(col, None)
+    for col, kind in schema.items():
+        if col in KEY_COLUMNS:
+            continue
+        # median fills can make integer sheet columns fractional, and flags pick up 'Unknown'
+        if kind == 'int':
+            schema[col] = 'float'
+        elif kind == 'bool':
+            schema[col] = 'str'
+    schema.update(DERIVED_SCHEMA)
+    return schema
+
+
+def predictions_schema():
+    return {'Application_ID': 'int', 'Applicant_ID': 'int', 'Default_12m': 'int', 'Model_Pred_Prob': 'float'}
+
+
+def explanations_schema():
+    """Schema of model_explanations.py's per-application contributions and reason codes."""
+    import model_explanations
+    schema = {'Application_ID': 'int', 'Applicant_ID': 'int', 'Model_Pred_Prob': 'float'}
+    schema.update({c: 'float' for c in model_explanations.contribution_columns()})
+    schema.update({c: 'str' for c in model_explanations.reason_columns()})
+    return schema
+
+
+def schema_for(path):
+    """Look up the schema for a dataset path by its file stem."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name in SOURCE_SCHEMAS:
+        return SOURCE_SCHEMAS[name]
+    if name == os.path.basename(VIEW_PATH):
+        return view_schema()
+    if name == os.path.basename(PREDICTIONS_PATH):
+        return predictions_schema()
+    if name == os.path.basename(EXPLANATIONS_PATH):
+        return explanations_schema()
+    raise KeyError(f'No schema registered for {path}')
+
+
+def arrow_schema(schema, columns):
+    import pyarrow as pa
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(), 'bool': pa.bool_()}
+    fields = []
+    for col in columns:
+        kind = schema[col]
+        dtype = pa.dictionary(pa.int8(), pa.string(), ordered=True) if isinstance(kind, list) else types[kind]
+        fields.append(pa.field(col, dtype))
+    return pa.schema(fields)
+
+
+def apply_categories(frame, schema):
+    """Give categorical schema columns their fixed, ordered label set."""
+    for col, kind in schema.items():
+        if isinstance(kind, list) and col in frame.columns:
+            frame[col] = pd.Categorical(frame[col], categories=kind, ordered=True)
+    return frame
+
+
+def float32_decimals(values):
+    """
+    The fewest decimals (up to FLOAT32_MAX_DECIMALS) that every finite value has exactly and keeps through
+    a float32 round trip, or None when float32 would lose precision.
+    """
+    x = np.asarray(values, dtype='float64')
+    x = x[np.isfinite(x)]
+    if not len(x):
+        return None
+    for decimals in range(FLOAT32_MAX_DECIMALS + 1):
+        if (np.round(x, decimals) == x).all():
+            if np.abs(x).max() * 10 ** decimals >= 2 ** 24:
+                return None
+            return decimals if (np.round(x.astype('float32').astype('float64'), decimals) == x).all() else None
+    return None
+
+
+def widen_float32(values):
+    """float64 copy of a float32 column, rounded back to the decimals it was narrowed from."""
+    x = np.asarray(values, dtype='float32')
+    wide = x.astype('float64')
+    finite = np.isfinite(x)
+    for decimals in range(FLOAT32_MAX_DECIMALS + 1):
+        rounded = np.round(wide, decimals)
+        if (rounded.astype('float32')[finite] == x[finite]).all():
+            return rounded
+    return wide
+
+
+def compact_flag(values, labels):
+    text = values.astype(str)
+    if not text.isin(list(labels) + [FLAG_MISSING, 'nan']).all():
+        return None
+    flag = pd.Series(pd.NA, index=values.index, dtype='boolean')
+    flag[text == labels[0]] = True
+    flag[text == labels[1]] = False
+    return flag
+
+
+def compact_view(frame, schema=None):
+    """
+    Narrow a modeling view's in-memory dtypes using its schema; values are unchanged (stored_frame
+    restores the stored layout exactly). Works on a copy.
+    """
+    schema = schema or view_schema()
+    out = {}
+    for col in frame.columns:
+        values = frame[col]
+        kind = schema.get(col)
+        if col in FLAG_COLUMNS and not isinstance(values.dtype, pd.BooleanDtype):
+            flag = compact_flag(values, FLAG_COLUMNS[col])
+            values = values if flag is None else flag
+        elif kind == 'str' and values.dtype == object and values.nunique() * 2 <= len(values):
+            values = values.astype('category')
+        elif kind in ('int', 'float') and isinstance(values.dtype, np.dtype) and len(values):
+            # integer columns narrow to the smallest int; float columns (integral or not) stay floats
+            if values.dtype.kind in 'iu':
+                values = pd.to_numeric(values, downcast='integer')
+            elif values.dtype == 'float64' and float32_decimals(values.to_numpy()) is not None:
+                values = values.astype('float32')
+        out[col] = values
+    return pd.DataFrame(out, index=frame.index)
+
+
+def stored_frame(frame, schema):
+    """The stored layout of a (possibly compacted) frame: flags as text, schema dtypes, no Risk_Profile."""
+    if 'Risk_Profile' in frame.columns and 'Risk_Profile' not in schema:
+        frame = frame.drop(columns='Risk_Profile')
+    changed = {}
+    for col in frame.columns:
+        values, kind = frame[col], schema.get(col)
+        if isinstance(values.dtype, pd.BooleanDtype) and col in FLAG_COLUMNS:
+            yes, no = FLAG_COLUMNS[col]
+            changed[col] = values.map({True: yes, False: no}).astype(object).fillna(FLAG_MISSING)
+        elif isinstance(values.dtype, pd.CategoricalDtype) and not isinstance(kind, list):
+            changed[col] = values.astype(object)
+        elif kind == 'float' and values.dtype == 'float32':
+            changed[col] = pd.Series(widen_float32(values), index=values.index)
+    return frame.assign(**changed) if changed else frame
+
+
+def stem(path):
+    return os.path.splitext(path)[0]
+
+
+def prepare_frame(frame, schema):
+    frame = apply_categories(frame.copy(), schema)
+    for col, kind in schema.items():
+        if kind == 'str' and col in frame.columns:
+            # flags and other mixed columns are stored as their text form, missing stays missing
+            frame[col] = frame[col].where(frame[col].isna(), frame[col].astype(str))
+    return frame
+
+
+def write_table(frame, path, schema=None):
+    """Write a DataFrame to <stem>.parquet using its registered schema."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = schema or schema_for(path)
+    frame = prepare_frame(stored_frame(frame, schema), schema)
+    table = pa.Table.from_pandas(frame, schema=arrow_schema(schema, frame.columns), preserve_index=False)
+    pq.write_table(table, stem(path) + '.parquet')
+
+
+def write_dataset(frame, path, fmt='csv'):
+    """Write a dataset as <stem>.csv or <stem>.parquet."""
+    if fmt == 'parquet':
+        write_table(frame, path)
+    else:
+        stored_frame(frame, schema_for(path)).to_csv(stem(path) + '.csv', index=False)
+
+
+class TableWriter:
+    """Appends DataFrame chunks to <stem>.csv or <stem>.parquet (one row group per chunk)."""
+
+    def __init__(self, path, fmt='csv', schema=None):
+        self.path = stem(path) + '.' + fmt
+        self.fmt = fmt
+        self.schema = schema
+        self.writer = None
+        self.first = True
+
+    def write(self, frame):
+        schema = self.schema or schema_for(self.path)
+        frame = stored_frame(frame, schema)
+        if self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            frame = prepare_frame(frame, schema)
+            table = pa.Table.from_pandas(frame, schema=arrow_schema(schema, frame.columns), preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='w' if self.first else 'a', header=self.first, index=False)
+        self.first = False
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stored_path(path):
+    """The file backing a dataset: <stem>.parquet unless only the CSV exists or the CSV is newer."""
+    if path.endswith('.sqlite'):
+        return path
+    parquet_path, csv_path = stem(path) + '.parquet', stem(path) + '.csv'
+    if not os.path.exists(parquet_path):
+        return csv_path
+    if os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(parquet_path):
+        return csv_path
+    return parquet_path
+
+
+def file_digest(path):
+    """SHA-256 of a file's content, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def csv_dtypes(schema):
+    # category labels like '0' and '1' must not be parsed as numbers
+    return {col: str for col, kind in schema.items() if isinstance(kind, list)}
+
+
+def read_table(path, columns=None, memory_map=False):
+    """
+    Read a dataset by path (with or without extension) from its stored_path.
+    columns projects the read; categorical schema columns come back as pandas Categoricals.
+    """
+    schema = schema_for(path)
+    source = stored_path(path)
+    if source.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        table = pq.read_table(source, columns=columns, memory_map=memory_map)
+        return apply_categories(table.to_pandas(), schema)
+    frame = pd.read_csv(source, usecols=columns, dtype=csv_dtypes(schema))
+    if columns is not None:
+        frame = frame[columns]
+    return apply_categories(frame, schema)
+
+
+def table_columns(path):
+    """Column names of a stored dataset, read from the file header only."""
+    source = stored_path(path)
+    if source.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(source).names)
+    return list(pd.read_csv(source, nrows=0).columns)
+
+
+def iter_table(path, chunksize, columns=None, schema=None):
+    """Yield a dataset in chunks of at most chunksize rows, in file order; schema defaults to the registered one."""
+    schema = schema or schema_for(path)
+    source = stored_path(path)
+    if source.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize, columns=columns):
+            yield apply_categories(batch.to_pandas(), schema)
+    else:
+        for chunk in pd.read_csv(source, usecols=columns, dtype=csv_dtypes(schema), chunksize=chunksize):
+            yield apply_categories(chunk if columns is None else chunk[columns], schema)
+
+
+def view_path():
+    """The modeling view readers use: $MODELING_VIEW (a view file or a feature_store.py SQLite store), else VIEW_PATH."""
+    return os.environ.get('MODELING_VIEW', VIEW_PATH)
+
+
+def view_read_columns(columns):
+    """Stored columns to read for a view projection: Risk_Profile is replaced by its inputs."""
+    if columns is None or 'Risk_Profile' not in columns:
+        return columns
+    read_columns = [c for c in columns if c != 'Risk_Profile']
+    return read_columns + [c for c in RISK_PROFILE_INPUTS if c not in read_columns]
+
+
+def finish_view(frame, columns=None, compact=True):
+    """Turn stored view columns into what read_view returns for a projection."""
+    schema = view_schema()
+    # files written before Risk_Profile was derived still carry it as text
+    frame = frame.drop(columns=[c for c in frame.columns if c not in schema])
+    if compact:
+        frame = compact_view(frame, schema)
+    if columns is None or 'Risk_Profile' in columns:
+        frame['Risk_Profile'] = scorecard.risk_profile(frame['Grade'], frame['PD_hat'])
+    return frame if columns is None else frame[columns]
+
+
+def read_view(columns=None, memory_map=False, path=None, compact=True):
+    """
+    Read the modeling view (path defaults to view_path()) like read_table, adding the derived
+    Risk_Profile column (when columns is None or lists it) and compacting dtypes with compact_view
+    unless compact=False.
+    """
+    path = path or view_path()
+    if path.endswith('.sqlite'):
+        from feature_store import FeatureStore
+        with FeatureStore(path) as store:
+            return store.read(columns, compact)
+    frame = read_table(path, columns=view_read_columns(columns), memory_map=memory_map)
+    return finish_view(frame, columns, compact)
+
+
+def convert(source_dir=SOURCE_DIR):
+    """Write a Parquet copy of every source sheet and modeling view CSV that exists."""
+    paths = [os.path.join(source_dir, sheet + '.csv') for sheet in SOURCE_SCHEMAS]
+    paths += [VIEW_PATH + '.csv', PREDICTIONS_PATH + '.csv']
+    for path in paths:
+        if os.path.exists(path):
+            write_table(pd.read_csv(path), path)
+            print(f'{path} -> {stem(path)}.parquet')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['convert'])
+    parser.add_argument('--source-dir', default=SOURCE_DIR)
+    args = parser.parse_args()
+    convert(args.source_dir)
@@ -0,0 +1,218 @@
+"""
+Chunked, out-of-core build of the modeling view.
+
+Loan_Application_Details.csv is read in fixed-size chunks. Each chunk is joined to the nine
+satellite sheets through an index keyed on Applicant_ID / Application_ID, feature-engineered,
+scored and appended to the output (CSV or Parquet, see storage.py), so peak memory follows the chunk size rather than the book.
+
+Median fill strategy (two passes):
+    Pass 1 streams every chunk through the joins and feature engineering, and feeds each numeric
+    column into a MedianSketch. The sketch keeps exact value counts, so the medians equal the ones
+    the in-memory build computes, as long as a column has at most `max_distinct` distinct values.
+    Beyond that it compacts into equal-count bins, each summarized by its weighted mean. The median
+    then becomes approximate, with a rank error of at most 2 * rows / max_distinct.
+    Pass 1 also records the dtype each column would have in a single-frame build.
+    Pass 2 repeats the chunk pipeline, casts each chunk to those dtypes, fills missing values with
+    the pass-1 medians, scores it and writes it out.
+
+Satellite indexes:
+    'memory' loads each satellite sheet once and indexes it with pandas (fast; satellites stay resident).
+    'sqlite' copies each satellite into an on-disk SQLite table with a unique key index, and fetches
+    only the rows a chunk needs, so neither the loan book nor the satellites are ever fully in memory.
+"""
+
+import os
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import build_modeling_view as bmv
+import instrumentation
+import storage
+
+
+class MedianSketch:
+    """Mergeable value-count sketch giving exact medians up to max_distinct distinct values."""
+
+    def __init__(self, max_distinct=200_000):
+        self.max_distinct = max_distinct
+        self.counts = pd.Series(dtype='float64')
+        self.exact = True
+
+    def add(self, values):
+        counts = pd.Series(values).value_counts(dropna=True)
+        counts.index = counts.index.astype('float64')
+        self.counts = counts if self.counts.empty else self.counts.add(counts, fill_value=0)
+        if len(self.counts) > self.max_distinct:
+            self._compact()
+
+    def _compact(self):
+        # Group consecutive values into equal-count bins represented by their weighted mean
+        counts = self.counts.sort_index()
+        n_bins = max(self.max_distinct // 2, 1)
+        group = np.minimum((counts.cumsum().to_numpy() - counts.to_numpy()) * n_bins // counts.sum(), n_bins - 1)
+        weighted = pd.Series(counts.index.to_numpy() * counts.to_numpy()).groupby(group).sum()
+        totals = counts.groupby(group).sum()
+        self.counts = pd.Series(totals.to_numpy(), index=(weighted / totals.to_numpy()).to_numpy())
+        self.exact = False
+
+    def median(self):
+        if self.counts.empty:
+            return np.nan
+        counts = self.counts.sort_index()
+        cum = counts.cumsum().to_numpy()
+        total = cum[-1]
+        values = counts.index.to_numpy()
+        lo = values[np.searchsorted(cum, (total - 1) // 2 + 1)]
+        hi = values[np.searchsorted(cum, total // 2 + 1)]
+        return (lo + hi) / 2
+
+
+def common_dtype(a, b):
+    """The dtype pandas gives a column when frames with dtypes a and b are concatenated."""
+    if a == b:
+        return a
+    numeric = pd.api.types.is_numeric_dtype
+    if numeric(a) and numeric(b) and not pd.api.types.is_bool_dtype(a) and not pd.api.types.is_bool_dtype(b):
+        return np.result_type(a, b)
+    return np.dtype(object)
+
+
+def unify_dtypes(dtypes, frame):
+    for col, dtype in frame.dtypes.items():
+        dtypes[col] = dtype if col not in dtypes else common_dtype(dtypes[col], dtype)
+    return dtypes
+
+
+def cast_chunk(chunk, dtypes):
+    for col, dtype in dtypes.items():
+        if chunk[col].dtype != dtype:
+            chunk[col] = chunk[col].astype(dtype)
+    return chunk
+
+
+class MemoryIndex:
+    """Satellite sheet held in memory and indexed by its join keys."""
+
+    def __init__(self, path, keys):
+        self.keys = keys
+        self.body, self.index = bmv.index_satellite(storage.read_table(path), keys, os.path.basename(path))
+
+    def lookup(self, chunk):
+        if len(self.keys) == 1:
+            wanted = chunk[self.keys[0]]
+        else:
+            wanted = pd.MultiIndex.from_frame(chunk[self.keys])
+        return bmv.gather(self.body, self.index.get_indexer(wanted))
+
+
+class SQLiteIndex:
+    """Satellite sheet copied into an on-disk SQLite table with a unique index on its join keys."""
+
+    def __init__(self, path, keys, conn, table, chunksize):
+        self.keys = keys
+        self.conn = conn
+        self.table = table
+        self.dtypes = {}
+        # SQLite stores booleans as 0/1, so remember which columns hold True/False to map them back
+        self.bool_cols = None
+        for part in storage.iter_table(path, chunksize):
+            unify_dtypes(self.dtypes, part)
+            bool_cols = {c for c in part.columns
+                         if part[c].dtype == bool or (part[c].dtype == object and part[c].dropna().map(type).eq(bool).all())}
+            self.bool_cols = bool_cols if self.bool_cols is None else self.bool_cols & bool_cols
+            part.to_sql(table, conn, if_exists='append', index=False)
+        self.columns = [c for c in self.dtypes if c not in keys]
+        key_list = ', '.join(f'"{k}"' for k in keys)
+        try:
+            conn.execute(f'CREATE UNIQUE INDEX "{table}_key" ON "{table}" ({key_list})')
+        except sqlite3.IntegrityError:
+            raise ValueError(f'{os.path.basename(path)} has duplicate {"/".join(keys)} values; '
+                             'a left join would duplicate loan rows') from None
+
+    def lookup(self, chunk):
+        keys = chunk[self.keys].reset_index(drop=True)
+        keys['_row'] = np.arange(len(keys))
+        keys.to_sql('_wanted', self.conn, if_exists='replace', index=False)
+        on = ' AND '.join(f'w."{k}" = s."{k}"' for k in self.keys)
+        cols = ', '.join(f's."{c}"' for c in self.columns)
+        found = pd.read_sql_query(f'SELECT w._row, {cols} FROM _wanted w JOIN "{self.table}" s ON {on}', self.conn)
+        found = found.set_index('_row').reindex(np.arange(len(keys)))
+        for col in self.columns:
+            dtype = self.dtypes[col]
+            if col in self.bool_cols:
+                found[col] = found[col].map({1: True, 0: False}).astype(object)
+            if found[col].isna().any():
+                # missing values (or rows without a match) keep the float/object dtype pandas gives NaN
+                continue
+            found[col] = found[col].astype(dtype)
+        return found.reset_index(drop=True)
+
+
+def open_indexes(base, index, chunksize, workdir):
+    indexes = {}
+    conn = None
+    if index == 'sqlite':
+        conn = sqlite3.connect(os.path.join(workdir, 'satellites.sqlite'))
+    for name, keys in bmv.joins:
+        path = os.path.join(base, bmv.files[name])
+        if index == 'sqlite':
+            indexes[name] = SQLiteIndex(path, keys, conn, name, chunksize)
+        else:
+            indexes[name] = MemoryIndex(path, keys)
+    return indexes, conn
+
+
+def join_chunk(loan, indexes):
+    parts = [loan.reset_index(drop=True)]
+    for name, _ in bmv.joins:
+        parts.append(indexes[name].lookup(loan))
+    return pd.concat(parts, axis=1)
+
+
+def engineered_chunks(base, indexes, chunksize):
+    """Yield joined, feature-engineered (but not yet filled) chunks of the loan book in file order."""
+    rng = np.random.RandomState(42)
+    loan_path = os.path.join(base, bmv.files['loan'])
+    for loan in storage.iter_table(loan_path, chunksize):
+        model = join_chunk(loan, indexes)
+        model = bmv.add_target_and_period(model, rng=rng)
+        yield bmv.engineer_features(model)
+
+
+def build_view_streaming(base=bmv.base, output_path=bmv.output_path, chunksize=100_000, index='memory',
+                         max_distinct=200_000, fmt='csv', calibration=None):
+    """Build the modeling view chunk by chunk; returns the fill medians and whether they are exact."""
+    with tempfile.TemporaryDirectory() as workdir:
+        with instrumentation.stage('index'):
+            indexes, conn = open_indexes(base, index, chunksize, workdir)
+        try:
+            # Pass 1: global dtypes and median sketches
+            dtypes = {}
+            sketches = {}
+            with instrumentation.stage('pass1') as st:
+                st.rows = 0
+                for model in engineered_chunks(base, indexes, chunksize):
+                    unify_dtypes(dtypes, model)
+                    for col in model.select_dtypes(include='number').columns:
+                        sketches.setdefault(col, MedianSketch(max_distinct)).add(model[col])
+                    st.rows += len(model)
+            numeric = [c for c, d in dtypes.items()
+                       if pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d)]
+            medians = {c: sketches[c].median() if c in sketches else np.nan for c in numeric}
+            exact = all(sketches[c].exact for c in numeric if c in sketches)
+
+            # Pass 2: fill, score and append
+            with instrumentation.stage('pass2') as st, storage.TableWriter(output_path, fmt) as writer:
+                st.rows = 0
+                for model in engineered_chunks(base, indexes, chunksize):
+                    model = cast_chunk(model, dtypes)
+                    model = bmv.fill_missing(model, medians)
+                    writer.write(bmv.apply_scorecard(model, calibration))
+                    st.rows += len(model)
+        finally:
+            if conn is not None:
+                conn.close()
+    return medians, exact
@@ -0,0 +1,40 @@
+"""
+Parity of compiled_model.py's NumPy predictor with clf.predict_proba, for a small forest and a small
+gradient boosting model trained on random data with missing values.
+
+Usage:
+    python -m pytest test_compiled_model.py
+"""
+
+import numpy as np
+import pytest
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+
+import compiled_model
+
+FEATURES = ['f0', 'f1', 'f2', 'f3', 'f4']
+
+
+def training_data(rows=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, len(FEATURES)))
+    y = (X[:, 0] + 0.5 * X[:, 1] * X[:, 2] + rng.normal(scale=0.5, size=rows) > 0).astype(int)
+    # missing values exercise the missing-goes-left flags
+    X[rng.random(X.shape) < 0.05] = np.nan
+    return X, y
+
+
+@pytest.mark.parametrize('clf', [
+    RandomForestClassifier(n_estimators=20, max_depth=8, random_state=0),
+    HistGradientBoostingClassifier(max_iter=30, max_leaf_nodes=15, random_state=0),
+], ids=['forest', 'boosting'])
+def test_predict_proba_matches_sklearn(clf, tmp_path):
+    X, y = training_data()
+    clf.fit(X, y)
+    path = str(tmp_path / 'model.npz')
+    compiled_model.export(clf, {}, FEATURES, path)
+    compiled = compiled_model.CompiledModel.load(path)
+
+    X_new, _ = training_data(rows=5000, seed=1)
+    diff = np.abs(compiled.predict_proba(X_new) - clf.predict_proba(X_new)).max()
+    assert diff <= 1e-12
@@ -1,41 +1,67 @@
-import pandas as pd
+import argparse
+
+import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import roc_auc_score, classification_report, confusion_matrix
 import joblib
 
-# Load data
-model = pd.read_csv('modeling_view_with_risk.csv')
+import feature_cache
+import instrumentation
+import storage
 
 # Select features (exclude leakage and ID columns)
 features = [
     'DTI','LTV','Points_DTI','Points_Utilization','Points_LatePay','Points_Inquiry',
     'Points_IncomeStability','Points_LTV','Points_Tenure','Total_Points','Total_Score'
 ]
-X = model[features]
-y = model['Default_12m']
 
-# Train/validation split
-X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.3, random_state=42)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the credit risk model on the modeling view.')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='record per-stage time and memory to REPORT (.json or .csv, see instrumentation.py)')
+    args = parser.parse_args()
+    instrumentation.enable(args.profile)
+
+    # Load data: the features and label come memory-mapped from the feature cache (feature_cache.py),
+    # which reads the modeling view only when its content or the feature list changed
+    with instrumentation.stage('load') as st:
+        matrix = feature_cache.load(columns=features)
+        st.rows = len(matrix)
+    X = matrix.frame()
+    y = matrix.labels()
+
+    # Train/validation split: the same rows as splitting X itself, without copying X twice
+    with instrumentation.stage('split'):
+        train_rows, val_rows = train_test_split(np.arange(len(X)), test_size=0.3, random_state=42)
+        X_train, X_val, y_train, y_val = X.iloc[train_rows], X.iloc[val_rows], y[train_rows], y[val_rows]
 
-# Train model
-clf = RandomForestClassifier(n_estimators=100, random_state=42)
-clf.fit(X_train, y_train)
+    # Train model
+    with instrumentation.stage('fit', rows=len(X_train)):
+        clf = RandomForestClassifier(n_estimators=100, random_state=42)
+        clf.fit(X_train, y_train)
 
-# Validation predictions
-y_pred = clf.predict(X_val)
-y_prob = clf.predict_proba(X_val)[:,1]
+    # Validation predictions
+    with instrumentation.stage('predict_validation', rows=len(X_val)):
+        y_pred = clf.predict(X_val)
+        y_prob = clf.predict_proba(X_val)[:,1]
 
-# Metrics
-auc = roc_auc_score(y_val, y_prob)
-print(f"Validation ROC AUC: {auc:.3f}")
-print("Classification Report:\n", classification_report(y_val, y_pred))
-print("Confusion Matrix:\n", confusion_matrix(y_val, y_pred))
+    # Metrics
+    auc = roc_auc_score(y_val, y_prob)
+    print(f"Validation ROC AUC: {auc:.3f}")
+    print("Classification Report:\n", classification_report(y_val, y_pred))
+    print("Confusion Matrix:\n", confusion_matrix(y_val, y_pred))
 
-# Save model
-joblib.dump(clf, 'credit_risk_model.pkl')
+    # Save model
+    with instrumentation.stage('dump'):
+        joblib.dump(clf, 'credit_risk_model.pkl')
 
-# Save predictions for dashboard
-model['Model_Pred_Prob'] = clf.predict_proba(X)[:,1]
-model.to_csv('modeling_view_with_predictions.csv', index=False)
-print('Model trained and predictions saved to modeling_view_with_predictions.csv')
+    # Save predictions for dashboard, keyed by application; written in the same format as the view
+    predictions = matrix.keys()
+    predictions['Default_12m'] = y
+    with instrumentation.stage('predict_all', rows=len(X)):
+        predictions['Model_Pred_Prob'] = clf.predict_proba(X)[:,1]
+    fmt = 'parquet' if storage.stored_path(storage.VIEW_PATH).endswith('.parquet') else 'csv'
+    with instrumentation.stage('write_predictions', rows=len(predictions)):
+        storage.write_dataset(predictions, storage.PREDICTIONS_PATH, fmt)
+    print(f'Model trained and predictions saved to {storage.PREDICTIONS_PATH}.{fmt}')
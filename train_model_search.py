@@ -0,0 +1,171 @@
+"""
+Tuned training on the time-based Period split, comparing estimators side by side.
+
+The modeling view's Period column (build_modeling_view.py) splits the book by application date:
+    Train        hyperparameter search: randomized search with stratified K-fold CV, candidates
+                 fitted in parallel across --jobs cores, scored by ROC AUC; the CV AUC also picks the
+                 estimator --save writes
+    Validation   reported only, never used for fitting, early stopping or selection
+    OOT          out-of-time check only, never used for fitting or selection
+
+Estimators:
+    hgb          HistGradientBoostingClassifier; early stopping on an internal holdout during the search,
+                 and on a stratified 10% holdout of Train when refit (fitted on the other 90%)
+    rf           RandomForestClassifier using all cores for the refit
+    baseline     train_credit_risk_model.py's RandomForestClassifier(n_estimators=100), untuned,
+                 single-threaded, for reference; its CV AUC is taken on the same folds as the search
+
+For each estimator the search time, refit time, predict throughput and Validation/OOT AUC are printed
+side by side. --save PATH writes the estimator with the best CV AUC, for use with
+score_credit_risk_model.py --model PATH.
+
+Usage:
+    python train_model_search.py [--estimators hgb rf baseline] [--n-iter 8] [--cv 3] [--jobs -1]
+                                 [--save credit_risk_model.pkl] [--profile REPORT]
+"""
+
+import argparse
+import time
+
+import joblib
+import numpy as np
+from scipy.stats import loguniform, randint
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import RandomizedSearchCV, StratifiedKFold, cross_val_score, train_test_split
+
+import instrumentation
+import storage
+from train_credit_risk_model import features
+
+SEARCH_SPACES = {
+    'hgb': (
+        lambda: HistGradientBoostingClassifier(max_iter=500, early_stopping=True, validation_fraction=0.1,
+                                               n_iter_no_change=20, scoring='loss', random_state=42),
+        {
+            'learning_rate': loguniform(0.02, 0.3),
+            'max_leaf_nodes': randint(8, 64),
+            'min_samples_leaf': randint(20, 200),
+            'l2_regularization': loguniform(1e-4, 10),
+        },
+    ),
+    'rf': (
+        # one thread per forest while the search runs candidates in parallel; the refit uses all cores
+        lambda: RandomForestClassifier(n_estimators=200, n_jobs=1, random_state=42),
+        {
+            'max_depth': [None, 8, 12, 16],
+            'min_samples_leaf': randint(1, 50),
+            'max_features': ['sqrt', 0.5, 1.0],
+        },
+    ),
+}
+
+
+def period_splits(model):
+    periods = model['Period'].astype(str)
+    return {name: model[periods == name] for name in ['Train', 'Validation', 'OOT']}
+
+
+def auc(y, prob):
+    # AUC is undefined when a period has only one class
+    return roc_auc_score(y, prob) if y.nunique() == 2 else float('nan')
+
+
+def search(name, train, n_iter, cv, jobs, seed):
+    """Randomized CV search on the Train period; returns (best params, best CV AUC, search seconds)."""
+    make, space = SEARCH_SPACES[name]
+    folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed)
+    searcher = RandomizedSearchCV(make(), space, n_iter=n_iter, scoring='roc_auc', cv=folds, n_jobs=jobs,
+                                  random_state=seed, refit=False)
+    start = time.perf_counter()
+    searcher.fit(train[features], train['Default_12m'])
+    return searcher.best_params_, searcher.best_score_, time.perf_counter() - start
+
+
+def baseline_cv(train, cv, jobs, seed):
+    """CV AUC of the untuned baseline on the search's folds; returns (CV AUC, seconds)."""
+    folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed)
+    start = time.perf_counter()
+    scores = cross_val_score(RandomForestClassifier(n_estimators=100, random_state=42), train[features],
+                             train['Default_12m'], scoring='roc_auc', cv=folds, n_jobs=jobs)
+    return float(np.mean(scores)), time.perf_counter() - start
+
+
+def refit(name, params, train, jobs, seed):
+    """Fit the chosen configuration on the whole Train period."""
+    if name == 'baseline':
+        clf = RandomForestClassifier(n_estimators=100, random_state=42)
+        clf.fit(train[features], train['Default_12m'])
+        return clf
+    clf = SEARCH_SPACES[name][0]().set_params(**params)
+    if name == 'rf':
+        clf.set_params(n_jobs=jobs)
+        clf.fit(train[features], train['Default_12m'])
+    else:
+        # early stopping monitors a holdout carved from Train, so the Validation period stays unseen
+        fit, holdout = train_test_split(train, test_size=0.1, stratify=train['Default_12m'], random_state=seed)
+        clf.fit(fit[features], fit['Default_12m'], X_val=holdout[features], y_val=holdout['Default_12m'])
+    return clf
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--estimators', nargs='+', choices=['hgb', 'rf', 'baseline'], default=['hgb', 'rf', 'baseline'])
+    parser.add_argument('--n-iter', type=int, default=8, help='search candidates per estimator')
+    parser.add_argument('--cv', type=int, default=3, help='cross-validation folds within the Train period')
+    parser.add_argument('--jobs', type=int, default=-1, help='parallel search workers (-1 = all cores)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', metavar='PATH', help='write the estimator with the best CV AUC here')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='record per-stage time and memory to REPORT (.json or .csv, see instrumentation.py)')
+    args = parser.parse_args()
+    instrumentation.enable(args.profile)
+
+    with instrumentation.stage('load') as st:
+        model = storage.read_view(columns=features + ['Default_12m', 'Period'])
+        st.rows = len(model)
+    splits = period_splits(model)
+    train, validation, oot = splits['Train'], splits['Validation'], splits['OOT']
+    print(f'Train {len(train):,} | Validation {len(validation):,} | OOT {len(oot):,} rows')
+
+    results = {}
+    for name in args.estimators:
+        params, cv_auc, search_secs = {}, float('nan'), 0.0
+        with instrumentation.stage(f'search:{name}', rows=len(train)):
+            if name == 'baseline':
+                cv_auc, search_secs = baseline_cv(train, args.cv, args.jobs, args.seed)
+            else:
+                params, cv_auc, search_secs = search(name, train, args.n_iter, args.cv, args.jobs, args.seed)
+        with instrumentation.stage(f'refit:{name}', rows=len(train)):
+            start = time.perf_counter()
+            clf = refit(name, params, train, args.jobs, args.seed)
+            fit_secs = time.perf_counter() - start
+        with instrumentation.stage(f'predict:{name}', rows=len(model)):
+            start = time.perf_counter()
+            prob = clf.predict_proba(model[features])[:, 1]
+            predict_secs = time.perf_counter() - start
+        prob = {period: prob[(model['Period'].astype(str) == period).to_numpy()] for period in splits}
+        results[name] = {
+            'clf': clf, 'params': params, 'cv_auc': cv_auc, 'search_s': search_secs, 'fit_s': fit_secs,
+            'rows_per_s': len(model) / predict_secs if predict_secs else float('inf'),
+            'val_auc': auc(validation['Default_12m'], prob['Validation']),
+            'oot_auc': auc(oot['Default_12m'], prob['OOT']),
+        }
+        if name == 'hgb':
+            params['iterations'] = clf.n_iter_
+
+    print(f"\n{'estimator':<10}{'CV AUC':>8}{'search s':>10}{'fit s':>8}{'predict rows/s':>16}{'Val AUC':>9}{'OOT AUC':>9}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['cv_auc']:>8.3f}{r['search_s']:>10.1f}{r['fit_s']:>8.2f}"
+              f"{r['rows_per_s']:>16,.0f}{r['val_auc']:>9.3f}{r['oot_auc']:>9.3f}")
+    for name, r in results.items():
+        if r['params']:
+            print(f"{name} params: " + ', '.join(f'{k}={v:.4g}' if isinstance(v, float) else f'{k}={v}'
+                                                 for k, v in r['params'].items()))
+
+    if args.save:
+        best = max(results, key=lambda n: -np.inf if np.isnan(results[n]['cv_auc']) else results[n]['cv_auc'])
+        with instrumentation.stage('dump'):
+            joblib.dump(results[best]['clf'], args.save)
+        print(f'Saved {best} (CV AUC {results[best]["cv_auc"]:.3f}, Validation AUC {results[best]["val_auc"]:.3f}) '
+              f'to {args.save}')
@@ -0,0 +1,345 @@
+"""
+What-if sensitivity of the scorecard and the model to changes in applicants' inputs.
+
+A scenario changes one or more scorecard inputs of every applicant in a cohort:
+    DTI, LTV                                   clipped to 0-1.5 and 0-1.2, as engineer_features clips them
+    Credit_Utilization_Ratio, Number_of_Late_Payments, Credit_Inquiries_Last_12_Months,
+    Years_in_Current_Job, Tenure_Months        floored at 0
+by 'scale' (multiply), 'shift' (add) or 'set' (replace). A grid is the cartesian product of a value
+list per input, e.g. DTI scaled by 0.8-1.2 and late payments shifted by 0-3. For each applicant and
+scenario the changed inputs are re-bucketed and re-pointed through the compiled scorecard tables
+(compiled_model.scorecard_tables), and Total_Points, Total_Score, PD_hat, Grade and, with a compiled
+model artifact, Model_Pred_Prob are recomputed. Inputs a scenario leaves unchanged keep the view's
+points, so the identity scenario reproduces the view exactly.
+
+PD_hat follows the calibration the view was built with: --calibration pd_calibration.json, else the
+artifact's meta['calibration'] (compiled_model.py export --calibration), else the PD_CALIBRATION
+ladder. A cohort whose PD_hat does not match that calibration at its current points is refused.
+
+Everything runs as array operations over (applicants x scenarios) blocks:
+    points        each input's points are computed once per distinct value of that input
+                  (applicants x values), then gathered per scenario and summed
+    calibration   PD_hat and Grade come from a lookup table indexed by Total_Points
+    model         rows are reduced to the threshold interval of each feature across all trees; rows
+                  with the same intervals take the same path through every tree, so each distinct
+                  interval row is traversed once and the result is gathered back
+Cohort sweeps are reduced to per-scenario sums block by block (constant memory) and the blocks are
+spread over --workers processes.
+
+Usage:
+    python whatif.py --ids 1001 --vary DTI scale 0.5:1.5:11 --vary Number_of_Late_Payments shift 0,1,2,3
+    python whatif.py --grade Prime Near-prime --vary Credit_Utilization_Ratio scale 0.5:2:16 [--workers N]
+                     [--artifact credit_risk_model.npz | --no-model] [--calibration pd_calibration.json]
+                     [--output sweep.csv]
+"""
+
+import argparse
+import copy
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import compiled_model
+import storage
+
+OPS = ['scale', 'shift', 'set']
+# the natural change for each input: ratios are scaled, counts and durations shifted
+DEFAULT_OPS = {
+    'DTI': 'scale', 'LTV': 'scale', 'Credit_Utilization_Ratio': 'scale', 'Number_of_Late_Payments': 'shift',
+    'Credit_Inquiries_Last_12_Months': 'shift', 'Years_in_Current_Job': 'shift', 'Tenure_Months': 'shift',
+}
+LIMITS = {'DTI': (0, 1.5), 'LTV': (0, 1.2)}
+# applicants x scenarios evaluated per block
+BLOCK_ROWS = 1_000_000
+
+_engine = None
+_grid = None
+
+
+class ScenarioGrid:
+    """The cartesian product of per-input value lists; scenario j applies levels[v][codes[j, v]] to input v."""
+
+    def __init__(self, perturbations):
+        self.inputs = list(perturbations)
+        self.ops = {}
+        self.levels = []
+        for name, (op, values) in perturbations.items():
+            if op not in OPS:
+                raise ValueError(f'{name}: unknown operation {op!r}, expected one of {OPS}')
+            self.ops[name] = op
+            self.levels.append(np.asarray(values, dtype='float64'))
+        self.codes = np.array(list(itertools.product(*[range(len(levels)) for levels in self.levels])),
+                              dtype=np.intp).reshape(-1, len(self.inputs))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def frame(self):
+        """One row per scenario: its number and the value applied to each input."""
+        frame = pd.DataFrame({f'{name} ({self.ops[name]})': levels[self.codes[:, v]]
+                              for v, (name, levels) in enumerate(zip(self.inputs, self.levels))})
+        frame.insert(0, 'scenario', np.arange(len(self)))
+        return frame
+
+
+def parse_values(text):
+    """'0.8,1,1.2' or 'start:stop:num' (evenly spaced, both ends included)."""
+    if text.count(':') == 2:
+        start, stop, num = text.split(':')
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(v) for v in text.split(',')])
+
+
+def interval_thresholds(model):
+    """Sorted distinct split thresholds of each model feature across all trees."""
+    feature, threshold = np.asarray(model.feature), np.asarray(model.threshold)
+    split = ~np.asarray(model.is_leaf)
+    return [np.unique(threshold[split & (feature == f)]) for f in range(len(model.features))]
+
+
+class WhatIf:
+    """Scenario evaluation for a cohort: the view's inputs and points per applicant, plus an optional compiled model."""
+
+    def __init__(self, base=None, artifact=None, calibration=None):
+        self.artifact = artifact
+        self.tables = {t['input']: t for t in compiled_model.scorecard_tables()}
+        # sweeps gather from the node arrays millions of times, so they are read into memory rather than mapped
+        self.model = compiled_model.CompiledModel.load(artifact, mmap=False) if artifact else None
+        self.thresholds = interval_thresholds(self.model) if self.model is not None else None
+        # a calibration table (compiled_model.calibration), else the artifact's, else the ladder
+        cal = calibration or (self.model.meta['calibration'] if self.model is not None else compiled_model.calibration())
+        self.calibration = cal
+        self.base_score = cal['base_score']
+        self.pd_levels = np.asarray(cal['pd'])
+        self.grade_levels = np.asarray(cal['grade'], dtype=object)
+        # calibration bin of every reachable Total_Points
+        reachable = np.arange(sum(max(t['points']) for t in self.tables.values()) + 1, dtype='float64')
+        self.total_level = compiled_model.bin_index(reachable, {**cal, 'exact': [], 'nan_bin': len(cal['edges'])})
+        if base is not None:
+            self.set_cohort(base)
+
+    def use(self, base):
+        """An engine for another cohort that shares this one's tables and model (safe to call from concurrent sessions)."""
+        engine = copy.copy(self)
+        engine.set_cohort(base)
+        return engine
+
+    def set_cohort(self, base):
+        """
+        The applicants scenarios are evaluated for: a frame of the view's keys, inputs and points. With a
+        PD_hat column, raises ValueError when the view was not scored with this engine's calibration.
+        """
+        if 'PD_hat' in base:
+            total = sum(base[t['points_column']].to_numpy(dtype='int64') for t in self.tables.values())
+            expected = self.pd_levels[self.total_level[total]]
+            if not np.allclose(base['PD_hat'].to_numpy(dtype='float64'), expected, rtol=0, atol=1e-6):
+                raise ValueError(f"the view's PD_hat was not scored with the {self.calibration.get('method', 'ladder')} "
+                                 'calibration; pass the calibration the view was built with (--calibration), or '
+                                 'export the artifact with compiled_model.py export --calibration')
+        self.base = base
+        self.keys = base[storage.KEY_COLUMNS].reset_index(drop=True)
+        self.inputs = {name: base[name].to_numpy(dtype='float64') for name in self.tables}
+        self.points = {t['points_column']: base[t['points_column']].to_numpy(dtype='int32')
+                       for t in self.tables.values()}
+
+    @classmethod
+    def from_view(cls, ids=None, grades=None, periods=None, limit=None, path=None, artifact=None, calibration=None):
+        """The cohort of applicants with the given IDs, or matching the filters, from the modeling view."""
+        tables = compiled_model.scorecard_tables()
+        columns = storage.KEY_COLUMNS + [t['input'] for t in tables] + [t['points_column'] for t in tables] \
+            + ['PD_hat', 'Grade']
+        frame = storage.read_view(columns=columns + (['Period'] if periods else []), path=path)
+        mask = np.ones(len(frame), dtype=bool)
+        if ids is not None:
+            mask &= frame['Applicant_ID'].isin(ids).to_numpy()
+        if grades:
+            mask &= frame['Grade'].astype(str).isin(grades).to_numpy()
+        if periods:
+            mask &= frame['Period'].astype(str).isin(periods).to_numpy()
+        frame = frame[mask]
+        if limit:
+            frame = frame.iloc[:limit]
+        return cls(frame, artifact, calibration)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def scenario_points(self, grid, rows):
+        """Points of the inputs the grid changes, as {points column: (applicants, scenarios)}, and the changed values."""
+        points, values = {}, {}
+        for v, name in enumerate(grid.inputs):
+            table, base = self.tables[name], self.inputs[name][rows, None]
+            levels = grid.levels[v][None, :]
+            op = grid.ops[name]
+            changed = base * levels if op == 'scale' else base + levels if op == 'shift' \
+                else np.broadcast_to(levels, (len(base), levels.shape[1]))
+            low, high = LIMITS.get(name, (0, None))
+            changed = np.clip(changed, low, high)
+            # (applicants, levels): points for each distinct value of this input, the view's own where unchanged
+            table_points = np.asarray(table['points'], dtype='int32')[compiled_model.bin_index(changed.ravel(), table)]
+            per_level = np.where(changed == base, self.points[table['points_column']][rows, None],
+                                 table_points.reshape(changed.shape))
+            points[table['points_column']] = per_level[:, grid.codes[:, v]]
+            values[name] = changed[:, grid.codes[:, v]]
+        return points, values
+
+    def evaluate(self, grid, rows=slice(None)):
+        """
+        Outputs of every (applicant, scenario) for applicants `rows`, as (applicants, scenarios) arrays:
+        the changed inputs and their points, Total_Points, the calibration level (index into pd_levels and
+        grade_levels) and Model_Pred_Prob. Points of unchanged inputs are the view's (self.points).
+        """
+        points, values = self.scenario_points(grid, rows)
+        unchanged = sum(base[rows] for col, base in self.points.items() if col not in points)
+        total = sum(points.values(), np.asarray(unchanged, dtype='int32')[:, None])
+        out = {**points, **values, 'Total_Points': total, 'level': self.total_level[total]}
+        if self.model is not None:
+            shape = total.shape
+            columns = {**{col: base[rows, None] for col, base in self.points.items()},
+                       **{name: self.inputs[name][rows, None] for name in ['DTI', 'LTV']},
+                       **out, 'Total_Score': self.base_score - total}
+            X = np.column_stack([np.broadcast_to(columns[f], shape).ravel() for f in self.model.features])
+            out['Model_Pred_Prob'] = self.predict_distinct(X).reshape(shape)
+        return out
+
+    def predict_distinct(self, X):
+        """predict_proba[:, 1] of X, traversing each distinct row of threshold intervals once."""
+        X = X.astype(self.model.meta['input_dtype'])
+        codes = np.column_stack([np.where(np.isnan(X[:, f]), len(t) + 1, np.searchsorted(t, X[:, f], side='left'))
+                                 for f, t in enumerate(self.thresholds)])
+        radix = [len(t) + 2 for t in self.thresholds]
+        if np.prod(np.asarray(radix, dtype='float64')) < 2 ** 63:
+            key = np.zeros(len(X), dtype='int64')
+            for f, r in enumerate(radix):
+                key = key * r + codes[:, f]
+            _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+        else:
+            _, first, inverse = np.unique(codes, axis=0, return_index=True, return_inverse=True)
+        return self.model.predict_proba(X[first])[:, 1][inverse.ravel()]
+
+    def run(self, grid):
+        """One row per (applicant, scenario): keys, scenario, changed inputs and buckets, points, score, PD_hat, Grade, model probability."""
+        out = self.evaluate(grid)
+        n, s = len(self), len(grid)
+        frame = pd.DataFrame({col: np.repeat(self.keys[col].to_numpy(), s) for col in storage.KEY_COLUMNS})
+        frame['scenario'] = np.tile(np.arange(s), n)
+        for name in grid.inputs:
+            frame[name] = out[name].ravel()
+            table = self.tables[name]
+            if table['bucket'] is not None:
+                labels = np.asarray(table['labels'], dtype=object)
+                frame[table['bucket']] = labels[compiled_model.bin_index(out[name].ravel(), table)]
+        for col, base in self.points.items():
+            frame[col] = out[col].ravel() if col in out else np.repeat(base, s)
+        level = out['level'].ravel()
+        frame['Total_Points'] = out['Total_Points'].ravel()
+        frame['Total_Score'] = self.base_score - frame['Total_Points']
+        frame['PD_hat'] = self.pd_levels[level]
+        frame['Grade'] = self.grade_levels[level]
+        if 'Model_Pred_Prob' in out:
+            frame['Model_Pred_Prob'] = out['Model_Pred_Prob'].ravel()
+        return frame
+
+    def summary_sums(self, grid, rows):
+        """Mergeable per-scenario sums over applicants `rows`."""
+        out = self.evaluate(grid, rows)
+        level, s, levels = out['level'], len(grid), len(self.pd_levels)
+        base_level = self.total_level[sum(base[rows] for base in self.points.values())]
+        # applicants per (scenario, calibration level); PD_hat sums follow from them
+        counts = np.bincount((np.arange(s) * levels + level).ravel(), minlength=s * levels).reshape(s, levels)
+        sums = {
+            'level_counts': counts,
+            'points_sum': out['Total_Points'].sum(axis=0, dtype='int64'),
+            'grade_changed': (level != base_level[:, None]).sum(axis=0),
+        }
+        if 'Model_Pred_Prob' in out:
+            sums['prob_sum'] = out['Model_Pred_Prob'].sum(axis=0)
+        return sums
+
+    def blocks(self, grid):
+        step = max(1, BLOCK_ROWS // max(len(grid), 1))
+        return [slice(start, min(start + step, len(self))) for start in range(0, len(self), step)]
+
+    def summarize(self, grid, workers=0):
+        """One row per scenario: cohort mean PD_hat, Total_Score and model probability, grade shares, share of grades changed."""
+        blocks = self.blocks(grid)
+        if workers == 0 or len(blocks) == 1:
+            parts = [self.summary_sums(grid, rows) for rows in blocks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(self.base, self.artifact, self.calibration, grid)) as pool:
+                parts = list(pool.map(summarize_block, blocks))
+        total = {key: sum(part[key] for part in parts) for key in parts[0]}
+        counts = total['level_counts']
+        n = np.maximum(counts.sum(axis=1), 1)
+        frame = grid.frame()
+        frame['applicants'] = counts.sum(axis=1)
+        frame['mean_PD_hat'] = counts @ self.pd_levels / n
+        frame['mean_Total_Score'] = self.base_score - total['points_sum'] / n
+        if 'prob_sum' in total:
+            frame['mean_Model_Pred_Prob'] = total['prob_sum'] / n
+        # calibration levels that share a grade are reported together
+        for grade in dict.fromkeys(self.grade_levels):
+            frame[f'share_{grade}'] = counts[:, self.grade_levels == grade].sum(axis=1) / n
+        frame['share_grade_changed'] = total['grade_changed'] / n
+        return frame
+
+
+def init_worker(base, artifact, calibration, grid):
+    # each worker memory-maps the artifact itself rather than receiving the model's arrays
+    global _engine, _grid
+    _engine, _grid = WhatIf(base, artifact, calibration), grid
+
+
+def summarize_block(rows):
+    return _engine.summary_sums(_grid, rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vary', nargs=3, action='append', required=True, metavar=('INPUT', 'OP', 'VALUES'),
+                        help='input to change, scale|shift|set, and values as a,b,c or start:stop:num')
+    parser.add_argument('--ids', type=int, nargs='+', help='Applicant_IDs (default: every applicant matching the filters)')
+    parser.add_argument('--grade', nargs='+', help='only applicants in these grades')
+    parser.add_argument('--period', nargs='+', help='only applicants in these periods (Train, Validation, OOT)')
+    parser.add_argument('--limit', type=int, help='at most this many applications')
+    parser.add_argument('--view', help='modeling view to read (default: storage.view_path())')
+    parser.add_argument('--artifact', default=compiled_model.artifact_path,
+                        help='compiled model for Model_Pred_Prob (see compiled_model.py export)')
+    parser.add_argument('--no-model', action='store_true', help='scorecard outputs only')
+    parser.add_argument('--calibration', metavar='PATH',
+                        help='fitted Total_Points calibration the view was built with (default: the artifact\'s)')
+    parser.add_argument('--workers', type=int, default=0, help='processes for cohort summaries (0: this process)')
+    parser.add_argument('--output', help='write every (applicant, scenario) row to this CSV instead of summarizing')
+    args = parser.parse_args()
+
+    grid = ScenarioGrid({name: (op, parse_values(values)) for name, op, values in args.vary})
+    artifact = None if args.no_model or not os.path.exists(args.artifact) else args.artifact
+    calibration = None
+    if args.calibration:
+        from pd_calibration import PDCalibration
+        try:
+            calibration = compiled_model.calibration(PDCalibration.load(args.calibration))
+        except compiled_model.ArtifactError as e:
+            parser.error(str(e))
+    try:
+        engine = WhatIf.from_view(args.ids, args.grade, args.period, args.limit, args.view, artifact, calibration)
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.perf_counter()
+    if args.output:
+        frame = engine.run(grid)
+        frame.to_csv(args.output, index=False)
+        result = f'{len(frame):,} rows -> {args.output}'
+    else:
+        summary = engine.summarize(grid, args.workers)
+        print(summary.to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+        result = 'summarized'
+    secs = time.perf_counter() - start
+    print(f'{len(engine):,} applications x {len(grid):,} scenarios in {secs:.2f}s '
+          f'({len(engine) * len(grid) / secs:,.0f} evaluations/s'
+          f'{", with model" if artifact else ", scorecard only"}): {result}')